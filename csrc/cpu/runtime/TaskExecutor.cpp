@@ -1,8 +1,30 @@
 #include "TaskExecutor.h"
 
+#include <algorithm>
+
 namespace torch_ipex {
 namespace runtime {
 
+namespace {
+
+int64_t to_ns(TaskClock::duration duration) {
+  return std::chrono::duration_cast<std::chrono::nanoseconds>(duration)
+      .count();
+}
+
+int get_histogram_bucket(int64_t duration_ns) {
+  int64_t duration_us = duration_ns / 1000;
+  int bucket = 0;
+  while (duration_us > 0 &&
+         bucket < TaskExecutorTelemetry::kNumHistogramBuckets - 1) {
+    duration_us >>= 1;
+    bucket++;
+  }
+  return bucket;
+}
+
+} // namespace
+
 TaskExecutor::TaskExecutor(const torch_ipex::runtime::CPUPool& cpu_pool) {
   // Notice: We shouldn't load iomp symbol in sub_thread, otherwise race
   // condition happens.
@@ -17,6 +39,8 @@ TaskExecutor::TaskExecutor(const torch_ipex::runtime::CPUPool& cpu_pool) {
     _pin_cpu_cores(cpu_pool);
     while (true) {
       std::function<void()> task;
+      TaskClock::time_point submit_time;
+      TaskClock::time_point idle_start_time = TaskClock::now();
       {
         std::unique_lock<std::mutex> lock(this->worker_mutex);
         this->worker_condition.wait(
@@ -25,10 +49,26 @@ TaskExecutor::TaskExecutor(const torch_ipex::runtime::CPUPool& cpu_pool) {
         if (this->stop && this->tasks.empty())
           return;
 
-        task = std::move(this->tasks.front());
+        task = std::move(this->tasks.front().function);
+        submit_time = this->tasks.front().submit_time;
         this->tasks.pop();
       }
-      task();
+      if (this->telemetry_enabled.load(std::memory_order_relaxed)) {
+        TaskClock::time_point exec_start_time = TaskClock::now();
+        task();
+        TaskClock::time_point exec_end_time = TaskClock::now();
+        // The idle time before telemetry is enabled or reset is not counted.
+        int64_t idle_start_ns = std::max(
+            to_ns(idle_start_time.time_since_epoch()),
+            this->telemetry_start_ns.load(std::memory_order_relaxed));
+        this->record_telemetry(
+            to_ns(exec_start_time - submit_time),
+            to_ns(exec_end_time - exec_start_time),
+            std::max<int64_t>(
+                to_ns(exec_start_time.time_since_epoch()) - idle_start_ns, 0));
+      } else {
+        task();
+      }
     }
   });
 }
@@ -45,10 +85,49 @@ bool TaskExecutor::is_stop() {
   return this->stop;
 }
 
-std::queue<std::function<void()>>& TaskExecutor::get_tasks() {
+std::queue<TaskItem>& TaskExecutor::get_tasks() {
   return this->tasks;
 }
 
+void TaskExecutor::set_telemetry_enabled(bool enabled) {
+  if (enabled) {
+    this->telemetry_start_ns.store(to_ns(TaskClock::now().time_since_epoch()));
+  }
+  this->telemetry_enabled.store(enabled);
+}
+
+bool TaskExecutor::is_telemetry_enabled() {
+  return this->telemetry_enabled.load();
+}
+
+TaskExecutorTelemetry TaskExecutor::get_telemetry() {
+  std::lock_guard<std::mutex> lock(this->telemetry_mutex);
+  return this->telemetry;
+}
+
+void TaskExecutor::reset_telemetry() {
+  std::lock_guard<std::mutex> lock(this->telemetry_mutex);
+  this->telemetry_start_ns.store(to_ns(TaskClock::now().time_since_epoch()));
+  this->telemetry = TaskExecutorTelemetry();
+}
+
+void TaskExecutor::record_telemetry(
+    int64_t queue_wait_ns,
+    int64_t exec_ns,
+    int64_t idle_ns) {
+  std::lock_guard<std::mutex> lock(this->telemetry_mutex);
+  this->telemetry.num_submissions++;
+  this->telemetry.queue_wait_ns += queue_wait_ns;
+  this->telemetry.max_queue_wait_ns =
+      std::max(this->telemetry.max_queue_wait_ns, queue_wait_ns);
+  this->telemetry.exec_ns += exec_ns;
+  this->telemetry.max_exec_ns =
+      std::max(this->telemetry.max_exec_ns, exec_ns);
+  this->telemetry.idle_ns += idle_ns;
+  this->telemetry.queue_wait_histogram[get_histogram_bucket(queue_wait_ns)]++;
+  this->telemetry.exec_histogram[get_histogram_bucket(exec_ns)]++;
+}
+
 void TaskExecutor::stop_executor() {
   bool should_wait_worker_join = false;
   {
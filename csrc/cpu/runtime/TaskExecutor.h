@@ -2,7 +2,10 @@
 
 #include <dlfcn.h>
 #include <omp.h>
+#include <array>
+#include <atomic>
 #include <cassert>
+#include <chrono>
 #include <condition_variable>
 #include <functional>
 #include <future>
@@ -12,6 +15,7 @@
 #include <queue>
 #include <stdexcept>
 #include <thread>
+#include <type_traits>
 #include <vector>
 
 #include <ATen/core/ivalue.h>
@@ -22,18 +26,53 @@
 namespace torch_ipex {
 namespace runtime {
 
+using TaskClock = std::chrono::steady_clock;
+
+/*An item in the task queue, which records when it's submitted*/
+struct TaskItem {
+  template <
+      class F,
+      typename = std::enable_if_t<
+          !std::is_same<std::decay_t<F>, TaskItem>::value>>
+  TaskItem(F&& f)
+      : function(std::forward<F>(f)), submit_time(TaskClock::now()) {}
+  std::function<void()> function;
+  TaskClock::time_point submit_time;
+};
+
+/*Telemetry of a TaskExecutor. Durations are in nanoseconds. Bucket i of the
+ * histograms counts the durations in [2^(i-1), 2^i) microseconds, bucket 0
+ * counts the durations less than 1 microsecond and the last bucket counts the
+ * longer ones*/
+struct TORCH_API TaskExecutorTelemetry {
+  static constexpr int kNumHistogramBuckets = 32;
+  int64_t num_submissions{0};
+  int64_t queue_wait_ns{0};
+  int64_t max_queue_wait_ns{0};
+  int64_t exec_ns{0};
+  int64_t max_exec_ns{0};
+  int64_t idle_ns{0};
+  std::array<int64_t, kNumHistogramBuckets> queue_wait_histogram{};
+  std::array<int64_t, kNumHistogramBuckets> exec_histogram{};
+};
+
 class TORCH_API TaskExecutor {
  public:
   explicit TaskExecutor(const torch_ipex::runtime::CPUPool& cpu_pool);
   std::mutex& get_mutex();
   std::condition_variable& get_condition();
   bool is_stop();
-  std::queue<std::function<void()>>& get_tasks();
+  std::queue<TaskItem>& get_tasks();
   void stop_executor();
+  // Telemetry is opt-in, nothing is recorded until it's enabled.
+  void set_telemetry_enabled(bool enabled);
+  bool is_telemetry_enabled();
+  TaskExecutorTelemetry get_telemetry();
+  void reset_telemetry();
   ~TaskExecutor();
 
  private:
-  std::queue<std::function<void()>> tasks;
+  std::queue<TaskItem> tasks;
   std::shared_ptr<std::thread> worker;
 
   // Synchronization
@@ -41,6 +80,14 @@ class TORCH_API TaskExecutor {
   std::mutex worker_mutex;
   std::condition_variable worker_condition;
 
+  // Telemetry
+  std::atomic<bool> telemetry_enabled{false};
+  // When telemetry is enabled or reset, the idle time before it is not counted.
+  std::atomic<int64_t> telemetry_start_ns{0};
+  std::mutex telemetry_mutex;
+  TaskExecutorTelemetry telemetry;
+  void record_telemetry(int64_t queue_wait_ns, int64_t exec_ns, int64_t idle_ns);
+
   // Put the deleted function in the private.
   TaskExecutor(const TaskExecutor& task_executor) =
       delete; // Not support copy or move construtor.
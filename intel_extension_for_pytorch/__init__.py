@@ -22,18 +22,47 @@ if torch_version == '' or ipex_version == '' or torch_version != ipex_version:
   exit(127)
 
 
+# Load the C++ extension, which registers the optimized operators when Intel® Extension for PyTorch* is imported.
+# torchvision is imported above since the operators of torchvision are overridden here.
+from . import _C
+
+# The subpackages patching PyTorch at import time are imported eagerly.
 from . import cpu
-from . import quantization
 from . import nn
 from . import jit
 
-from . import tpp
-
-
 from .utils.verbose import verbose
-from .frontend import optimize, enable_auto_channels_last, disable_auto_channels_last, enable_onednn_fusion, set_fp32_math_mode, get_fp32_math_mode, FP32MathMode, fast_bert
 from .cpu._auto_kernel_selection import _enable_dnnl, _disable_dnnl, _using_dnnl
 
-# for xpu
-import intel_extension_for_pytorch.xpu
-from . import optim
\ No newline at end of file
+# for xpu, the xpu device module is registered into PyTorch at import time.
+if _C._has_xpu():
+    import intel_extension_for_pytorch.xpu
+
+# The other subpackages and the APIs in frontend are imported on first access,
+# since they import heavy dependencies such as transformers and TorchDynamo.
+import importlib
+
+_lazy_submodules = ["quantization", "tpp", "xpu", "optim", "frontend"]
+_lazy_attributes = {
+    "optimize": "frontend",
+    "enable_auto_channels_last": "frontend",
+    "disable_auto_channels_last": "frontend",
+    "enable_onednn_fusion": "frontend",
+    "set_fp32_math_mode": "frontend",
+    "get_fp32_math_mode": "frontend",
+    "FP32MathMode": "frontend",
+    "fast_bert": "frontend",
+    "ShapeBuckets": "frontend",
+}
+
+def __getattr__(name):
+    if name in _lazy_submodules:
+        return importlib.import_module("." + name, __name__)
+    if name in _lazy_attributes:
+        value = getattr(importlib.import_module("." + _lazy_attributes[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def __dir__():
+    return sorted(list(globals().keys()) + _lazy_submodules + list(_lazy_attributes.keys()))
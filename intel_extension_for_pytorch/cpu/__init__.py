@@ -1,4 +1,15 @@
-from . import launch
-from . import runtime
+import importlib
+
+# autocast patches torch.cpu.amp at import time, so it is imported eagerly.
+# The other subpackages are imported on first access to reduce the import time.
 from . import autocast
-from . import auto_ipex
+
+_lazy_submodules = ["launch", "runtime", "auto_ipex", "hypertune", "benchmark"]
+
+def __getattr__(name):
+    if name in _lazy_submodules:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def __dir__():
+    return sorted(list(globals().keys()) + _lazy_submodules)
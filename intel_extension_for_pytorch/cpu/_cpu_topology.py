@@ -0,0 +1,206 @@
+import glob
+import os
+import re
+import threading
+from ..utils._disk_cache import get_cache_dir, get_hash, load_json_cache, update_json_cache
+
+SYS_CPU_DIR = "/sys/devices/system/cpu"
+SYS_NODE_DIR = "/sys/devices/system/node"
+
+def parse_cpu_list(cpu_list):
+    r"""
+    Parse the cpu list format of sysfs, such as ``0-3,8,10-11``, into a list of ids.
+    """
+    ids = []
+    for item in cpu_list.strip().split(","):
+        item = item.strip()
+        if item == "":
+            continue
+        if "-" in item:
+            start, end = item.split("-")
+            ids.extend(range(int(start), int(end) + 1))
+        else:
+            ids.append(int(item))
+    return ids
+
+def _read(path, default=None):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+def _sorted_ids(path_pattern, prefix):
+    # Ids of the entries like cpu0, node1 in the directory, sorted by the id.
+    ids = []
+    for path in glob.glob(path_pattern):
+        matches = re.match(r"^{}(\d+)$".format(prefix), os.path.basename(path))
+        if matches:
+            ids.append(int(matches.group(1)))
+    return sorted(ids)
+
+class CPUTopology(object):
+    r"""
+    CPU topology of the machine, read from ``/sys/devices/system/cpu`` and
+    ``/sys/devices/system/node``.
+
+    Attributes:
+        cpus (list): The online logical CPU ids, sorted.
+        core_of (dict): Logical CPU id to physical core id. The physical cores
+            are numbered from 0 in the order of logical CPU ids, the same as
+            the ``Core`` column of ``lscpu``.
+        socket_of (dict): Logical CPU id to socket id.
+        node_of (dict): Logical CPU id to NUMA node id. It is the socket id if
+            NUMA is not available.
+        cache_groups (dict): Cache level (``"L2"``, ``"L3"``) to the groups of
+            logical CPU ids sharing one cache of this level.
+        node_distances (dict): NUMA node id to the list of distances to each
+            NUMA node, in the order of the sorted node ids.
+    """
+
+    def __init__(self, cpus, core_of, socket_of, node_of, cache_groups, node_distances):
+        self.cpus = cpus
+        self.core_of = core_of
+        self.socket_of = socket_of
+        self.node_of = node_of
+        self.cache_groups = cache_groups
+        self.node_distances = node_distances
+        self.thread_siblings = {}
+        for cpu in self.cpus:
+            self.thread_siblings.setdefault(self.core_of[cpu], []).append(cpu)
+        self.thread_siblings = {cpu: self.thread_siblings[self.core_of[cpu]] for cpu in self.cpus}
+
+    @classmethod
+    def from_sysfs(cls, sys_cpu_dir=SYS_CPU_DIR, sys_node_dir=SYS_NODE_DIR):
+        online = _read(os.path.join(sys_cpu_dir, "online"))
+        if online is not None:
+            cpus = parse_cpu_list(online)
+        else:
+            cpus = _sorted_ids(os.path.join(sys_cpu_dir, "cpu*"), "cpu")
+        assert len(cpus) > 0, "No CPU is found in {}".format(sys_cpu_dir)
+
+        core_of = {}
+        socket_of = {}
+        physical_cores = {}
+        cache_groups = {}
+        for cpu in cpus:
+            cpu_dir = os.path.join(sys_cpu_dir, "cpu{}".format(cpu))
+            socket_id = int(_read(os.path.join(cpu_dir, "topology", "physical_package_id"), "0"))
+            core_id = int(_read(os.path.join(cpu_dir, "topology", "core_id"), str(cpu)))
+            socket_of[cpu] = socket_id
+            # core_id is only unique inside a socket, renumber the cores in the order of cpus like lscpu.
+            core_of[cpu] = physical_cores.setdefault((socket_id, core_id), len(physical_cores))
+            for index_dir in sorted(glob.glob(os.path.join(cpu_dir, "cache", "index*"))):
+                level = _read(os.path.join(index_dir, "level"))
+                cache_type = _read(os.path.join(index_dir, "type"))
+                shared_cpu_list = _read(os.path.join(index_dir, "shared_cpu_list"))
+                if level is None or shared_cpu_list is None or cache_type not in ["Data", "Unified"]:
+                    continue
+                cache_groups.setdefault("L" + level, set()).add(tuple(parse_cpu_list(shared_cpu_list)))
+        online_cpus = set(cpus)
+        cache_groups = {level: sorted([sorted(online_cpus.intersection(group)) for group in groups])
+                        for level, groups in cache_groups.items() if level in ["L2", "L3"]}
+
+        node_of = {}
+        node_distances = {}
+        nodes = _sorted_ids(os.path.join(sys_node_dir, "node*"), "node")
+        for node in nodes:
+            node_dir = os.path.join(sys_node_dir, "node{}".format(node))
+            for cpu in parse_cpu_list(_read(os.path.join(node_dir, "cpulist"), "")):
+                if cpu in online_cpus:
+                    node_of[cpu] = node
+            distance = _read(os.path.join(node_dir, "distance"))
+            if distance is not None:
+                node_distances[node] = [int(x) for x in distance.split()]
+        if len(node_of) != len(cpus):
+            # NUMA is not available, use the socket as the node like lscpu.
+            node_of = dict(socket_of)
+            node_distances = {}
+        return cls(cpus, core_of, socket_of, node_of, cache_groups, node_distances)
+
+    def to_dict(self):
+        return {"cpus": self.cpus,
+                "core_of": [self.core_of[cpu] for cpu in self.cpus],
+                "socket_of": [self.socket_of[cpu] for cpu in self.cpus],
+                "node_of": [self.node_of[cpu] for cpu in self.cpus],
+                "cache_groups": self.cache_groups,
+                "node_distances": [[node, distances] for node, distances in sorted(self.node_distances.items())]}
+
+    @classmethod
+    def from_dict(cls, data):
+        cpus = data["cpus"]
+        return cls(cpus,
+                   dict(zip(cpus, data["core_of"])),
+                   dict(zip(cpus, data["socket_of"])),
+                   dict(zip(cpus, data["node_of"])),
+                   data["cache_groups"],
+                   {node: distances for node, distances in data["node_distances"]})
+
+    def get_nodes(self):
+        return sorted(set(self.node_of.values()))
+
+    def get_node_cpus(self, node_id):
+        r"""
+        Logical CPU ids on the NUMA node.
+        """
+        return [cpu for cpu in self.cpus if self.node_of[cpu] == node_id]
+
+    def is_first_thread(self, cpu):
+        return self.thread_siblings[cpu][0] == cpu
+
+    def get_physical_cpus(self, node_id=None):
+        r"""
+        The first logical CPU id of each physical core, on the NUMA node if
+        ``node_id`` is set.
+        """
+        cpus = self.cpus if node_id is None else self.get_node_cpus(node_id)
+        return [cpu for cpu in cpus if self.is_first_thread(cpu)]
+
+    def get_cache_group(self, cpu, level="L3"):
+        r"""
+        Logical CPU ids sharing the cache of ``level`` with ``cpu``. The CPUs
+        on the same NUMA node are returned if the cache information is not
+        available.
+        """
+        for group in self.cache_groups.get(level, []):
+            if cpu in group:
+                return group
+        return self.get_node_cpus(self.node_of[cpu])
+
+def _get_cache_key(sys_cpu_dir, sys_node_dir):
+    # The topology may change after reboot or cpu hotplug, e.g. resize of virtual machines.
+    return get_hash(sys_cpu_dir,
+                    sys_node_dir,
+                    os.uname().nodename,
+                    _read("/proc/sys/kernel/random/boot_id"),
+                    _read(os.path.join(sys_cpu_dir, "online")),
+                    _read(os.path.join(sys_node_dir, "online")))
+
+_topology = {}
+_topology_lock = threading.Lock()
+
+def get_cpu_topology(sys_cpu_dir=SYS_CPU_DIR, sys_node_dir=SYS_NODE_DIR, use_cache=True):
+    r"""
+    Get the :class:`CPUTopology` of the machine. The result is memoized in the
+    process, and cached on disk across the processes if ``use_cache`` is True.
+    """
+    key = (sys_cpu_dir, sys_node_dir)
+    with _topology_lock:
+        if key in _topology:
+            return _topology[key]
+        cache_file = os.path.join(get_cache_dir(), "cpu_topology.json")
+        cache_key = _get_cache_key(sys_cpu_dir, sys_node_dir)
+        topology = None
+        if use_cache:
+            data = load_json_cache(cache_file).get(cache_key)
+            if data is not None:
+                try:
+                    topology = CPUTopology.from_dict(data)
+                except (KeyError, TypeError, ValueError):
+                    topology = None
+        if topology is None:
+            topology = CPUTopology.from_sysfs(sys_cpu_dir, sys_node_dir)
+            if use_cache:
+                update_json_cache(cache_file, cache_key, topology.to_dict())
+        _topology[key] = topology
+        return topology
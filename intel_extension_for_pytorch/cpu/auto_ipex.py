@@ -12,7 +12,9 @@ format_str = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 logging.basicConfig(level=logging.INFO, format=format_str)
 logger = logging.getLogger(__name__)
 
-def apply_monkey_patch(program, dtype, auto_ipex_verbose, disable_ipex_graph_mode):
+def apply_monkey_patch(program, dtype, auto_ipex_verbose, disable_ipex_graph_mode,
+                       level="O1", weights_prepack=True, conv_bn_folding=True, auto_kernel_selection=False,
+                       fp32_math_mode="FP32", onednn_fusion=True, num_streams=1):
     # Auto apply the ipex features
     # Open the original file and get the content
     with open(program) as f:
@@ -25,6 +27,9 @@ from typing import Any, Callable
 import functools
 import threading
 
+ipex.set_fp32_math_mode(ipex.FP32MathMode.{6})
+ipex.enable_onednn_fusion({7})
+
 def set_optimized_attr(model):
     setattr(model, "_ipex_optimized", True)
     for child_name, child in model.named_children():
@@ -62,13 +67,38 @@ def module_call_wrapper(mod, *args, **kwargs):
 
             set_optimized_attr(mod)
             dataType = torch.bfloat16 if ({0} == True) else torch.float32
-            optimized_m = ipex.optimize(mod.eval(), dtype=dataType, graph_mode=(None if ({2} == True) else True)).eval()
+            optimized_m = ipex.optimize(mod.eval(),
+                                        dtype=dataType,
+                                        level="{3}",
+                                        weights_prepack={4},
+                                        conv_bn_folding={5},
+                                        auto_kernel_selection={9},
+                                        graph_mode=(None if ({2} == True) else True)).eval()
             set_optimized_attr(optimized_m)
 
             def optimized_m_forward(*args, **kwargs):
                 with torch.cpu.amp.autocast(enabled={0}), torch.no_grad(), nested_optimized():
                     return optimized_m(*args, **kwargs)
 
+            if {8} > 1:
+                # Run the optimized module with several streams, the inputs are split along the batch dimension.
+                # Autocast is thread local, thus it is applied inside the threads of the streams.
+                class _StreamModule(torch.nn.Module):
+                    def __init__(self, m):
+                        super().__init__()
+                        self.m = m
+                    def forward(self, *args, **kwargs):
+                        with torch.cpu.amp.autocast(enabled={0}), torch.no_grad(), nested_optimized():
+                            return self.m(*args, **kwargs)
+                stream_m = _StreamModule(optimized_m)
+                set_optimized_attr(stream_m)
+                multi_stream_m = ipex.cpu.runtime.MultiStreamModule(stream_m, num_streams={8}, cpu_pool=ipex.cpu.runtime.CPUPool())
+                set_optimized_attr(multi_stream_m)
+
+                def optimized_m_forward(*args, **kwargs):
+                    with torch.no_grad(), nested_optimized():
+                        return multi_stream_m(*args, **kwargs)
+
             if not {2}:
                 # Warm up run to finish some warm up steps for graph mode in ipex.optimize
                 for _ in range(3):
@@ -91,7 +121,9 @@ def module_call_wrapper(mod, *args, **kwargs):
         return _orig_module_call(mod, *args, **kwargs)
     return forward(mod, *args, **kwargs)
 
-setattr(torch.nn.Module, "__call__", module_call_wrapper)\n""".format(dtype.lower() == "bfloat16", auto_ipex_verbose, disable_ipex_graph_mode)
+setattr(torch.nn.Module, "__call__", module_call_wrapper)\n""".format(dtype.lower() == "bfloat16", auto_ipex_verbose, disable_ipex_graph_mode,
+                                                                       level, weights_prepack, conv_bn_folding, fp32_math_mode,
+                                                                       onednn_fusion, num_streams, auto_kernel_selection)
 
     original_program_lines.insert(0, monkey_patch)
 
@@ -106,8 +138,15 @@ setattr(torch.nn.Module, "__call__", module_call_wrapper)\n""".format(dtype.lowe
 
     return generate_file
 
+def apply_monkey_patch_with_args(args):
+    # Apply the monkey patch with the arguments added by add_auto_ipex_params
+    return apply_monkey_patch(args.program, args.dtype, args.auto_ipex_verbose, args.disable_ipex_graph_mode,
+                              args.ipex_level, not args.disable_weights_prepack, not args.disable_conv_bn_folding,
+                              args.auto_kernel_selection, args.fp32_math_mode, not args.disable_onednn_fusion,
+                              args.num_streams)
+
 def _exec(args):
-    monkey_patch_program = apply_monkey_patch(args.program, args.dtype, args.auto_ipex_verbose, args.disable_ipex_graph_mode)
+    monkey_patch_program = apply_monkey_patch_with_args(args)
     try:
         cmd = []
         cmd.append(sys.executable)
@@ -133,6 +172,22 @@ def add_auto_ipex_params(parser, auto_ipex_default_enabled=False):
                        help="This flag is only used for debug and UT of auto ipex.")
     group.add_argument("--disable_ipex_graph_mode", action='store_true', default=False,
                        help="Enable the Graph Mode for ipex.optimize")
+    group.add_argument("--ipex_level", metavar='\b', default="O1", type=str,
+                       choices=['O0', 'O1'],
+                       help="The optimization level of ipex.optimize. O0 or O1 is allowed.")
+    group.add_argument("--disable_weights_prepack", action='store_true', default=False,
+                       help="Disable the weights prepack of ipex.optimize")
+    group.add_argument("--disable_conv_bn_folding", action='store_true', default=False,
+                       help="Disable the conv bn folding of ipex.optimize")
+    group.add_argument("--auto_kernel_selection", action='store_true', default=False,
+                       help="Enable the auto kernel selection of ipex.optimize")
+    group.add_argument("--fp32_math_mode", metavar='\b', default="FP32", type=str,
+                       choices=['FP32', 'BF32'],
+                       help="The FP32 math mode set by ipex.set_fp32_math_mode. FP32 or BF32 is allowed.")
+    group.add_argument("--disable_onednn_fusion", action='store_true', default=False,
+                       help="Disable the oneDNN fusion by ipex.enable_onednn_fusion")
+    group.add_argument("--num_streams", metavar='\b', default=1, type=int,
+                       help="Run the optimized model with MultiStreamModule of this number of streams. The inputs are split along the batch dimension. Default is 1, which means not to use MultiStreamModule.")
 
 def parse_args():
     """
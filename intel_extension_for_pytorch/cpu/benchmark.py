@@ -0,0 +1,325 @@
+r"""
+Statistical benchmarking of a callable, e.g. a model or a custom operator.
+
+The callable is warmed up until its latency reaches the steady state, then
+measured repeatedly until the confidence interval of the mean latency is
+narrow enough. Outliers are rejected before calculating the mean and its
+confidence interval, while the percentiles are calculated on all the samples
+to keep the tail latency. The result can be saved as JSON and compared with a
+baseline result to detect performance regressions.
+
+    >>> from intel_extension_for_pytorch.cpu import benchmark
+    >>> result = benchmark.benchmark(model, args=(x,), batch_size=x.size(0))
+    >>> result.save("current.json")
+
+The results can be compared in CI with
+
+    python -m intel_extension_for_pytorch.cpu.benchmark current.json baseline.json --threshold 0.02
+"""
+
+import json
+import math
+import platform
+import sys
+import time
+from argparse import ArgumentParser
+import numpy as np
+import torch
+
+def _reject_outliers(samples, outlier_factor):
+    # Tukey's fences on the interquartile range.
+    if outlier_factor is None or len(samples) < 4:
+        return samples
+    q1, q3 = np.percentile(samples, [25, 75])
+    iqr = q3 - q1
+    low, high = q1 - outlier_factor * iqr, q3 + outlier_factor * iqr
+    return samples[(samples >= low) & (samples <= high)]
+
+def _bootstrap_mean_ci(samples, confidence, num_resamples=1000):
+    # Percentile bootstrap of the mean, with a fixed seed to make the result reproducible.
+    if len(samples) < 2:
+        return float(samples.mean()), float(samples.mean())
+    rng = np.random.RandomState(0)
+    means = samples[rng.randint(0, len(samples), size=(num_resamples, len(samples)))].mean(axis=1)
+    alpha = (1 - confidence) / 2
+    low, high = np.percentile(means, [alpha * 100, (1 - alpha) * 100])
+    return float(low), float(high)
+
+def _normal_quantile(p):
+    # The quantile of the standard normal distribution, by bisection on the CDF.
+    low, high = -10.0, 10.0
+    for _ in range(100):
+        mid = (low + high) / 2
+        if 0.5 * (1 + math.erf(mid / math.sqrt(2))) < p:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+class _RunningStats(object):
+    # Welford's online mean and variance, to check the precision of the mean in
+    # O(1) per call during the measurement. The outliers are not rejected, so the
+    # interval is wider than the bootstrap interval of the final result.
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def get_relative_ci_width(self, z):
+        if self.count < 2 or self.mean <= 0:
+            return float('inf')
+        return z * math.sqrt(self.m2 / (self.count - 1) / self.count) / self.mean
+
+class BenchmarkResult(object):
+    r"""
+    Result of :func:`benchmark`. The latencies are in milliseconds and the
+    throughput is in samples per second.
+
+    Attributes:
+        name (str): The name of the benchmark.
+        batch_size (int): The number of samples processed by each call.
+        latencies (list): The latency of each measured call.
+        warmup_iterations (int): The number of calls to warm up.
+        num_outliers (int): The number of latencies rejected as outliers.
+        mean (float): The mean latency without outliers.
+        std (float): The standard deviation of the latency without outliers.
+        ci (tuple): The confidence interval of the mean latency.
+        p50, p90, p99 (float): The percentile latencies of all the calls.
+        throughput (float): ``batch_size`` divided by the mean latency.
+        throughput_ci (tuple): The confidence interval of the throughput.
+        metadata (dict): The environment of the benchmark.
+    """
+
+    def __init__(self, name, batch_size, latencies, warmup_iterations, confidence=0.95, outlier_factor=1.5, metadata=None):
+        self.name = name
+        self.batch_size = batch_size
+        self.latencies = [float(latency) for latency in latencies]
+        self.warmup_iterations = warmup_iterations
+        self.confidence = confidence
+        self.outlier_factor = outlier_factor
+        self.metadata = metadata if metadata is not None else {}
+
+        samples = np.array(self.latencies)
+        filtered = _reject_outliers(samples, outlier_factor)
+        self.num_outliers = len(samples) - len(filtered)
+        self.mean = float(filtered.mean())
+        self.std = float(filtered.std(ddof=1)) if len(filtered) > 1 else 0.0
+        self.ci = _bootstrap_mean_ci(filtered, confidence)
+        self.min = float(samples.min())
+        self.max = float(samples.max())
+        self.p50, self.p90, self.p99 = [float(p) for p in np.percentile(samples, [50, 90, 99])]
+        self.throughput = batch_size * 1000 / self.mean
+        self.throughput_ci = (batch_size * 1000 / self.ci[1], batch_size * 1000 / self.ci[0])
+
+    def get_relative_ci_width(self):
+        # Half width of the confidence interval relative to the mean.
+        return (self.ci[1] - self.ci[0]) / 2 / self.mean
+
+    def to_dict(self):
+        return {"name": self.name,
+                "batch_size": self.batch_size,
+                "iterations": len(self.latencies),
+                "warmup_iterations": self.warmup_iterations,
+                "num_outliers": self.num_outliers,
+                "confidence": self.confidence,
+                "outlier_factor": self.outlier_factor,
+                "latency_ms": {"mean": self.mean,
+                               "std": self.std,
+                               "ci": list(self.ci),
+                               "min": self.min,
+                               "max": self.max,
+                               "p50": self.p50,
+                               "p90": self.p90,
+                               "p99": self.p99},
+                "throughput": {"mean": self.throughput,
+                               "ci": list(self.throughput_ci)},
+                "latencies_ms": self.latencies,
+                "metadata": self.metadata}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"],
+                   data["batch_size"],
+                   data["latencies_ms"],
+                   data["warmup_iterations"],
+                   data["confidence"],
+                   data["outlier_factor"],
+                   data["metadata"])
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def save(self, path):
+        save_results([self], path)
+
+    def __repr__(self):
+        return "{}: latency mean {:.4f} ms (CI {:.4f}-{:.4f}), p50 {:.4f} ms, p90 {:.4f} ms, p99 {:.4f} ms, " \
+               "throughput {:.2f} samples/s, {} iterations, {} outliers".format(
+                   self.name, self.mean, self.ci[0], self.ci[1], self.p50, self.p90, self.p99,
+                   self.throughput, len(self.latencies), self.num_outliers)
+
+def _get_metadata():
+    import intel_extension_for_pytorch as ipex
+    return {"ipex_version": ipex.__version__,
+            "torch_version": torch.__version__,
+            "num_threads": torch.get_num_threads(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "python_version": platform.python_version(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def benchmark(fn,
+              args=(),
+              kwargs=None,
+              name=None,
+              batch_size=1,
+              warmup_iterations=None,
+              warmup_window=10,
+              warmup_tolerance=0.02,
+              max_warmup_iterations=1000,
+              min_iterations=30,
+              max_iterations=10000,
+              min_time=1.0,
+              max_time=60.0,
+              target_precision=0.005,
+              confidence=0.95,
+              outlier_factor=1.5):
+    r"""
+    Benchmark ``fn(*args, **kwargs)``.
+
+    Args:
+        fn (callable): The function to benchmark, e.g. a model.
+        args (tuple): The positional arguments of ``fn``.
+        kwargs (dict): The keyword arguments of ``fn``.
+        name (str): The name of the benchmark. Default to the name of ``fn``.
+        batch_size (int): The number of samples processed by each call, to
+            calculate the throughput.
+        warmup_iterations (int): The number of calls to warm up. Default to
+            warm up until the steady state, i.e. the median latency of two
+            consecutive windows of ``warmup_window`` calls differs by less
+            than ``warmup_tolerance``, up to ``max_warmup_iterations`` calls.
+        min_iterations (int): The minimum number of measured calls.
+        max_iterations (int): The maximum number of measured calls.
+        min_time (float): The minimum seconds of the measurement.
+        max_time (float): The maximum seconds of the measurement.
+        target_precision (float): The measurement stops after ``min_iterations``
+            and ``min_time`` once the half width of the confidence interval of
+            the mean latency is less than this fraction of the mean.
+        confidence (float): The confidence level of the confidence intervals.
+        outlier_factor (float): The latencies out of ``outlier_factor`` times
+            the interquartile range from the quartiles are rejected as outliers
+            for the mean and its confidence interval. None to keep all the latencies.
+
+    Returns:
+        BenchmarkResult: The result of the benchmark.
+    """
+    if kwargs is None:
+        kwargs = {}
+    if not isinstance(args, tuple):
+        args = (args,)
+    if name is None:
+        name = getattr(fn, "__name__", type(fn).__name__)
+
+    def run():
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        return (time.perf_counter() - start) * 1000
+
+    if warmup_iterations is not None:
+        for _ in range(warmup_iterations):
+            run()
+    else:
+        warmup_iterations = 0
+        previous_median = None
+        while warmup_iterations < max_warmup_iterations:
+            median = float(np.median([run() for _ in range(warmup_window)]))
+            warmup_iterations += warmup_window
+            if previous_median is not None and abs(median - previous_median) <= warmup_tolerance * previous_median:
+                break
+            previous_median = median
+
+    # The stopping rule uses the normal approximation of the running mean, the
+    # bootstrap is done only once for the final result.
+    z = _normal_quantile((1 + confidence) / 2)
+    stats = _RunningStats()
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < max_iterations:
+        latency = run()
+        latencies.append(latency)
+        stats.add(latency)
+        elapsed = time.perf_counter() - start
+        if elapsed >= max_time:
+            break
+        if len(latencies) >= min_iterations and elapsed >= min_time and \
+                stats.get_relative_ci_width(z) <= target_precision:
+            break
+    return BenchmarkResult(name, batch_size, latencies, warmup_iterations, confidence, outlier_factor, _get_metadata())
+
+def compare(result, baseline, threshold=0.02):
+    r"""
+    Compare the mean latency of ``result`` with ``baseline``. A regression
+    (or an improvement) is reported only if the relative change is larger than
+    ``threshold`` and the confidence intervals of both results don't overlap.
+
+    Returns:
+        dict: The comparison with the keys ``name``, ``baseline``, ``current``,
+        ``change``, ``regression`` and ``improvement``.
+    """
+    change = (result.mean - baseline.mean) / baseline.mean
+    return {"name": result.name,
+            "baseline": baseline.mean,
+            "current": result.mean,
+            "change": change,
+            "regression": change > threshold and result.ci[0] > baseline.ci[1],
+            "improvement": change < -threshold and result.ci[1] < baseline.ci[0]}
+
+def save_results(results, path):
+    r"""
+    Save a list of :class:`BenchmarkResult` into a JSON file.
+    """
+    with open(path, "w") as f:
+        json.dump([result.to_dict() for result in results], f, indent=2)
+
+def load_results(path):
+    r"""
+    Load the list of :class:`BenchmarkResult` from a JSON file saved by :func:`save_results`.
+    """
+    with open(path, "r") as f:
+        return [BenchmarkResult.from_dict(data) for data in json.load(f)]
+
+def compare_results(results, baselines, threshold=0.02):
+    r"""
+    Compare the results with the baseline results of the same name.
+
+    Returns:
+        list: The comparisons of the results with baselines, refer to :func:`compare`.
+    """
+    baselines = {baseline.name: baseline for baseline in baselines}
+    return [compare(result, baselines[result.name], threshold) for result in results if result.name in baselines]
+
+def main():
+    parser = ArgumentParser(description="Compare benchmark results with baselines. "
+                                        "Return non-zero code if any regression is found.")
+    parser.add_argument("results", type=str, help="The JSON file of the results")
+    parser.add_argument("baselines", type=str, help="The JSON file of the baseline results")
+    parser.add_argument("--threshold", default=0.02, type=float,
+                        help="The relative change of the mean latency regarded as a regression")
+    args = parser.parse_args()
+
+    comparisons = compare_results(load_results(args.results), load_results(args.baselines), args.threshold)
+    for comparison in comparisons:
+        status = "REGRESSION" if comparison["regression"] else "IMPROVEMENT" if comparison["improvement"] else "OK"
+        print("{}: {:.4f} ms -> {:.4f} ms ({:+.2%}) {}".format(
+            comparison["name"], comparison["baseline"], comparison["current"], comparison["change"], status))
+    if any([comparison["regression"] for comparison in comparisons]):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
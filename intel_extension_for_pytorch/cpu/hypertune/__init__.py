@@ -0,0 +1,10 @@
+import importlib
+
+def __getattr__(name):
+    # tune imports torch and the runtime, which are not needed to tune a script with the launcher.
+    if name == "tune":
+        return importlib.import_module(".inprocess", __name__).tune
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+def __dir__():
+    return sorted(list(globals().keys()) + ["tune"])
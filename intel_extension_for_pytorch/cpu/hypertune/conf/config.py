@@ -10,7 +10,7 @@ from ..strategy import STRATEGIES
 from intel_extension_for_pytorch.cpu.launch import CPUinfo
 
 #### tuning ####
-tuning_default = {'strategy': 'grid','max_trials': 100}
+tuning_default = {'strategy': 'grid','max_trials': 100, 'parallel_trials': 1, 'trial_timeout': 0, 'median_stopping': False, 'resume': False}
 
 def _valid_strategy(data):
     data = data.lower()
@@ -19,7 +19,11 @@ def _valid_strategy(data):
     
 tuning_schema = Schema({
                         Optional('strategy', default='grid'): And(str, Use(_valid_strategy)),
-                        Optional("max_trials", default=100): int
+                        Optional("max_trials", default=100): int,
+                        Optional("parallel_trials", default=1): And(int, lambda s: s > 0),
+                        Optional("trial_timeout", default=0): And(Or(int, float), lambda s: s >= 0),
+                        Optional("median_stopping", default=False): bool,
+                        Optional("resume", default=False): bool
                         })
 
 ### output_dir ###
@@ -90,9 +94,88 @@ launcher_schema = Schema({
                           Optional('malloc', default=['pt', 'tc', 'je']): And(list, lambda s: all(isinstance(i, str) for i in s))
                           })
                           
+#### ipex ####
+
+# default values if not tuning 
+ipex_hyperparam_default_val = {"level": ['O1'],
+                               "weights_prepack": [True],
+                               "conv_bn_folding": [True],
+                               "auto_kernel_selection": [False],
+                               "graph_mode": [True],
+                               "dtype": ['float32'],
+                               "fp32_math_mode": ['FP32'],
+                               "onednn_fusion": [True],
+                               "num_streams": [1]
+                               }
+
+# default search spaces if not user-specified
+ipex_hyperparam_default_search_space = {'hp': ['level', 'weights_prepack', 'conv_bn_folding', 'auto_kernel_selection', 'graph_mode', 'dtype', 'fp32_math_mode', 'onednn_fusion', 'num_streams'],
+                                        'level': ['O0', 'O1'],
+                                        'weights_prepack': [True, False],
+                                        'conv_bn_folding': [True, False],
+                                        'auto_kernel_selection': [True, False],
+                                        'graph_mode': [True, False],
+                                        'dtype': ['float32', 'bfloat16'],
+                                        'fp32_math_mode': ['FP32', 'BF32'],
+                                        'onednn_fusion': [True, False],
+                                        'num_streams': [1, 2, 4]
+                                        }
+
+def _valid_fp32_math_mode(data):
+    assert all(mode in ['FP32', 'BF32'] for mode in data), "fp32_math_mode must be in {'FP32', 'BF32'}"
+    return data
+
+ipex_schema = Schema({
+                      'hp': And(list, lambda s: all(isinstance(i, str) for i in s)),
+                      Optional('level', default=['O0', 'O1']): And(list, lambda s: all(i in ['O0', 'O1'] for i in s)),
+                      Optional('weights_prepack', default=[True, False]): And(list, lambda s: all(isinstance(i, bool) for i in s)),
+                      Optional('conv_bn_folding', default=[True, False]): And(list, lambda s: all(isinstance(i, bool) for i in s)),
+                      Optional('auto_kernel_selection', default=[True, False]): And(list, lambda s: all(isinstance(i, bool) for i in s)),
+                      Optional('graph_mode', default=[True, False]): And(list, lambda s: all(isinstance(i, bool) for i in s)),
+                      Optional('dtype', default=['float32', 'bfloat16']): And(list, lambda s: all(i in ['float32', 'bfloat16'] for i in s)),
+                      Optional('fp32_math_mode', default=['FP32', 'BF32']): And(list, Use(_valid_fp32_math_mode)),
+                      Optional('onednn_fusion', default=[True, False]): And(list, lambda s: all(isinstance(i, bool) for i in s)),
+                      Optional('num_streams', default=[1, 2, 4]): And(list, lambda s: all(isinstance(i, int) and i > 0 for i in s))
+                      })
+
+#### runtime ####
+
+# default values if not tuning 
+runtime_hyperparam_default_val = {"ncores": [-1],
+                                  "num_threads": [-1],
+                                  "num_streams": [1],
+                                  "fp32_math_mode": ['FP32'],
+                                  "onednn_fusion": [True]
+                                  }
+
+# default search spaces if not user-specified
+runtime_hyperparam_default_search_space = {'hp': ['ncores', 'num_threads', 'num_streams', 'fp32_math_mode', 'onednn_fusion'],
+                                           'ncores': 'all_physical_cores',
+                                           'num_threads': 'all_physical_cores',
+                                           'num_streams': [1, 2, 4],
+                                           'fp32_math_mode': ['FP32', 'BF32'],
+                                           'onednn_fusion': [True, False]
+                                           }
+
+runtime_schema = Schema({
+                         'hp': And(list, lambda s: all(isinstance(i, str) for i in s)),
+                         
+                         Hook('ncores', handler=_valid_launcher_schema): object,
+                         Optional('ncores', default='all_physical_cores'): And(Or(str, list), Use(input_str_to_list_int), lambda s: all(isinstance(i, int) for i in s)),
+                         
+                         Hook('num_threads', handler=_valid_launcher_schema): object,
+                         Optional('num_threads', default='all_physical_cores'): And(Or(str, list), Use(input_str_to_list_int), lambda s: all(isinstance(i, int) for i in s)),
+                         
+                         Optional('num_streams', default=[1, 2, 4]): And(list, lambda s: all(isinstance(i, int) for i in s)),
+                         Optional('fp32_math_mode', default=['FP32', 'BF32']): And(list, Use(_valid_fp32_math_mode)),
+                         Optional('onednn_fusion', default=[True, False]): And(list, lambda s: all(isinstance(i, bool) for i in s))
+                         })
+
 hyperparams_default = {'launcher': launcher_hyperparam_default_search_space}
 hyperparams_schema = Schema({
                             Optional('launcher'): launcher_schema,
+                            Optional('ipex'): ipex_schema,
+                            Optional('runtime'): runtime_schema,
                             })
                             
 schema = Schema({
@@ -111,11 +194,26 @@ class Conf(object):
     def __init__(self, conf_fpath, program_fpath, program_args):
         assert Path(conf_fpath).exists(), "{} does not exist".format(conf_fpath)
         self.execution_conf = DotDict(schema.validate(self._convert_conf(self._read_conf(conf_fpath), copy.deepcopy(schema.validate(dict())))))
+        assert 'runtime' not in self.execution_conf.hyperparams, "runtime hyperparams are only supported by in-process tuning"
         
         assert Path(program_fpath).exists(), "{} does not exist".format(program_fpath)
         self.program = program_fpath
         self.program_args = program_args
         self.usr_objectives = self._extract_usr_objectives(self.program)
+        self.runtime_objective = None
+    
+    @classmethod
+    def from_runtime_objective(cls, conf, runtime_objective):
+        # conf of in-process tuning, which has the same format as the .yaml file
+        self = cls.__new__(cls)
+        self.execution_conf = DotDict(schema.validate(self._convert_conf(schema.validate(conf), copy.deepcopy(schema.validate(dict())))))
+        assert 'launcher' not in self.execution_conf.hyperparams and 'ipex' not in self.execution_conf.hyperparams, \
+            "launcher and ipex hyperparams are not supported by in-process tuning"
+        self.program = None
+        self.program_args = []
+        self.usr_objectives = runtime_objective.usr_objectives
+        self.runtime_objective = runtime_objective
+        return self
         
     def _read_conf(self, conf_fpath):
         try:
@@ -129,14 +227,20 @@ class Conf(object):
             raise RuntimeError("The yaml file format is not correct. Please refer to document.")
               
     def _convert_conf(self, src, dst):
-        hyperparam_default_val = {'launcher': launcher_hyperparam_default_val}
+        hyperparam_default_val = {'launcher': launcher_hyperparam_default_val,
+                                  'ipex': ipex_hyperparam_default_val,
+                                  'runtime': runtime_hyperparam_default_val}
+        hyperparam_default_search_space = {'launcher': launcher_hyperparam_default_search_space,
+                                           'ipex': ipex_hyperparam_default_search_space,
+                                           'runtime': runtime_hyperparam_default_search_space}
         
         for k in dst:
             if k == 'hyperparams':
-                dst_hps = set(dst['hyperparams'])
-                for tune_x in dst_hps:
-                    # case 1: tune {launcher}  
+                for tune_x in hyperparam_default_search_space:
+                    # case 1: tune {launcher, ipex, runtime}  
                     if tune_x in src['hyperparams']:
+                        if tune_x not in dst['hyperparams']:
+                            dst['hyperparams'][tune_x] = copy.deepcopy(hyperparam_default_search_space[tune_x])
                         for hp in dst['hyperparams'][tune_x]['hp']:
                             # case 1.1: not tune hp, use hp default val  
                             if hp not in src['hyperparams'][tune_x]['hp']:
@@ -144,8 +248,8 @@ class Conf(object):
                             # case 1.2: tune hp, use default or user defined search space 
                             else:
                               dst['hyperparams'][tune_x][hp] = src['hyperparams'][tune_x][hp]
-                    # case 2: not tune {launcher} 
-                    else:
+                    # case 2: not tune {launcher, ipex, runtime} 
+                    elif tune_x in dst['hyperparams']:
                       del dst['hyperparams'][tune_x]
                       
             elif k == 'output_dir':
@@ -0,0 +1,168 @@
+import os
+import warnings
+import torch
+import intel_extension_for_pytorch as ipex
+from intel_extension_for_pytorch.cpu._cpu_topology import get_cpu_topology
+from intel_extension_for_pytorch.cpu.benchmark import benchmark
+from intel_extension_for_pytorch.cpu.runtime import CPUPool, MultiStreamModule, pin
+from intel_extension_for_pytorch.cpu.runtime.multi_stream import MultiStreamModuleHint, \
+                        default_multi_stream_module_split_hint, \
+                        default_multi_stream_module_concat_hint, \
+                        _get_split_size_by_hint
+from .conf.config import Conf, objective_schema
+from .strategy import STRATEGIES
+
+RUNTIME_OBJECTIVES = ['latency', 'latency_p50', 'latency_p90', 'latency_p99', 'throughput']
+
+def _get_available_physical_cores():
+    # The physical cores available for current process, in the order of NUMA nodes.
+    available_cpus = os.sched_getaffinity(0)
+    cores = [cpu for cpu in get_cpu_topology().get_physical_cpus() if cpu in available_cpus]
+    assert len(cores) > 0, "No physical core is available for current process"
+    return cores
+
+class RuntimeObjective(object):
+    r"""
+    The objective of in-process tuning. Runs the model with the runtime-level
+    knobs of a configuration applied, and measures the latency (ms per
+    iteration) and the throughput (samples per second) with
+    :func:`intel_extension_for_pytorch.cpu.benchmark.benchmark`.
+    """
+    def __init__(self,
+                 model,
+                 example_inputs,
+                 usr_objectives,
+                 prepare=None,
+                 batch_size=None,
+                 input_split_hint: MultiStreamModuleHint = default_multi_stream_module_split_hint,
+                 output_concat_hint: MultiStreamModuleHint = default_multi_stream_module_concat_hint,
+                 warmup_iterations=None,
+                 min_iterations=20,
+                 max_time=10.0):
+        if not isinstance(example_inputs, tuple):
+            example_inputs = (example_inputs,)
+        for objective in usr_objectives:
+            assert objective['name'] in RUNTIME_OBJECTIVES, \
+                "objective {} is not supported by in-process tuning, must be one of {}".format(objective['name'], RUNTIME_OBJECTIVES)
+        self.model = model
+        self.example_inputs = example_inputs
+        self.usr_objectives = usr_objectives
+        self.prepare = prepare
+        if batch_size is None:
+            batch_size = _get_split_size_by_hint(input_split_hint.args, example_inputs)
+        self.batch_size = batch_size if batch_size is not None else 1
+        self.input_split_hint = input_split_hint
+        self.output_concat_hint = output_concat_hint
+        self.warmup_iterations = warmup_iterations
+        self.min_iterations = min_iterations
+        self.max_time = max_time
+        self.available_cores = _get_available_physical_cores()
+
+    def _measure(self, run):
+        return benchmark(run,
+                         batch_size=self.batch_size,
+                         warmup_iterations=self.warmup_iterations,
+                         min_iterations=self.min_iterations,
+                         min_time=0,
+                         max_time=self.max_time)
+
+    def evaluate(self, cfg):
+        ncores = cfg['ncores'] if cfg['ncores'] != -1 else len(self.available_cores)
+        assert ncores <= len(self.available_cores), \
+            "ncores {} is larger than the {} physical cores available".format(ncores, len(self.available_cores))
+        cpu_pool = CPUPool(core_ids=self.available_cores[:ncores])
+        num_threads = cfg['num_threads'] if cfg['num_threads'] != -1 else ncores
+
+        # Keep the global settings to restore them after the trial.
+        previous_num_threads = torch.get_num_threads()
+        previous_fp32_math_mode = ipex.get_fp32_math_mode()
+        previous_onednn_fusion = ipex._C.get_jit_opt()
+        try:
+            ipex.set_fp32_math_mode(ipex.FP32MathMode[cfg['fp32_math_mode']])
+            ipex.enable_onednn_fusion(cfg['onednn_fusion'])
+            # The model is prepared after the knobs are applied, so that e.g. the graphs
+            # traced in prepare are optimized with the oneDNN fusion setting of the trial.
+            model = self.prepare(cfg) if self.prepare is not None else self.model
+            with torch.no_grad(), warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                if cfg['num_streams'] == 1:
+                    with pin(cpu_pool):
+                        torch.set_num_threads(num_threads)
+                        result = self._measure(lambda: model(*self.example_inputs))
+                else:
+                    # Each stream runs with the threads of its cores, num_threads doesn't take effect.
+                    multi_stream_model = MultiStreamModule(model,
+                                                           num_streams=cfg['num_streams'],
+                                                           cpu_pool=cpu_pool,
+                                                           input_split_hint=self.input_split_hint,
+                                                           output_concat_hint=self.output_concat_hint)
+                    result = self._measure(lambda: multi_stream_model(*self.example_inputs))
+        finally:
+            torch.set_num_threads(previous_num_threads)
+            ipex.set_fp32_math_mode(ipex.FP32MathMode(int(previous_fp32_math_mode)))
+            ipex.enable_onednn_fusion(previous_onednn_fusion)
+
+        values = {'latency': result.mean,
+                  'latency_p50': result.p50,
+                  'latency_p90': result.p90,
+                  'latency_p99': result.p99,
+                  'throughput': result.throughput}
+        return [values[objective['name']] for objective in self.usr_objectives]
+
+def tune(model,
+         example_inputs,
+         conf=None,
+         objectives=None,
+         prepare=None,
+         batch_size=None,
+         input_split_hint: MultiStreamModuleHint = default_multi_stream_module_split_hint,
+         output_concat_hint: MultiStreamModuleHint = default_multi_stream_module_concat_hint,
+         warmup_iterations=None,
+         min_iterations=20,
+         max_time=10.0):
+    r"""
+    Tune the runtime-level knobs of the model in the current process. Unlike
+    tuning a script with ``python -m intel_extension_for_pytorch.cpu.hypertune``,
+    the model is loaded only once and each trial takes seconds.
+
+    The knobs are the hyperparameters of the ``runtime`` group: ``ncores``
+    (the number of physical cores of the ``CPUPool``), ``num_threads``,
+    ``num_streams`` of ``MultiStreamModule`` (1 means running the model
+    directly on the ``CPUPool``), ``fp32_math_mode`` and ``onednn_fusion``.
+
+    Args:
+        model (torch.jit.ScriptModule or torch.nn.Module): The model to tune.
+        example_inputs (tuple or torch.Tensor): Inputs to run the model.
+        conf (dict): Configuration of the tuning in the same format as the
+            .yaml file of hypertune, with the ``runtime`` hyperparameter group.
+            Default to tune ``ncores`` and ``num_streams``.
+        objectives (list): Objectives in the same format as the ``@hypertune``
+            token, their names must be ``latency`` (the mean latency),
+            ``latency_p50``, ``latency_p90``, ``latency_p99`` or ``throughput``.
+            Default to minimize the latency.
+        prepare (callable): Optional function to get the model to run from the
+            configuration, called after the knobs are applied.
+        batch_size (int): The batch size to calculate the throughput. Default
+            to the size of the first input split by ``input_split_hint``.
+        input_split_hint (MultiStreamModuleHint): Hint about how to split the inputs.
+        output_concat_hint (MultiStreamModuleHint): Hint about how to concat the outputs.
+        warmup_iterations (int): Number of iterations to warm up each trial.
+            Default to warm up until the latency is steady.
+        min_iterations (int): Minimum number of measured iterations of each trial.
+        max_time (float): Maximum seconds to measure each trial.
+
+    Returns:
+        tuple: The best configuration and its objective values.
+    """
+    if conf is None:
+        conf = {'hyperparams': {'runtime': {'hp': ['ncores', 'num_streams']}}}
+    if objectives is None:
+        objectives = [{'name': 'latency'}]
+    usr_objectives = [objective_schema.validate(objective) for objective in objectives]
+    runtime_objective = RuntimeObjective(model, example_inputs, usr_objectives, prepare, batch_size,
+                                         input_split_hint, output_concat_hint,
+                                         warmup_iterations, min_iterations, max_time)
+    conf = Conf.from_runtime_objective(conf, runtime_objective)
+    strategy = STRATEGIES[conf.execution_conf.tuning.strategy](conf)
+    strategy.traverse()
+    return strategy.best_tune_cfg, strategy.best_tune_result
@@ -1,35 +1,37 @@
 #reference: https://github.com/intel/neural-compressor/blob/15477100cef756e430c8ef8ef79729f0c80c8ce6/neural_compressor/objective.py
-import subprocess
 import sys  
 
 class MultiObjective(object):
-    def __init__(self, program, program_args, tune_launcher):
+    def __init__(self, program, program_args, tune_launcher, tune_ipex=False):
         self.program = program 
         self.program_args = program_args 
         self.tune_launcher = tune_launcher
+        self.tune_ipex = tune_ipex
             
-    def evaluate(self, cfg):
+    def get_cmd(self, cfg, core_list=None):
         python = sys.executable
         cmd = [python]
         cmd.append("-m")
         cmd.append("intel_extension_for_pytorch.cpu.launch")
         
         if self.tune_launcher:
-            launcher_args = self.decode_launcer_cfg(cfg)
+            launcher_args = self.decode_launcer_cfg(cfg, core_list)
             cmd += launcher_args 
         
+        if self.tune_ipex:
+            cmd += self.decode_ipex_cfg(cfg)
+        
         cmd += [self.program]
         cmd += self.program_args
-        
-        r = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        
-        # todo: r.returncode != 0 
-        
-        output = str(r.stdout, "utf-8") 
-        usr_objective_vals = self.extract_usr_objectives(output)
-        return usr_objective_vals 
+        return cmd
+    
+    def get_num_cores(self, cfg):
+        # Number of cores used by the configuration, None if it uses all the cores of the machine.
+        if not self.tune_launcher or cfg["ncore_per_instance"] == -1 or cfg["ninstances"] == -1:
+            return None
+        return cfg["ncore_per_instance"] * cfg["ninstances"]
     
-    def decode_launcer_cfg(self, cfg):
+    def decode_launcer_cfg(self, cfg, core_list=None):
         ncore_per_instance = cfg["ncore_per_instance"]
         ninstances = cfg["ninstances"]
         use_all_nodes = cfg["use_all_nodes"]
@@ -48,12 +50,17 @@ class MultiObjective(object):
             launcher_args.append("--ninstances")
             launcher_args.append(str(ninstances))
         
-        if use_all_nodes == False:
-            launcher_args.append("--node_id")
-            launcher_args.append("0")
-        
-        if use_logical_core == True:
-            launcher_args.append("--use_logical_core")
+        if core_list is not None:
+            # The cores assigned by the trial scheduler, node_id and use_logical_core are applied by it.
+            launcher_args.append("--core_list")
+            launcher_args.append(",".join([str(core) for core in core_list]))
+        else:
+            if use_all_nodes == False:
+                launcher_args.append("--node_id")
+                launcher_args.append("0")
+            
+            if use_logical_core == True:
+                launcher_args.append("--use_logical_core")
 
         if disable_numactl == True:
             launcher_args.append("--disable_numactl")
@@ -70,6 +77,39 @@ class MultiObjective(object):
             
         return launcher_args
     
+    def decode_ipex_cfg(self, cfg):
+        # The ipex features are applied to the program without code changes by the auto_ipex feature of the launcher.
+        ipex_args = ["--auto_ipex"]
+        
+        ipex_args.append("--ipex_level")
+        ipex_args.append(cfg["level"])
+        
+        if cfg["weights_prepack"] == False:
+            ipex_args.append("--disable_weights_prepack")
+        
+        if cfg["conv_bn_folding"] == False:
+            ipex_args.append("--disable_conv_bn_folding")
+        
+        if cfg["auto_kernel_selection"] == True:
+            ipex_args.append("--auto_kernel_selection")
+        
+        if cfg["graph_mode"] == False:
+            ipex_args.append("--disable_ipex_graph_mode")
+        
+        ipex_args.append("--dtype")
+        ipex_args.append(cfg["dtype"])
+        
+        ipex_args.append("--fp32_math_mode")
+        ipex_args.append(cfg["fp32_math_mode"])
+        
+        if cfg["onednn_fusion"] == False:
+            ipex_args.append("--disable_onednn_fusion")
+        
+        ipex_args.append("--num_streams")
+        ipex_args.append(str(cfg["num_streams"]))
+        
+        return ipex_args
+    
     def extract_usr_objectives(self, output):
         HYPERTUNE_TOKEN = "@hypertune"
         output = output.strip().splitlines()
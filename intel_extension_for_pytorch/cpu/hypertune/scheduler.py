@@ -0,0 +1,263 @@
+import os
+import signal
+import subprocess
+import threading
+import time
+import warnings
+import numpy as np
+from intel_extension_for_pytorch.cpu.launch import CPUinfo
+
+HYPERTUNE_TOKEN = "@hypertune"
+
+# Number of completed trials needed before median stopping takes effect.
+MEDIAN_STOPPING_MIN_TRIALS = 3
+
+class _CorePool(object):
+    r"""
+    Free physical cores of the machine. The cores are allocated as whole
+    physical cores (together with their logical siblings), so that trials
+    running concurrently never share a physical core.
+    """
+    def __init__(self):
+        self.cpuinfo = CPUinfo()
+        self.free_cores = set(self.cpuinfo.get_all_physical_cores())
+
+    def get_num_physical_cores(self, num_cores, use_logical_core):
+        if use_logical_core and len(self.cpuinfo.physical_to_logical) > 0:
+            # The logical cores per physical core, i.e. the physical core itself and
+            # its sibling if it has one, averaged over the machine.
+            num_physical = len(self.cpuinfo.get_all_physical_cores())
+            num_logical = num_physical + len(self.cpuinfo.physical_to_logical)
+            return (num_cores * num_physical + num_logical - 1) // num_logical
+        return num_cores
+
+    def allocate(self, num_cores, use_logical_core, use_all_nodes):
+        r"""
+        Allocate the cores for one trial. The cores are taken from one NUMA node
+        if possible. Return the allocated physical cores and the core list for
+        ``--core_list`` of the launcher, or None if there are not enough free cores.
+        """
+        num_physical_cores = self.get_num_physical_cores(num_cores, use_logical_core)
+        node_ids = range(self.cpuinfo.node_nums()) if use_all_nodes else [0]
+        node_free_cores = [[core for core in self.cpuinfo.get_node_physical_cores(node_id) if core in self.free_cores]
+                           for node_id in node_ids]
+        # Prefer the node with the fewest free cores which still fit, to keep larger nodes for larger trials.
+        fit_nodes = [cores for cores in node_free_cores if len(cores) >= num_physical_cores]
+        if len(fit_nodes) > 0:
+            physical_cores = min(fit_nodes, key=len)[:num_physical_cores]
+        else:
+            all_free_cores = [core for cores in node_free_cores for core in cores]
+            if len(all_free_cores) < num_physical_cores:
+                return None
+            physical_cores = all_free_cores[:num_physical_cores]
+        self.free_cores -= set(physical_cores)
+        core_list = []
+        for core in physical_cores:
+            core_list.append(core)
+            if use_logical_core and core in self.cpuinfo.physical_to_logical:
+                core_list.append(self.cpuinfo.physical_to_logical[core])
+        return physical_cores, sorted(core_list[:num_cores])
+
+    def release(self, physical_cores):
+        self.free_cores.update(physical_cores)
+
+class _Trial(object):
+    def __init__(self, idx, cfg, physical_cores, num_objectives):
+        self.idx = idx
+        self.cfg = cfg
+        self.physical_cores = physical_cores
+        self.num_objectives = num_objectives
+        self.process = None
+        self.reader = None
+        self.start_time = None
+        self.output = []
+        # The objective values in the order of printing. Every num_objectives values
+        # are one report, a program may report intermediate values several times.
+        self.values = []
+        self.parse_error = None
+        self.status = "running"
+        self.result = None
+
+    def read_output(self):
+        expect_value = False
+        for line in iter(self.process.stdout.readline, b''):
+            line = str(line, "utf-8", errors="replace")
+            self.output.append(line)
+            if expect_value:
+                try:
+                    self.values.append(float(line.strip()))
+                except ValueError:
+                    self.parse_error = line
+            expect_value = HYPERTUNE_TOKEN in line
+        self.process.stdout.close()
+
+    def get_reports(self):
+        values = list(self.values)
+        return [values[i:i + self.num_objectives] for i in range(0, len(values) - self.num_objectives + 1, self.num_objectives)]
+
+    def kill(self):
+        # The launcher and its instances run in the process group of the trial.
+        try:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+class TrialScheduler(object):
+    r"""
+    Run the trials of hypertune. Up to ``parallel_trials`` trials are run
+    concurrently on disjoint core sets if the cores used by their
+    configurations are known and fit into the free cores of the machine,
+    otherwise the trial is run exclusively on the whole machine.
+
+    A trial is killed if it runs longer than ``trial_timeout`` seconds, or,
+    with ``median_stopping``, if the best value it reported so far is worse
+    than the median of the running averages of the completed trials at the
+    same report step for all the objectives.
+    """
+    def __init__(self, multiobjective, usr_objectives, parallel_trials=1, trial_timeout=0, median_stopping=False):
+        self.multiobjective = multiobjective
+        self.usr_objectives = usr_objectives
+        self.parallel_trials = parallel_trials
+        self.trial_timeout = trial_timeout
+        self.median_stopping = median_stopping
+        self.core_pool = _CorePool() if parallel_trials > 1 else None
+        self.running_trials = []
+        # The reports of the completed trials, used by median stopping.
+        self.completed_reports = []
+
+    def num_running(self):
+        return len(self.running_trials)
+
+    def add_completed(self, reports):
+        self.completed_reports.append(reports)
+
+    def try_start(self, idx, cfg):
+        r"""
+        Start the trial of ``cfg`` if there are enough free cores. Return False
+        if it has to wait for the running trials.
+        """
+        if len(self.running_trials) >= self.parallel_trials:
+            return False
+        physical_cores, core_list = [], None
+        num_cores = self.multiobjective.get_num_cores(cfg) if self.core_pool is not None else None
+        if num_cores is not None:
+            allocated = self.core_pool.allocate(num_cores, cfg["use_logical_core"], cfg["use_all_nodes"])
+            if allocated is None and len(self.running_trials) > 0:
+                return False
+            if allocated is not None:
+                physical_cores, core_list = allocated
+        elif len(self.running_trials) > 0:
+            # The cores used by the trial are unknown, run it exclusively.
+            return False
+        trial = _Trial(idx, cfg, physical_cores, len(self.usr_objectives))
+        if self.core_pool is not None and core_list is None:
+            # Occupy the whole machine.
+            trial.physical_cores = list(self.core_pool.free_cores)
+            self.core_pool.free_cores = set()
+        cmd = self.multiobjective.get_cmd(cfg, core_list)
+        trial.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+        trial.start_time = time.time()
+        trial.reader = threading.Thread(target=trial.read_output, daemon=True)
+        trial.reader.start()
+        self.running_trials.append(trial)
+        return True
+
+    def _is_worse_than_median(self, trial):
+        if len(self.completed_reports) < MEDIAN_STOPPING_MIN_TRIALS:
+            return False
+        reports = trial.get_reports()
+        if len(reports) == 0:
+            return False
+        step = len(reports)
+        for i, objective in enumerate(self.usr_objectives):
+            values = [report[i] for report in reports]
+            best = max(values) if objective['higher_is_better'] else min(values)
+            running_averages = [np.mean([report[i] for report in completed[:step]])
+                                for completed in self.completed_reports if len(completed) > 0]
+            if len(running_averages) == 0:
+                return False
+            median = np.median(running_averages)
+            if not (median > best if objective['higher_is_better'] else median < best):
+                return False
+        return True
+
+    def _finish(self, trial, status):
+        trial.reader.join()
+        reports = trial.get_reports()
+        if status == "ok" and (trial.process.returncode != 0 or trial.parse_error is not None or len(reports) == 0):
+            status = "failed"
+        trial.status = status
+        if status == "ok":
+            trial.result = reports[-1]
+            self.completed_reports.append(reports)
+        if self.core_pool is not None:
+            self.core_pool.release(trial.physical_cores)
+        self.running_trials.remove(trial)
+
+    def wait(self):
+        r"""
+        Wait until at least one running trial finishes. Return the finished trials.
+        """
+        while True:
+            finished_trials = []
+            for trial in list(self.running_trials):
+                if trial.process.poll() is not None:
+                    self._finish(trial, "ok")
+                elif self.trial_timeout > 0 and time.time() - trial.start_time > self.trial_timeout:
+                    trial.kill()
+                    self._finish(trial, "timeout")
+                elif self.median_stopping and self._is_worse_than_median(trial):
+                    trial.kill()
+                    self._finish(trial, "stopped")
+                else:
+                    continue
+                finished_trials.append(trial)
+            if len(finished_trials) > 0:
+                return finished_trials
+            time.sleep(0.1)
+
+    def stop_all(self):
+        for trial in list(self.running_trials):
+            trial.kill()
+            self._finish(trial, "stopped")
+
+class RuntimeTrialScheduler(object):
+    r"""
+    Run the trials of in-process tuning one by one in the current process,
+    with the same interface as :class:`TrialScheduler`.
+    """
+    def __init__(self, runtime_objective):
+        self.runtime_objective = runtime_objective
+        # The trial run by try_start, it's regarded as running until wait collects it.
+        self.finished_trial = None
+
+    def num_running(self):
+        return 1 if self.finished_trial is not None else 0
+
+    def add_completed(self, reports):
+        pass
+
+    def try_start(self, idx, cfg):
+        if self.finished_trial is not None:
+            return False
+        trial = _Trial(idx, cfg, [], len(self.runtime_objective.usr_objectives))
+        try:
+            trial.result = self.runtime_objective.evaluate(cfg)
+            trial.status = "ok"
+        except Exception as e:
+            warnings.warn("Trial {} with configuration {} failed: {}".format(idx, cfg, e))
+            trial.status = "failed"
+        self.finished_trial = trial
+        return True
+
+    def wait(self):
+        finished_trial = self.finished_trial
+        self.finished_trial = None
+        return [finished_trial]
+
+    def stop_all(self):
+        self.finished_trial = None
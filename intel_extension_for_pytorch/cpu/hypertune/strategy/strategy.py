@@ -1,10 +1,12 @@
 #reference: https://github.com/intel/neural-compressor/blob/15477100cef756e430c8ef8ef79729f0c80c8ce6/neural_compressor/strategy/strategy.py
 import os
+import ast
 from abc import abstractmethod
 import csv 
 from collections import OrderedDict
 import click 
 from ..objective import MultiObjective
+from ..scheduler import TrialScheduler, RuntimeTrialScheduler
 
 STRATEGIES = {}
 
@@ -25,6 +27,9 @@ class TuneStrategy(object):
         self.usr_objectives = conf.usr_objectives
         
         self.max_trials = conf.execution_conf.tuning.max_trials
+        self.parallel_trials = conf.execution_conf.tuning.parallel_trials
+        self.trial_timeout = conf.execution_conf.tuning.trial_timeout
+        self.median_stopping = conf.execution_conf.tuning.median_stopping
         
         #### hyperparams ####
         self.hyperparam2searchspace = OrderedDict()
@@ -33,50 +38,132 @@ class TuneStrategy(object):
                 self.hyperparam2searchspace[hp] = self.conf.hyperparams[k][hp]
         self.hyperparams = list(self.hyperparam2searchspace.keys())
         tune_launcher = 'launcher' in self.conf.hyperparams 
+        tune_ipex = 'ipex' in self.conf.hyperparams 
         
         #### objective ####
-        self.multiobjective = MultiObjective(self.program, self.program_args, tune_launcher)
+        self.multiobjective = MultiObjective(self.program, self.program_args, tune_launcher, tune_ipex)
         
-        #### output ####
-        output_name = "record.csv"
-        log_name = os.path.join(self.conf.output_dir, output_name)
-        csvfile = open(log_name, "w", newline='')
-        self.tune_result_record = csv.writer(csvfile, delimiter=",")   
-        self.tune_result_record.writerow(list(self.hyperparam2searchspace.keys()) + [objective['name'] for objective in self.usr_objectives])
+        #### trials ####
+        if conf.runtime_objective is not None:
+            # in-process tuning, the trials are run one by one in the current process
+            self.scheduler = RuntimeTrialScheduler(conf.runtime_objective)
+        else:
+            self.scheduler = TrialScheduler(self.multiobjective, self.usr_objectives, self.parallel_trials, self.trial_timeout, self.median_stopping)
         
         self.best_tune_result = None
         self.best_tune_cfg = None
+        # the non-dominated (cfg, result) of all the trials
+        self.pareto_front = []
+        # (cfg, result) of all the finished trials, result is None if the trial failed
+        self.tune_history = []
+        # keys of the configurations tried, including the ones resumed from record.csv
+        self.tried_tune_cfgs = set()
+        
+        #### output ####
+        output_name = "record.csv"
+        log_name = os.path.join(self.conf.output_dir, output_name)
+        header = list(self.hyperparam2searchspace.keys()) + [objective['name'] for objective in self.usr_objectives] + ['status']
+        resumed = self.conf.tuning.resume and self._resume_tune_results(log_name, header)
+        self.csvfile = open(log_name, "a" if resumed else "w", newline='')
+        self.tune_result_record = csv.writer(self.csvfile, delimiter=",")   
+        if not resumed:
+            self.tune_result_record.writerow(header)
+            self.csvfile.flush()
         
     
     @abstractmethod
     def next_tune_cfg(self):
         raise NotImplementedError
         
+    def _get_tune_cfg_key(self, tune_cfg):
+        return tuple(str(tune_cfg[hp]) for hp in self.hyperparams)
+    
+    def _resume_tune_results(self, log_name, header):
+        # Load the trials recorded by an interrupted run, return False if there is nothing to resume.
+        if not os.path.exists(log_name):
+            return False
+        with open(log_name, "r", newline='') as csvfile:
+            rows = list(csv.reader(csvfile, delimiter=","))
+        if len(rows) == 0 or rows[0] != header:
+            click.secho(f"{log_name} is not recorded with the current configuration, tuning from scratch.", fg='red')
+            return False
+        
+        def _parse_val(hp, val):
+            for candidate in self.hyperparam2searchspace[hp]:
+                if str(candidate) == val:
+                    return candidate
+            return ast.literal_eval(val)
+        
+        num_objectives = len(self.usr_objectives)
+        for row in rows[1:]:
+            if len(row) != len(header):
+                # the last row may be incomplete if the run was killed while writing it
+                continue
+            tune_cfg = OrderedDict((hp, _parse_val(hp, val)) for hp, val in zip(self.hyperparams, row))
+            self.tried_tune_cfgs.add(self._get_tune_cfg_key(tune_cfg))
+            tune_result = None
+            if row[-1] == "ok":
+                tune_result = [float(val) for val in row[len(self.hyperparams):len(self.hyperparams) + num_objectives]]
+                self._update_best_tune_result(tune_result, tune_cfg)
+                self.scheduler.add_completed([tune_result])
+            self.tune_history.append((tune_cfg, tune_result))
+        click.secho(f"Resumed {len(self.tried_tune_cfgs)} trials from {log_name}", fg='green')
+        return True
+    
+    def _next_untried_tune_cfg(self):
+        for tune_cfg in self.next_tune_cfg():
+            key = self._get_tune_cfg_key(tune_cfg)
+            if key not in self.tried_tune_cfgs:
+                self.tried_tune_cfgs.add(key)
+                yield tune_cfg
+    
     def traverse(self):
         click.secho("Starting hypertuning...", fg='green')
-        trials_count = 0
+        trials_count = len(self.tried_tune_cfgs)
+        if self.best_tune_result is not None and self._stop(trials_count):
+            self._print_best_result()
+            return
         
-        for tune_cfg in self.next_tune_cfg():
-            trials_count += 1 
-            
-            click.secho(f"\nTune ", fg='green', nl=False)
-            click.secho(f"{trials_count}", fg='blue', nl=False)
-            
-            click.secho(f"\nCurrent configuration is: ", fg='green', nl=False)
-            click.secho(f"{tune_cfg}", fg='blue')
-
-            curr_tune_result = self.multiobjective.evaluate(tune_cfg)
-            
-            self._update_best_tune_result(curr_tune_result, tune_cfg) 
-            self._record_tune_result(curr_tune_result, tune_cfg) 
+        started_trials_count = trials_count
+        tune_cfgs = self._next_untried_tune_cfg()
+        pending_tune_cfg = None
+        try:
+            while True:
+                # start as many trials as the free cores allow
+                while started_trials_count < self.max_trials:
+                    if pending_tune_cfg is None:
+                        pending_tune_cfg = next(tune_cfgs, None)
+                    if pending_tune_cfg is None or not self.scheduler.try_start(started_trials_count + 1, pending_tune_cfg):
+                        break
+                    started_trials_count += 1
+                    
+                    click.secho(f"\nTune ", fg='green', nl=False)
+                    click.secho(f"{started_trials_count}", fg='blue', nl=False)
+                    
+                    click.secho(f"\nCurrent configuration is: ", fg='green', nl=False)
+                    click.secho(f"{pending_tune_cfg}", fg='blue')
+                    pending_tune_cfg = None
+                
+                if self.scheduler.num_running() == 0:
+                    break
+                
+                for trial in self.scheduler.wait():
+                    trials_count += 1
+                    
+                    self.tune_history.append((trial.cfg, trial.result))
+                    self._update_best_tune_result(trial.result, trial.cfg) 
+                    self._record_tune_result(trial.result, trial.cfg, trial.idx, trial.status) 
 
-            need_stop = self._stop(trials_count) 
+                    need_stop = self._stop(trials_count) 
 
-            if need_stop:
-                # case 1: accuracy goal is met 
-                # case 2: timeout reached (objective goal not met) 
-                self._print_best_result()
-                return  
+                    if need_stop:
+                        # case 1: accuracy goal is met 
+                        # case 2: timeout reached (objective goal not met) 
+                        self._print_best_result()
+                        return  
+        finally:
+            self.scheduler.stop_all()
+            self.csvfile.close()
                 
         # finished traversal 
         # case 3: finished traversal (objective goal not met)
@@ -90,40 +177,75 @@ class TuneStrategy(object):
         else:
             return src < dst
     
+    def _dominates(self, src, dst):
+        # src is not worse than dst for all objectives, and better for at least one objective
+        higher_is_better = [objective['higher_is_better'] for objective in self.usr_objectives]
+        return all([not self._compare(h, dst_val, src_val) for h, src_val, dst_val in zip(higher_is_better, src, dst)]) and \
+               any([self._compare(h, src_val, dst_val) for h, src_val, dst_val in zip(higher_is_better, src, dst)])
+    
+    def _get_num_met_targets(self, tune_result):
+        return sum([self._compare(objective['higher_is_better'], val, objective['target_val']) for objective, val in zip(self.usr_objectives, tune_result)])
+    
     def _update_best_tune_result(self, curr_tune_result, curr_tune_cfg):
-        if self.best_tune_result is None and self.best_tune_cfg is None:
-            # initial baseline 
-            self.best_tune_result = curr_tune_result
-            self.best_tune_cfg = curr_tune_cfg 
-        else:
-            # multi objective
-            if all([self._compare(higher_is_better, curr_val, best_val) for higher_is_better, curr_val, best_val in zip([objective['higher_is_better'] for objective in self.usr_objectives], curr_tune_result, self.best_tune_result)]):
-                self.best_tune_result = curr_tune_result
-                self.best_tune_cfg = curr_tune_cfg
+        if curr_tune_result is None:
+            # the trial failed, timed out or was stopped early
+            return
+        if any([self._dominates(result, curr_tune_result) for _, result in self.pareto_front]):
+            return
+        self.pareto_front = [(cfg, result) for cfg, result in self.pareto_front if not self._dominates(curr_tune_result, result)]
+        self.pareto_front.append((curr_tune_cfg, curr_tune_result))
+        # multi objective: the best is the configuration on the Pareto front meeting the most target values,
+        # then the one with the best value of the first objective
+        higher_is_better = self.usr_objectives[0]['higher_is_better']
+        best_tune_cfg, best_tune_result = self.pareto_front[0]
+        for cfg, result in self.pareto_front[1:]:
+            num_met_targets, best_num_met_targets = self._get_num_met_targets(result), self._get_num_met_targets(best_tune_result)
+            if num_met_targets > best_num_met_targets or \
+               (num_met_targets == best_num_met_targets and self._compare(higher_is_better, result[0], best_tune_result[0])):
+                best_tune_cfg, best_tune_result = cfg, result
+        self.best_tune_cfg = best_tune_cfg
+        self.best_tune_result = best_tune_result
      
-    def _record_tune_result(self, curr_tune_result, curr_tune_cfg):
-        for objective, val in zip(self.usr_objectives, curr_tune_result):
-            click.secho(f"{objective['name']}: {val}", fg='blue')
+    def _record_tune_result(self, curr_tune_result, curr_tune_cfg, trial_idx, status):
+        click.secho(f"\nResult of tune ", fg='green', nl=False)
+        click.secho(f"{trial_idx}", fg='blue', nl=False)
+        click.secho(f" ({status}): ", fg='green', nl=False)
+        click.secho(f"{curr_tune_cfg}", fg='blue')
+        if curr_tune_result is not None:
+            for objective, val in zip(self.usr_objectives, curr_tune_result):
+                click.secho(f"{objective['name']}: {val}", fg='blue')
         
-        click.secho(f"Best configuration is: ", fg='green', nl=False)
-        click.secho(f"{self.best_tune_cfg}", fg='blue')
-        for objective, val in zip(self.usr_objectives, self.best_tune_result):
-            click.secho(f"{objective['name']}: {val}", fg='blue')
+        if self.best_tune_result is not None:
+            click.secho(f"Best configuration is: ", fg='green', nl=False)
+            click.secho(f"{self.best_tune_cfg}", fg='blue')
+            for objective, val in zip(self.usr_objectives, self.best_tune_result):
+                click.secho(f"{objective['name']}: {val}", fg='blue')
             
-        curr_tune_cfg_val = [_ for _ in curr_tune_cfg.values()]
-        self.tune_result_record.writerow(curr_tune_cfg_val + curr_tune_result)
+        curr_tune_cfg_val = [curr_tune_cfg[hp] for hp in self.hyperparams]
+        curr_tune_result_val = curr_tune_result if curr_tune_result is not None else [''] * len(self.usr_objectives)
+        self.tune_result_record.writerow(curr_tune_cfg_val + curr_tune_result_val + [status])
+        # flush every trial, so that an interrupted tuning can be resumed
+        self.csvfile.flush()
     
     def _stop(self, trials_count):
-        if all([self._compare(higher_is_better, best_val, target_val) for higher_is_better, best_val, target_val in zip([objective['higher_is_better'] for objective in self.usr_objectives], self.best_tune_result, [objective['target_val'] for objective in self.usr_objectives])]):
+        if self.best_tune_result is not None and all([self._compare(higher_is_better, best_val, target_val) for higher_is_better, best_val, target_val in zip([objective['higher_is_better'] for objective in self.usr_objectives], self.best_tune_result, [objective['target_val'] for objective in self.usr_objectives])]):
             click.secho("\nFound configuration meeting the target values.", fg='red')
             return True 
-        elif trials_count == self.max_trials:
+        elif trials_count >= self.max_trials:
             click.secho("\nMax trials is reached, but didn't find configuration meeting the objective goal.", fg='red')
             return True 
         return False 
     
     def _print_best_result(self):
+        if self.best_tune_result is None:
+            click.secho("No trial finished successfully.", fg='red')
+            return
         click.secho(f"Best configuration found is: ", fg='green', nl=False)
         click.secho(f"{self.best_tune_cfg}", fg='blue')
         for objective, val in zip(self.usr_objectives, self.best_tune_result):
-            click.secho(f"{objective['name']}: {val}", fg='blue')
\ No newline at end of file
+            click.secho(f"{objective['name']}: {val}", fg='blue')
+        if len(self.usr_objectives) > 1:
+            click.secho(f"Pareto front of {len(self.pareto_front)} configurations found is: ", fg='green')
+            for cfg, result in self.pareto_front:
+                click.secho(f"{cfg}", fg='blue')
+                click.secho(", ".join([f"{objective['name']}: {val}" for objective, val in zip(self.usr_objectives, result)]), fg='blue')
\ No newline at end of file
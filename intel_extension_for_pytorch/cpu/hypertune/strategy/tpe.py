@@ -0,0 +1,119 @@
+import itertools
+import numpy as np
+from .strategy import strategy_registry, TuneStrategy
+
+@strategy_registry
+class TPETuneStrategy(TuneStrategy):
+    r"""
+    Tree-structured Parzen Estimator strategy. After some random trials, the
+    finished trials are split into good ones (the best ``gamma`` fraction) and
+    bad ones. The distributions of the hyperparameters in the good trials l(x)
+    and in the bad trials g(x) are estimated independently for each
+    hyperparameter, and the next configuration is the one maximizing
+    l(x) / g(x) among the candidates sampled from l(x).
+
+    With multiple objectives, the trials are ranked by non-dominated sorting,
+    i.e. the trials on the Pareto front are the best. Failed trials are
+    regarded as bad ones.
+    """
+    # number of random trials before the estimators are used
+    n_startup_trials = 10
+    # fraction of the finished trials regarded as good
+    gamma = 0.25
+    # number of candidates sampled from l(x) for each configuration
+    n_candidates = 24
+    # weight of the uniform prior in the estimators
+    prior_weight = 1.0
+    # search spaces up to this size are enumerated to pick random untried configurations
+    max_enumerated_space_size = 100000
+
+    def __init__(self, conf):
+        super().__init__(conf)
+        self.space_size = int(np.prod([len(self.hyperparam2searchspace[hp]) for hp in self.hyperparams]))
+
+    def _is_numeric(self, hp):
+        return all(isinstance(val, (int, float)) and not isinstance(val, bool) for val in self.hyperparam2searchspace[hp])
+
+    def _random_tune_cfg(self):
+        # random configuration which is not tried yet, None if it's not found
+        if self.space_size <= self.max_enumerated_space_size:
+            untried = [comb for comb in itertools.product(*(self.hyperparam2searchspace[hp] for hp in self.hyperparams))
+                       if tuple(str(val) for val in comb) not in self.tried_tune_cfgs]
+            if len(untried) == 0:
+                return None
+            return dict(zip(self.hyperparams, untried[np.random.choice(len(untried))]))
+        for _ in range(1000):
+            tune_cfg = {hp: self.hyperparam2searchspace[hp][np.random.choice(len(self.hyperparam2searchspace[hp]))] for hp in self.hyperparams}
+            if self._get_tune_cfg_key(tune_cfg) not in self.tried_tune_cfgs:
+                return tune_cfg
+        return None
+
+    def _get_pareto_ranks(self, tune_results):
+        # non-dominated sorting, rank 0 is the Pareto front
+        ranks = [None] * len(tune_results)
+        remaining = set(range(len(tune_results)))
+        rank = 0
+        while len(remaining) > 0:
+            front = [i for i in remaining if not any([self._dominates(tune_results[j], tune_results[i]) for j in remaining if j != i])]
+            for i in front:
+                ranks[i] = rank
+            remaining -= set(front)
+            rank += 1
+        return ranks
+
+    def _split_tune_history(self):
+        finished = [(cfg, result) for cfg, result in self.tune_history if result is not None]
+        failed = [cfg for cfg, result in self.tune_history if result is None]
+        ranks = self._get_pareto_ranks([result for _, result in finished])
+        order = sorted(range(len(finished)), key=lambda i: ranks[i])
+        n_good = int(np.ceil(self.gamma * len(finished)))
+        good = [finished[i][0] for i in order[:n_good]]
+        bad = [finished[i][0] for i in order[n_good:]] + failed
+        return good, bad
+
+    def _get_weights(self, hp, tune_cfgs):
+        # Parzen estimator of hp over its search space. Categorical hyperparameters count the
+        # observed values, numeric ones use a Gaussian kernel over the sorted values, whose
+        # bandwidth shrinks with more observations.
+        search_space = self.hyperparam2searchspace[hp]
+        weights = np.full(len(search_space), self.prior_weight / len(search_space))
+        if self._is_numeric(hp):
+            positions = np.argsort(np.argsort(search_space)).astype(float)
+            bandwidth = max(1.0, len(search_space) / (len(tune_cfgs) + 1))
+            for tune_cfg in tune_cfgs:
+                position = positions[search_space.index(tune_cfg[hp])]
+                kernel = np.exp(-0.5 * ((positions - position) / bandwidth) ** 2)
+                weights += kernel / kernel.sum()
+        else:
+            for tune_cfg in tune_cfgs:
+                weights[search_space.index(tune_cfg[hp])] += 1
+        return weights / weights.sum()
+
+    def _suggest_tune_cfg(self):
+        good, bad = self._split_tune_history()
+        good_weights = {hp: self._get_weights(hp, good) for hp in self.hyperparams}
+        bad_weights = {hp: self._get_weights(hp, bad) for hp in self.hyperparams}
+        best_tune_cfg, best_score = None, -float('inf')
+        for _ in range(self.n_candidates):
+            indices = {hp: np.random.choice(len(good_weights[hp]), p=good_weights[hp]) for hp in self.hyperparams}
+            tune_cfg = {hp: self.hyperparam2searchspace[hp][indices[hp]] for hp in self.hyperparams}
+            if self._get_tune_cfg_key(tune_cfg) in self.tried_tune_cfgs:
+                continue
+            score = sum([np.log(good_weights[hp][indices[hp]]) - np.log(bad_weights[hp][indices[hp]]) for hp in self.hyperparams])
+            if score > best_score:
+                best_tune_cfg, best_score = tune_cfg, score
+        if best_tune_cfg is None:
+            # all the candidates are tried already
+            return self._random_tune_cfg()
+        return best_tune_cfg
+
+    def next_tune_cfg(self):
+        while len(self.tried_tune_cfgs) < self.space_size:
+            if len(self.tune_history) < self.n_startup_trials:
+                tune_cfg = self._random_tune_cfg()
+            else:
+                tune_cfg = self._suggest_tune_cfg()
+            if tune_cfg is None:
+                return
+            yield tune_cfg
+        return
@@ -11,8 +11,12 @@ from argparse import ArgumentParser, REMAINDER
 from argparse import RawTextHelpFormatter
 import logging
 import psutil
+import signal
+import threading
+import time
 from datetime import datetime
 import intel_extension_for_pytorch.cpu.auto_ipex as auto_ipex
+from intel_extension_for_pytorch.cpu._cpu_topology import get_cpu_topology
 
 format_str = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 logging.basicConfig(level=logging.INFO, format=format_str)
@@ -130,21 +134,13 @@ class CPUinfo():
         if platform.system() == "Windows":
             raise RuntimeError("Windows platform is not supported!!!")
         elif platform.system() == "Linux":
-            args = ["lscpu", "--parse=CPU,Core,Socket,Node"]
-            env_lang = os.getenv('LANG', 'UNSET')
-            os.environ['LANG'] = 'C'
-            lscpu_info = subprocess.check_output(args, env=os.environ, universal_newlines=True).split("\n")
-            if env_lang == 'UNSET':
-                del os.environ['LANG']
-            else:
-                os.environ['LANG'] = env_lang
-
+            # Read the topology from sysfs instead of parsing the output of lscpu.
+            # The topology is memoized in the process and cached on disk across processes.
+            topology = get_cpu_topology()
+            self.topology = topology
             # Get information about  cpu, core, socket and node
-            for line in lscpu_info:
-                pattern = r"^([\d]+,[\d]+,[\d]+,[\d]?)"
-                regex_out = re.search(pattern, line)
-                if regex_out:
-                    self.cpuinfo.append(regex_out.group(1).strip().split(","))
+            for cpu in topology.cpus:
+                self.cpuinfo.append([str(cpu), str(topology.core_of[cpu]), str(topology.socket_of[cpu]), str(topology.node_of[cpu])])
             assert len(self.cpuinfo) > 0, "cpuinfo is empty"
             self.get_socket_info()
 
@@ -152,7 +148,7 @@ class CPUinfo():
         idx_active = 3
         if self.cpuinfo[0][idx_active] == '':
             idx_active = 2
-        self.nodes = int(max([line[idx_active] for line in self.cpuinfo])) + 1
+        self.nodes = max([int(line[idx_active]) for line in self.cpuinfo]) + 1
         self.node_physical_cores = []  # node_id is index
         self.node_logical_cores = []   # node_id is index
         self.physical_core_node_map = {}  # phyical core to numa node id
@@ -359,12 +355,248 @@ class Launcher():
                 self.set_env("KMP_BLOCKTIME", "1")
         self.logger_env("LD_PRELOAD")
 
+class _SupervisedInstance():
+    r"""
+     State of one instance run by InstanceSupervisor
+     """
+    def __init__(self, idx, cmd, log_name):
+        self.idx = idx
+        self.cmd = cmd
+        self.log_name = log_name
+        self.process = None
+        self.reader = None
+        self.restarts = 0
+        self.status = "pending"
+        self.returncode = None
+        self.throughput = None
+        self.latency = None
+
+class InstanceSupervisor():
+    r"""
+     Supervisor of long-running instances. The instances are monitored
+     concurrently, crashed instances are restarted with the same command (on
+     the same cores), SIGINT/SIGTERM/SIGHUP are forwarded to all instances, and
+     the throughput/latency printed by the instances are aggregated into a
+     periodic combined report.
+     """
+    def __init__(self, instances, max_restarts=3, restart_delay=1.0, report_interval=10.0,
+                 throughput_pattern=r"[Tt]hroughput[^\d]*(\d+(?:\.\d+)?)", latency_pattern=r"[Ll]atency[^\d]*(\d+(?:\.\d+)?)"):
+        self.instances = instances
+        self.max_restarts = max_restarts
+        self.restart_delay = restart_delay
+        self.report_interval = report_interval
+        self.throughput_regex = re.compile(throughput_pattern)
+        self.latency_regex = re.compile(latency_pattern)
+        self.lock = threading.Lock()
+        self.stop_signal = None
+
+    @staticmethod
+    def _parse_value(regex, line):
+        # A line which matches the pattern but has no valid number is skipped,
+        # it must not stop the reader thread, which would close the pipe of the instance.
+        match = regex.search(line)
+        if not match:
+            return None
+        try:
+            return float(match.group(1))
+        except (ValueError, IndexError):
+            return None
+
+    def _read_output(self, instance, process):
+        # Forward the output of the instance with a prefix, write it into the log file
+        # and parse the throughput/latency from it.
+        log_file = open(instance.log_name, "a") if instance.log_name else None
+        try:
+            for line in iter(process.stdout.readline, b''):
+                line = str(line, "utf-8", errors="replace")
+                sys.stdout.write("[instance {}] {}".format(instance.idx, line))
+                sys.stdout.flush()
+                if log_file is not None:
+                    log_file.write(line)
+                    log_file.flush()
+                throughput = self._parse_value(self.throughput_regex, line)
+                latency = self._parse_value(self.latency_regex, line)
+                with self.lock:
+                    if throughput is not None:
+                        instance.throughput = throughput
+                    if latency is not None:
+                        instance.latency = latency
+        finally:
+            process.stdout.close()
+            if log_file is not None:
+                log_file.close()
+
+    def _start(self, instance):
+        logger.info("[instance {}] {}".format(instance.idx, " ".join(instance.cmd)))
+        # Each instance runs in its own process group so that the signals are forwarded to its children as well.
+        instance.process = subprocess.Popen(instance.cmd, env=os.environ, stdout=subprocess.PIPE,
+                                            stderr=subprocess.STDOUT, start_new_session=True)
+        instance.reader = threading.Thread(target=self._read_output, args=(instance, instance.process), daemon=True)
+        instance.reader.start()
+        instance.status = "running"
+
+    def _forward_signal(self, signum, frame):
+        # Stop restarting instances; a second signal kills the instances.
+        sig = signal.SIGKILL if self.stop_signal is not None else signum
+        self.stop_signal = signum
+        logger.info("forwarding signal {} to all instances".format(signal.Signals(sig).name))
+        for instance in self.instances:
+            if instance.status == "running":
+                try:
+                    os.killpg(instance.process.pid, sig)
+                except ProcessLookupError:
+                    pass
+
+    def report(self):
+        with self.lock:
+            running = [instance for instance in self.instances if instance.status == "running"]
+            # The latest values of each instance, which are reset when the instance is restarted.
+            throughputs = [instance.throughput for instance in self.instances if instance.throughput is not None]
+            latencies = [instance.latency for instance in self.instances if instance.latency is not None]
+            total_restarts = sum([instance.restarts for instance in self.instances])
+            summary = "Supervisor report: {}/{} instances running, {} restarts".format(len(running), len(self.instances), total_restarts)
+            if len(throughputs) > 0:
+                summary += ", throughput {:.2f} (sum of {} instances)".format(sum(throughputs), len(throughputs))
+            if len(latencies) > 0:
+                summary += ", latency mean {:.2f} max {:.2f}".format(sum(latencies) / len(latencies), max(latencies))
+            logger.info(summary)
+            for instance in self.instances:
+                logger.info("  instance {}: {}, restarts {}, throughput {}, latency {}".format(
+                    instance.idx, instance.status, instance.restarts, instance.throughput, instance.latency))
+
+    def run(self):
+        r"""
+         Run the instances until all of them exit successfully, fail more than
+         max_restarts times or are stopped by a signal. Return the instances
+         which failed.
+         """
+        previous_handlers = {sig: signal.signal(sig, self._forward_signal) for sig in [signal.SIGINT, signal.SIGTERM, signal.SIGHUP]}
+        try:
+            for instance in self.instances:
+                self._start(instance)
+            next_report = time.time() + self.report_interval
+            pending_restarts = {}
+            while any([instance.status in ["running", "restarting"] for instance in self.instances]):
+                time.sleep(0.1)
+                now = time.time()
+                for instance in self.instances:
+                    if instance.status == "running" and instance.process.poll() is not None:
+                        instance.reader.join()
+                        instance.returncode = instance.process.returncode
+                        if instance.returncode == 0:
+                            instance.status = "finished"
+                        elif self.stop_signal is not None:
+                            instance.status = "stopped"
+                        elif self.max_restarts < 0 or instance.restarts < self.max_restarts:
+                            logger.warning("instance {} exited with code {}, restarting it on the same cores in {}s".format(
+                                instance.idx, instance.returncode, self.restart_delay))
+                            instance.status = "restarting"
+                            pending_restarts[instance.idx] = now + self.restart_delay
+                        else:
+                            logger.error("instance {} exited with code {} after {} restarts".format(
+                                instance.idx, instance.returncode, instance.restarts))
+                            instance.status = "failed"
+                    elif instance.status == "restarting":
+                        if self.stop_signal is not None:
+                            instance.status = "stopped"
+                        elif now >= pending_restarts[instance.idx]:
+                            instance.restarts += 1
+                            with self.lock:
+                                instance.throughput = None
+                                instance.latency = None
+                            self._start(instance)
+                if self.report_interval > 0 and now >= next_report:
+                    self.report()
+                    next_report = now + self.report_interval
+            self.report()
+        finally:
+            for sig, handler in previous_handlers.items():
+                signal.signal(sig, handler)
+        return [instance for instance in self.instances if instance.status == "failed"]
+
+def get_cache_domains(cores, topology):
+    r"""
+    Group the cores into cache domains, which are the cores sharing one L3
+    cache on one NUMA node. With sub-NUMA clustering (SNC), a socket sharing
+    one L3 cache is split into several domains by the NUMA nodes.
+    Returns a list of (node id, cores of the domain) sorted by the first core.
+    """
+    domains = {}
+    for core in sorted(cores):
+        key = (topology.node_of[core], tuple(topology.get_cache_group(core, "L3")))
+        domains.setdefault(key, []).append(core)
+    return sorted([(key[0], domain_cores) for key, domain_cores in domains.items()], key=lambda x: x[1][0])
+
+def plan_instance_cores(cores, ncore_per_instance, topology, pair_smt_siblings=False):
+    r"""
+    Plan the cores of each instance so that no instance straddles a cache
+    domain. The cores of one domain are packed into as many instances as
+    possible, and the cores left in a domain are not used.
+
+    If ``cores`` contains several threads of a physical core, these threads
+    are placed into the same instance by default. With ``pair_smt_siblings``,
+    each instance uses one thread per physical core, and it is followed by a
+    companion instance running on the SMT siblings of its cores.
+
+    Returns a list of (node id, cores of the instance).
+    """
+    plan = []
+    for node_id, domain_cores in get_cache_domains(cores, topology):
+        domain_core_set = set(domain_cores)
+        if pair_smt_siblings:
+            first_threads = [core for core in domain_cores if topology.is_first_thread(core)]
+            for i in range(len(first_threads) // ncore_per_instance):
+                instance_cores = first_threads[i * ncore_per_instance: (i + 1) * ncore_per_instance]
+                plan.append((node_id, instance_cores))
+                companion_cores = [sibling for core in instance_cores for sibling in topology.thread_siblings[core]
+                                   if sibling != core and sibling in domain_core_set]
+                if len(companion_cores) == ncore_per_instance:
+                    plan.append((node_id, companion_cores))
+        else:
+            # Keep the threads of a physical core adjacent, so that they are put into the same instance.
+            ordered_cores = []
+            placed_cores = set()
+            for core in domain_cores:
+                if core not in placed_cores:
+                    siblings = [sibling for sibling in topology.thread_siblings[core] if sibling in domain_core_set]
+                    ordered_cores.extend(siblings)
+                    placed_cores.update(siblings)
+            for i in range(len(ordered_cores) // ncore_per_instance):
+                plan.append((node_id, ordered_cores[i * ncore_per_instance: (i + 1) * ncore_per_instance]))
+    return plan
+
 class MultiInstanceLauncher(Launcher):
     r"""
      Launcher for single instance and multi-instance
      """
+    def plan_placement(self, args, cores):
+        '''
+        Plan the cores of each instance by cache domains and print the plan.
+        '''
+        topology = self.cpuinfo.topology
+        plan = plan_instance_cores(cores, args.ncore_per_instance, topology, args.pair_smt_siblings)
+        if len(plan) == 0:
+            logger.error("no cache domain has {} cores for one instance; please decrease --ncore_per_instance".format(args.ncore_per_instance))
+            exit(-1)
+        if len(plan) < args.ninstances:
+            logger.warning("only {} instances of {} cores fit into cache domains, but {} instances are requested; launching {} instances".format(len(plan), args.ncore_per_instance, args.ninstances, len(plan)))
+        else:
+            plan = plan[:args.ninstances]
+        args.ninstances = len(plan)
+        if args.instance_idx >= args.ninstances:
+            logger.error("--instance_idx {} is out of the {} planned instances".format(args.instance_idx, args.ninstances))
+            exit(-1)
+        domains = get_cache_domains(cores, topology)
+        logger.info("Cache aware placement: {} cache domain(s), {} instance(s) of {} cores".format(len(domains), len(plan), args.ncore_per_instance))
+        for domain_id, (node_id, domain_cores) in enumerate(domains):
+            logger.info("  domain {}: node {}, cores {}".format(domain_id, node_id, ",".join([str(core) for core in domain_cores])))
+        for i, (node_id, core_list) in enumerate(plan):
+            logger.info("  instance {}: node {}, cores {}".format(i, node_id, ",".join([str(core) for core in core_list])))
+        return [core_list for _, core_list in plan]
+
     def launch(self, args):
         processes = []
+        supervised_instances = []
         cores = []
         set_kmp_affinity = True
         enable_taskset = False
@@ -468,6 +700,10 @@ class MultiInstanceLauncher(Launcher):
                 cores = self.cpuinfo.get_all_physical_cores()
                 args.ncore_per_instance = len(cores) // args.ninstances
 
+        instance_cores = None
+        if args.cache_aware_placement:
+            instance_cores = self.plan_placement(args, cores)
+
         if args.ninstances > 1 and args.instance_idx != -1:
             logger.info("assigning {} cores for instance {}".format(args.ncore_per_instance, args.instance_idx))
 
@@ -495,7 +731,7 @@ class MultiInstanceLauncher(Launcher):
         os.environ["LAUNCH_CMD"] = "#"
 
         if args.auto_ipex:
-            args.program = auto_ipex.apply_monkey_patch(args.program, args.dtype, args.auto_ipex_verbose, args.disable_ipex_graph_mode)
+            args.program = auto_ipex.apply_monkey_patch_with_args(args)
 
         for i in range(args.ninstances):
             cmd = []
@@ -507,7 +743,9 @@ class MultiInstanceLauncher(Launcher):
                     cmd = ["taskset"]
 
                 cores = sorted(cores)
-                if args.instance_idx == -1:  # sequentially assign ncores_per_instance to ninstances
+                if instance_cores is not None:  # assign the cores planned by cache domains
+                    core_list = sorted(instance_cores[i if args.instance_idx == -1 else args.instance_idx])
+                elif args.instance_idx == -1:  # sequentially assign ncores_per_instance to ninstances
                     core_list = cores[i * args.ncore_per_instance: (
                         i + 1) * args.ncore_per_instance]
                 else:  # assign ncores_per_instance from instance_idx
@@ -550,6 +788,13 @@ class MultiInstanceLauncher(Launcher):
             cmd.extend(args.program_args)
             os.environ["LAUNCH_CMD"] += " ".join(cmd) + ",#"
             cmd_s = " ".join(cmd)
+            if args.supervise:
+                # The instances are started by the supervisor after all the commands are generated.
+                supervised_instances.append(_SupervisedInstance(i if args.instance_idx == -1 else args.instance_idx,
+                                                                cmd, log_name if args.log_path else None))
+                if args.instance_idx != -1:
+                    break
+                continue
             if args.log_path:
                 cmd_s = "{} 2>&1 | tee {}".format(cmd_s, log_name)
             logger.info(cmd_s)
@@ -564,6 +809,16 @@ class MultiInstanceLauncher(Launcher):
 
         os.environ["LAUNCH_CMD"] = os.environ["LAUNCH_CMD"][:-2]
         try:
+            if args.supervise:
+                supervisor = InstanceSupervisor(supervised_instances,
+                                                args.max_restarts,
+                                                args.restart_delay,
+                                                args.report_interval,
+                                                args.throughput_pattern,
+                                                args.latency_pattern)
+                failed_instances = supervisor.run()
+                if len(failed_instances) > 0:
+                    raise subprocess.CalledProcessError(returncode=failed_instances[0].returncode, cmd=" ".join(failed_instances[0].cmd))
             for process in processes:
                 process.wait()
                 if process.returncode != 0:
@@ -792,6 +1047,10 @@ def add_multi_instance_params(parser):
                        help="Cores per instance")
     group.add_argument("--skip_cross_node_cores", action='store_true', default=False,
                        help="If specified --ncore_per_instance, skips cross-node cores.")
+    group.add_argument("--cache_aware_placement", action='store_true', default=False,
+                       help="Place the cores of each instance inside one cache domain (cores sharing one L3 cache on one NUMA node, e.g. a sub-NUMA cluster), so that no instance straddles cache domains. The cores left in a domain are not used. The plan is printed.")
+    group.add_argument("--pair_smt_siblings", action='store_true', default=False,
+                       help="With --cache_aware_placement and --use_logical_core, use one thread per physical core in each instance and run a companion instance on the SMT siblings of its cores. By default, the threads of a physical core are placed into the same instance.")
     group.add_argument("--ninstances", metavar='\b', default=-1, type=int,
                        help="For multi-instance, you should give the cores number you used for per instance.")
     group.add_argument("--instance_idx", metavar='\b', default="-1", type=int,
@@ -817,6 +1076,20 @@ def add_multi_instance_params(parser):
     group.add_argument("--log_file_prefix", metavar='\b', default="run", type=str,
                        help="log file prefix")
 
+    group = parser.add_argument_group("Supervisor Parameters")
+    group.add_argument("--supervise", action='store_true', default=False,
+                       help="Supervise the instances for long-running workloads. The instances are monitored concurrently, crashed instances are restarted on the same cores, SIGINT/SIGTERM/SIGHUP are forwarded to all instances, and the throughput/latency printed by the instances are aggregated into a combined report.")
+    group.add_argument("--max_restarts", metavar='\b', default=3, type=int,
+                       help="With --supervise, the maximum number of restarts of each crashed instance. -1 means no limit.")
+    group.add_argument("--restart_delay", metavar='\b', default=1.0, type=float,
+                       help="With --supervise, the seconds to wait before restarting a crashed instance.")
+    group.add_argument("--report_interval", metavar='\b', default=10.0, type=float,
+                       help="With --supervise, the seconds between combined reports. 0 means only report when all the instances exit.")
+    group.add_argument("--throughput_pattern", metavar='\b', default=r"[Tt]hroughput[^\d]*(\d+(?:\.\d+)?)", type=str,
+                       help="With --supervise, the regular expression to get the throughput from the output lines of the instances. The first group is the value.")
+    group.add_argument("--latency_pattern", metavar='\b', default=r"[Ll]atency[^\d]*(\d+(?:\.\d+)?)", type=str,
+                       help="With --supervise, the regular expression to get the latency from the output lines of the instances. The first group is the value.")
+
 def add_kmp_iomp_params(parser):
 
     group = parser.add_argument_group("IOMP Parameters")
@@ -1,5 +1,7 @@
 from .task import Task
-from .cpupool import pin, CPUPool, is_runtime_ext_enabled
-from .multi_stream import MultiStreamModule, get_default_num_streams, \
-                        MultiStreamModuleHint, _MultiStreamBenchmarkModule
+from .cpupool import pin, CPUPool, is_runtime_ext_enabled, localize
+from .multi_stream import MultiStreamModule, get_default_num_streams, tune_num_streams, \
+                        MultiStreamModuleHint, MultiStreamModuleFuture, \
+                        _MultiStreamBenchmarkModule
+from .batching import DynamicBatcher
 from .runtime_utils import get_core_list_of_node_id
@@ -0,0 +1,261 @@
+import torch
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Union
+from .cpupool import CPUPool
+from .multi_stream import MultiStreamModule, MultiStreamModuleHint, \
+                        default_multi_stream_module_split_hint, \
+                        default_multi_stream_module_concat_hint
+
+def _get_batch_size_by_hint(hint_object, input_object):
+    # Return the size of the first input which will be split according to the hint.
+    type_arg = type(hint_object)
+    if type_arg in [list, tuple]:
+        for i in range(hint_object.__len__()):
+            batch_size = _get_batch_size_by_hint(hint_object[i], input_object[i])
+            if batch_size is not None:
+                return batch_size
+    elif type_arg in [dict]:
+        for key in hint_object:
+            batch_size = _get_batch_size_by_hint(hint_object[key], input_object[key])
+            if batch_size is not None:
+                return batch_size
+    elif type_arg is int:
+        return input_object.size(hint_object)
+    elif hint_object is not None:
+        assert False, "Get batch size failed, unsupport hint type of:{}".format(type_arg)
+    return None
+
+def _concat_by_hint(hint_object, input_objects):
+    # Concat the inputs of several requests into one input according to the hint.
+    # Objects not to be concatenated (hint of None) are taken from the first request.
+    type_arg = type(hint_object)
+    if type_arg in [list, tuple]:
+        return type_arg(_concat_by_hint(hint_object[i], [input_object[i] for input_object in input_objects])
+                        for i in range(hint_object.__len__()))
+    elif type_arg in [dict]:
+        return {key: _concat_by_hint(hint_object[key], [input_object[key] for input_object in input_objects])
+                for key in hint_object}
+    elif type_arg is int:
+        return torch.cat(input_objects, dim=hint_object)
+    elif hint_object is None:
+        return input_objects[0]
+    else:
+        assert False, "Concat by hint failed, unsupport hint type of:{}".format(type_arg)
+
+def _split_by_hint(hint_object, output_object, split_sizes):
+    # Split the output of one batch into the outputs of each request according to the hint.
+    # Objects not to be split (hint of None) are shared by all the requests.
+    type_arg = type(hint_object)
+    if type_arg in [list, tuple]:
+        splits = [_split_by_hint(hint_object[i], output_object[i], split_sizes) for i in range(hint_object.__len__())]
+        return [type_arg(split[j] for split in splits) for j in range(split_sizes.__len__())]
+    elif type_arg in [dict]:
+        splits = {key: _split_by_hint(hint_object[key], output_object[key], split_sizes) for key in hint_object}
+        return [{key: splits[key][j] for key in splits} for j in range(split_sizes.__len__())]
+    elif type_arg is int:
+        return list(torch.split(output_object, split_sizes, dim=hint_object))
+    elif hint_object is None:
+        return [output_object for _ in range(split_sizes.__len__())]
+    else:
+        assert False, "Split by hint failed, unsupport hint type of:{}".format(type_arg)
+
+class _BatchingRequest(object):
+    def __init__(self, args, kwargs, batch_size):
+        self.args = args
+        self.kwargs = kwargs
+        self.batch_size = batch_size
+        # Thread local status such as grad mode is not propagated into the batching thread.
+        # Record it at submission and apply it to the micro-batch.
+        self.grad_enabled = torch.is_grad_enabled()
+        self.future = Future()
+
+class DynamicBatcher(object):
+    r"""
+    DynamicBatcher collects individual inference requests into micro-batches
+    and runs each micro-batch through a
+    :class:`intel_extension_for_pytorch.cpu.runtime.MultiStreamModule`.
+
+    Requests are submitted one at a time from any Python thread or asyncio
+    event loop. A background thread waits for the first pending request and
+    then keeps collecting more requests until either ``max_batch_size``
+    samples are gathered or ``max_wait_us`` microseconds have elapsed since
+    the first request arrived. The requests are concatenated according to
+    ``input_split_hint``, split across the streams of the ``MultiStreamModule``,
+    and the concatenated output is scattered back to each request according
+    to ``output_concat_hint``.
+
+    Inputs with hint of ``None`` are not concatenated. The value of the first
+    request in the micro-batch is used for all the requests in it, so these
+    inputs are expected to be the same for all the requests.
+
+    Args:
+        model (torch.jit.ScriptModule or torch.nn.Module): The input model.
+        num_streams (Union[int, str]): Number of instances (int) or "AUTO" (str).
+            Refer to :class:`intel_extension_for_pytorch.cpu.runtime.MultiStreamModule`.
+        cpu_pool (intel_extension_for_pytorch.cpu.runtime.CPUPool): An
+            intel_extension_for_pytorch.cpu.runtime.CPUPool object, contains
+            all CPU cores used to run multi-stream inference. Default to all the
+            cores available for current process.
+        max_batch_size (int): The maximum number of samples in one micro-batch.
+            A single request larger than ``max_batch_size`` is run as one
+            micro-batch by itself.
+        max_wait_us (int): The maximum time in microseconds to wait for more
+            requests after the first request of a micro-batch arrives.
+        input_split_hint (MultiStreamModuleHint): Hint about how to concat the
+            inputs of requests and split them into streams.
+        output_concat_hint (MultiStreamModuleHint): Hint about how to concat
+            the outputs of streams and scatter them back to requests.
+
+    Returns:
+        intel_extension_for_pytorch.cpu.runtime.DynamicBatcher: Generated
+        intel_extension_for_pytorch.cpu.runtime.DynamicBatcher object.
+
+    :meta public:
+    """
+
+    def __init__(self,
+                model,
+                num_streams: Union[int, str] = "AUTO",
+                cpu_pool: CPUPool = None,
+                max_batch_size: int = 64,
+                max_wait_us: int = 1000,
+                input_split_hint: MultiStreamModuleHint = default_multi_stream_module_split_hint,
+                output_concat_hint: MultiStreamModuleHint = default_multi_stream_module_concat_hint):
+        assert isinstance(max_batch_size, int) and max_batch_size > 0, "Input of max_batch_size must be a positive int"
+        assert max_wait_us >= 0, "Input of max_wait_us must be non-negative"
+        if cpu_pool is None:
+            cpu_pool = CPUPool()
+        self.module = MultiStreamModule(model,
+                                        num_streams=num_streams,
+                                        cpu_pool=cpu_pool,
+                                        concat_output=True,
+                                        input_split_hint=input_split_hint,
+                                        output_concat_hint=output_concat_hint)
+        self.max_batch_size = max_batch_size
+        self.max_wait_us = max_wait_us
+        self.input_split_hint = input_split_hint
+        self.output_concat_hint = output_concat_hint
+
+        self.requests = queue.Queue()
+        # The first request of the next micro-batch, which has been taken from the queue
+        # but can't be put into the current micro-batch due to max_batch_size.
+        self.pending_request = None
+        self.stopped = False
+        self.lock = threading.Lock()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, *args, **kwargs):
+        r"""
+        Submit one request asynchronously.
+
+        Returns:
+            concurrent.futures.Future: The future of the output of this request.
+        """
+        batch_size = _get_batch_size_by_hint(self.input_split_hint.args, args)
+        if batch_size is None:
+            batch_size = _get_batch_size_by_hint(self.input_split_hint.kwargs, kwargs)
+        assert batch_size is not None, "DynamicBatcher needs at least one input to be split by input_split_hint"
+        request = _BatchingRequest(args, kwargs, batch_size)
+        with self.lock:
+            if self.stopped:
+                raise RuntimeError("submit request on stopped DynamicBatcher")
+            self.requests.put(request)
+        return request.future
+
+    def __call__(self, *args, **kwargs):
+        # Sync execution: block until the micro-batch containing this request finishes.
+        return self.submit(*args, **kwargs).result()
+
+    async def async_call(self, *args, **kwargs):
+        r"""
+        Submit one request and await its output inside an asyncio event loop.
+        """
+        return await asyncio.wrap_future(self.submit(*args, **kwargs))
+
+    def _collect_requests(self):
+        # Block until the first request arrives, then collect more requests
+        # until max_batch_size or max_wait_us is reached.
+        if self.pending_request is not None:
+            request = self.pending_request
+            self.pending_request = None
+        else:
+            request = self.requests.get()
+        if request is None:
+            return []
+        batch = [request]
+        batch_size = request.batch_size
+        deadline = time.perf_counter() + self.max_wait_us / 1e6
+        while batch_size < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                request = self.requests.get(block=timeout > 0, timeout=timeout if timeout > 0 else None)
+            except queue.Empty:
+                break
+            if request is None:
+                # Stop signal, finish the current micro-batch first.
+                self.requests.put(None)
+                break
+            if batch_size + request.batch_size > self.max_batch_size:
+                self.pending_request = request
+                break
+            batch.append(request)
+            batch_size += request.batch_size
+        return batch
+
+    def _run_batch(self, batch):
+        args = _concat_by_hint(self.input_split_hint.args, [request.args for request in batch])
+        kwargs = _concat_by_hint(self.input_split_hint.kwargs, [request.kwargs for request in batch])
+        with torch.set_grad_enabled(batch[0].grad_enabled):
+            output = self.module(*args, **kwargs)
+        split_sizes = [request.batch_size for request in batch]
+        return _split_by_hint(self.output_concat_hint.args[0], output, split_sizes)
+
+    def _run(self):
+        while True:
+            batch = self._collect_requests()
+            if batch.__len__() == 0:
+                return
+            try:
+                outputs = self._run_batch(batch)
+            except BaseException as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                if isinstance(e, Exception):
+                    continue
+                # Such as SystemExit, the batching thread exits. Fail the requests
+                # not run yet, so that no caller blocks on a future forever.
+                with self.lock:
+                    self.stopped = True
+                    pending = [self.pending_request] if self.pending_request is not None else []
+                    self.pending_request = None
+                    while not self.requests.empty():
+                        pending.append(self.requests.get())
+                for request in pending:
+                    if request is not None:
+                        request.future.set_exception(e)
+                raise
+            for request, output in zip(batch, outputs):
+                request.future.set_result(output)
+
+    def close(self):
+        r"""
+        Stop accepting new requests. The requests already submitted are
+        finished before the batching thread exits.
+        """
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            self.requests.put(None)
+        self.worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
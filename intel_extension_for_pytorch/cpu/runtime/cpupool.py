@@ -1,4 +1,6 @@
 import torch
+import copy
+import itertools
 import functools
 import warnings
 import numpy as np
@@ -92,3 +94,41 @@ def is_runtime_ext_enabled():
     """
 
     return ipex._C.is_runtime_ext_enabled() == 1
+
+def localize(obj, cpu_pool: CPUPool, replicate: bool = True):
+    r"""
+    Place the memory of a tensor, or of the parameters and buffers of a
+    module, on the numa node(s) of the CPU cores in ``cpu_pool``.
+
+    The memory is allocated and first touched by the thread pinned to
+    ``cpu_pool``, so that with the default first-touch policy of Linux the
+    pages are placed on the numa node(s) local to these cores. Memory reused
+    from the allocator which has been touched before may stay on its original
+    node, so this is best effort.
+
+    Note: constants folded into the graph of a frozen ``torch.jit.ScriptModule``
+    are not parameters or buffers. Localize the module before
+    ``torch.jit.freeze`` to place them.
+
+    Args:
+        obj (torch.Tensor, torch.nn.Module or torch.jit.ScriptModule): The
+            tensor or module to place.
+        cpu_pool (intel_extension_for_pytorch.cpu.runtime.CPUPool): The CPU
+            pool whose numa node(s) the memory is placed on.
+        replicate (bool): If True, a copy of the module is created on the numa
+            node(s) and the input module is untouched. Otherwise, the
+            parameters and buffers of the input module are re-allocated in
+            place. A tensor is always copied.
+
+    Returns:
+        The localized tensor or module.
+    """
+
+    with pin(cpu_pool), torch.no_grad():
+        if isinstance(obj, torch.Tensor):
+            return obj.clone()
+        if replicate:
+            return copy.deepcopy(obj)
+        for tensor in itertools.chain(obj.parameters(), obj.buffers()):
+            tensor.data = tensor.data.clone()
+        return obj
@@ -1,11 +1,19 @@
+import os
 import torch
 import torch.nn as nn
 from typing import Union, Optional
 import intel_extension_for_pytorch._C as core
-from .cpupool import CPUPool
+from .cpupool import CPUPool, localize
 from .task import Task
 import copy
+import itertools
+import threading
+import time
+import concurrent.futures
 import warnings
+from .runtime_utils import get_node_id_of_cores
+from ...utils._disk_cache import get_cache_dir, get_hash, get_model_signature, \
+                                 get_inputs_signature, load_json_cache, update_json_cache
 
 class MultiStreamModuleHint(object):
     r"""
@@ -35,11 +43,261 @@ class MultiStreamModuleHint(object):
 default_multi_stream_module_split_hint = MultiStreamModuleHint(0)
 default_multi_stream_module_concat_hint = MultiStreamModuleHint(0)
 
+def _get_split_ranges(split_size, num_streams):
+    # Static split policy of MultiStreamModule, return (start, length) of each used stream.
+    #   * If split_size is larger than num_streams and not divisible, the first
+    #     remainder streams will have (mini_batch + 1) input size.
+    #   * If split_size is less than num_streams, only the first split_size streams
+    #     are used with mini_batch as 1.
+    batch_per_instance = split_size // num_streams
+    if batch_per_instance >= 1:
+        used_num_streams = num_streams
+        instance_need_extra_input = split_size % num_streams
+    else:
+        batch_per_instance = 1
+        used_num_streams = split_size
+        instance_need_extra_input = 0
+    split_ranges = []
+    start = 0
+    for stream_id in range(used_num_streams):
+        length = batch_per_instance + 1 if stream_id < instance_need_extra_input else batch_per_instance
+        split_ranges.append((start, length))
+        start += length
+    return split_ranges
+
+def _compile_split_hint(hint_object):
+    # Compile the hint once into a function which generates the input of one stream
+    # from the raw input, the split start idx and the split length.
+    type_arg = type(hint_object)
+    if type_arg in [list, tuple]:
+        fns = [_compile_split_hint(hint) for hint in hint_object]
+        return lambda x, start, length: type_arg(fn(x[i], start, length) for i, fn in enumerate(fns))
+    elif type_arg in [dict]:
+        fns = {key: _compile_split_hint(hint_object[key]) for key in hint_object}
+        return lambda x, start, length: {key: fn(x[key], start, length) for key, fn in fns.items()}
+    elif type_arg is int:
+        dim = hint_object
+        # narrow along dim 0 doesn't create new tensor, same as slicing.
+        return lambda x, start, length: x.narrow(dim, start, length)
+    elif hint_object is None:
+        return lambda x, start, length: x
+    else:
+        assert False, "Compile input split hint failed, unsupport input hint type of:{}".format(type_arg)
+
+def _compile_hint_leaves(hint_object, path=()):
+    # Return the (path, dim) of each leaf to be split or concat.
+    type_arg = type(hint_object)
+    if type_arg in [list, tuple]:
+        return [leaf for i in range(hint_object.__len__()) for leaf in _compile_hint_leaves(hint_object[i], path + (i,))]
+    elif type_arg in [dict]:
+        return [leaf for key in hint_object for leaf in _compile_hint_leaves(hint_object[key], path + (key,))]
+    elif type_arg is int:
+        return [(path, hint_object)]
+    return []
+
+def _get_by_path(input_object, path):
+    for idx_or_key in path:
+        input_object = input_object[idx_or_key]
+    return input_object
+
+def _compile_concat_hint(hint_object):
+    # Compile the output hint once into the concat dim of each flattened output
+    # tensor and a function rebuilding the output structure from the flattened tensors.
+    # Return None if the hint contains object which can't be written into a buffer.
+    type_arg = type(hint_object)
+    if type_arg in [list, tuple]:
+        children = [_compile_concat_hint(hint) for hint in hint_object]
+        if any(child is None for child in children):
+            return None
+        dims = [dim for child in children for dim in child[0]]
+        rebuilds = [child[1] for child in children]
+        return dims, lambda it: type_arg(rebuild(it) for rebuild in rebuilds)
+    elif type_arg is int:
+        return [hint_object], lambda it: next(it)
+    return None
+
+def _flatten_output(hint_object, output_object):
+    if type(hint_object) in [list, tuple]:
+        return [tensor for i in range(hint_object.__len__()) for tensor in _flatten_output(hint_object[i], output_object[i])]
+    return [output_object]
+
 def get_default_num_streams(cpu_pool):
     # One core per stream usually brings better overall throughput than other configurations.
     # Therefore, we heuristically make one core per stream the default here.
     return cpu_pool.core_ids.__len__()
 
+def get_candidate_num_streams(cpu_pool, max_num_streams=None):
+    r"""
+    Candidate numbers of streams to calibrate for ``cpu_pool``: divisors of the
+    number of cores, for which each stream either stays inside one numa node or
+    consists of whole numa nodes.
+
+    Args:
+        cpu_pool (intel_extension_for_pytorch.cpu.runtime.CPUPool): The CPU pool.
+        max_num_streams (int): Upper bound of the candidates, such as the batch size.
+
+    Returns:
+        list: Candidate numbers of streams in ascending order.
+    """
+    core_list = cpu_pool.core_ids
+    node_ids = get_node_id_of_cores(core_list)
+    num_cores_of_node = {}
+    for node_id in node_ids:
+        num_cores_of_node[node_id] = num_cores_of_node.get(node_id, 0) + 1
+    candidates = []
+    for num_streams in range(1, core_list.__len__() + 1):
+        if core_list.__len__() % num_streams != 0:
+            continue
+        if max_num_streams is not None and num_streams > max_num_streams:
+            break
+        numa_aligned = True
+        for start, length in _get_split_ranges(core_list.__len__(), num_streams):
+            stream_node_ids = node_ids[start:start + length]
+            if len(set(stream_node_ids)) > 1 and \
+                any(stream_node_ids.count(node_id) != num_cores_of_node[node_id] for node_id in set(stream_node_ids)):
+                # The stream crosses numa nodes with part of their cores.
+                numa_aligned = False
+                break
+        if numa_aligned:
+            candidates.append(num_streams)
+    return candidates
+
+def tune_num_streams(model,
+                    example_inputs,
+                    cpu_pool: CPUPool = None,
+                    input_split_hint: MultiStreamModuleHint = default_multi_stream_module_split_hint,
+                    output_concat_hint: MultiStreamModuleHint = default_multi_stream_module_concat_hint,
+                    candidates: list = None,
+                    warmup_iterations: int = 5,
+                    iterations: int = 20,
+                    use_cache: bool = True):
+    r"""
+    Calibrate the number of streams of ``MultiStreamModule`` with the example
+    inputs. Each candidate number of streams is measured with a short
+    benchmark, and the one with the highest throughput is returned.
+
+    The winning configuration is cached on disk, keyed by the model structure,
+    the signature of the example inputs and the cores of ``cpu_pool``, so later
+    processes skip the calibration. The cache file is
+    ``multi_stream_auto.json`` under ``$IPEX_CACHE_DIR``
+    (``~/.cache/intel_extension_for_pytorch`` by default).
+
+    Args:
+        model (torch.jit.ScriptModule or torch.nn.Module): The input model.
+        example_inputs (tuple or torch.Tensor): Inputs to run the calibration.
+            Should have the batch size used in deployment.
+        cpu_pool (intel_extension_for_pytorch.cpu.runtime.CPUPool): The CPU
+            pool to create ``MultiStreamModule``. Default to all the cores
+            available for current process.
+        input_split_hint (MultiStreamModuleHint): Hint about how to split the inputs.
+        output_concat_hint (MultiStreamModuleHint): Hint about how to concat the outputs.
+        candidates (list): Numbers of streams to calibrate. Default to the
+            result of ``get_candidate_num_streams``.
+        warmup_iterations (int): Number of iterations to warm up each candidate.
+        iterations (int): Number of iterations to measure each candidate.
+        use_cache (bool): Whether to read and write the on-disk cache.
+
+    Returns:
+        int: The number of streams with the highest throughput.
+    """
+    if cpu_pool is None:
+        cpu_pool = CPUPool()
+    if not isinstance(example_inputs, tuple):
+        example_inputs = (example_inputs,)
+
+    cache_file = os.path.join(get_cache_dir(), "multi_stream_auto.json")
+    cache_key = get_hash(get_model_signature(model),
+                         get_inputs_signature(example_inputs),
+                         cpu_pool.core_ids,
+                         input_split_hint.args, input_split_hint.kwargs,
+                         output_concat_hint.args, output_concat_hint.kwargs)
+    if use_cache:
+        num_streams = load_json_cache(cache_file).get(cache_key)
+        if isinstance(num_streams, int) and 0 < num_streams <= cpu_pool.core_ids.__len__():
+            return num_streams
+
+    if candidates is None:
+        batch_size = _get_split_size_by_hint(input_split_hint.args, example_inputs)
+        candidates = get_candidate_num_streams(cpu_pool, max_num_streams=batch_size)
+    assert candidates.__len__() > 0, "No candidate number of streams to calibrate"
+
+    best_num_streams = None
+    best_latency = None
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for num_streams in candidates:
+            multi_stream_model = MultiStreamModule(model,
+                                                num_streams=num_streams,
+                                                cpu_pool=cpu_pool,
+                                                input_split_hint=input_split_hint,
+                                                output_concat_hint=output_concat_hint)
+            for _ in range(warmup_iterations):
+                multi_stream_model(*example_inputs)
+            start = time.perf_counter()
+            for _ in range(iterations):
+                multi_stream_model(*example_inputs)
+            # Same batch for each candidate, so the lowest latency means the highest throughput.
+            latency = (time.perf_counter() - start) / iterations
+            if best_latency is None or latency < best_latency:
+                best_num_streams = num_streams
+                best_latency = latency
+            del multi_stream_model
+
+    if use_cache:
+        update_json_cache(cache_file, cache_key, best_num_streams)
+    return best_num_streams
+
+def _get_split_size_by_hint(hint_object, input_object):
+    # Size of the first input to be split, None if no input is split.
+    for path, dim in _compile_hint_leaves(hint_object):
+        return _get_by_path(input_object, path).size(dim)
+    return None
+
+class _MultiStreamForwardStatus(object):
+    # The status to split inputs for one forward invoking:
+    #   * split_size: will be calculated by input batch size and num_streams.
+    #   * used_num_streams: is the num_streams actually used by this forward invoking.
+    #       It may less than num_streams when bs is less than num_streams.
+    #   * current_split_start_idx: used to record the split start idx for current stream.
+    #   * current_split_end_idx: used to record the split end idx for current stream.
+    def __init__(self, num_streams):
+        self.num_streams = num_streams
+        self.split_size = None
+        self.used_num_streams = num_streams
+        self.current_split_start_idx = 0
+        self.current_split_end_idx = 0
+
+    def update_split_idx(self, stream_id):
+        # Set current_split_start_idx to last current_split_end_idx
+        self.current_split_start_idx = self.current_split_end_idx
+        # Calculate current_split_end_idx to new value
+        if stream_id < self.instance_need_extra_input:
+            # Tail case, when the input image size larger than num_streams and not divisible,
+            # the first remainder streams will have (mini_batch + 1) input size.
+            self.current_split_end_idx = self.current_split_end_idx + (self.batch_per_instance + 1)
+        else:
+            # Input image size divisible of num_streams or input image size less than num_streams.
+            self.current_split_end_idx = self.current_split_end_idx + self.batch_per_instance
+
+    def init_forward_status(self, split_size, stream_id):
+        # This function should be invoke only once at each forward
+        self.split_size = split_size
+        # Ensure each instance has input offload
+        self.batch_per_instance = self.split_size // self.num_streams
+        if self.batch_per_instance >= 1:
+            # The input batchsize larger or equal to num_streams.
+            self.used_num_streams = self.num_streams
+            # If input batchsize larger than num_streams and not divisible,
+            # the first remainder streams will have (mini_batch + 1) input size.
+            self.instance_need_extra_input = self.split_size % self.num_streams
+        else:
+            # The input batchsize less than num_streams,
+            # only the first batchsize stream will have mini_batch(1) input.
+            self.batch_per_instance = 1
+            self.used_num_streams = self.split_size
+            self.instance_need_extra_input = 0
+        self.update_split_idx(stream_id)
+
 class MultiStreamModule(nn.Module):
     r"""
     MultiStreamModule supports inference with multi-stream throughput mode.
@@ -77,6 +335,34 @@ class MultiStreamModule(nn.Module):
             how to split the inputs.
         output_concat_hint (MultiStreamModuleHint): Hint to MultiStreamModule about
             how to concat the outputs.
+        preallocate_output (bool): A flag indicates whether each stream writes
+            its output directly into a slice of a preallocated output buffer.
+            The split and concat plan is compiled once from the hints, and the
+            copy of each stream's output is done by the stream itself instead
+            of ``torch.cat`` in the main thread. The output shapes are recorded
+            at the first batch of each input shape. The default value is False.
+            Note: it requires ``concat_output`` to be True, and the output hint
+            to only contain int inside (nested) tuple or list.
+        schedule (str): How the batch is split across streams. "static" (the
+            default) splits the batch into one piece per stream as described
+            above. "dynamic" cuts the batch into chunks of ``chunk_size``, and
+            each stream pulls the next chunk once it finishes the previous one,
+            so all the streams finish together even if the chunks have uneven
+            cost. With ``concat_output`` of False, the output of each chunk is
+            returned in a list. Note: it doesn't support ``preallocate_output``.
+        chunk_size (int): The size of each chunk along the split dim for
+            ``schedule`` of "dynamic". Default to cut the batch into 4 chunks
+            per stream.
+        numa_local (bool): If True, the model is replicated once for each numa
+            node of ``cpu_pool`` with its parameters and buffers placed on this
+            node, and the streams on the node share this replica. It avoids
+            reading the weights across numa nodes when ``cpu_pool`` spans
+            several nodes. The default value is False.
+        example_inputs (tuple or torch.Tensor): If provided with ``num_streams``
+            of "AUTO", the number of streams is calibrated with these inputs by
+            ``tune_num_streams`` instead of the heuristic default, and the
+            result is cached on disk per model and input shape. The default
+            value is None.
 
     Returns:
         intel_extension_for_pytorch.cpu.runtime.MultiStreamModule: Generated
@@ -90,7 +376,12 @@ class MultiStreamModule(nn.Module):
                 cpu_pool: CPUPool = CPUPool(),
                 concat_output: bool = True,
                 input_split_hint: MultiStreamModuleHint = default_multi_stream_module_split_hint,
-                output_concat_hint: MultiStreamModuleHint = default_multi_stream_module_concat_hint):
+                output_concat_hint: MultiStreamModuleHint = default_multi_stream_module_concat_hint,
+                preallocate_output: bool = False,
+                schedule: str = "static",
+                chunk_size: int = None,
+                numa_local: bool = False,
+                example_inputs = None):
         super(MultiStreamModule, self).__init__()
         assert type(cpu_pool) is CPUPool, "Input of cpu_pool must be provided with type of ipex.cpu.runtime.CPUPool"
         if not isinstance(model, torch.jit.ScriptModule):
@@ -101,7 +392,15 @@ class MultiStreamModule(nn.Module):
         if isinstance(num_streams, str):
             # For str input of num_streams, it must be "auto"
             if num_streams.upper() == "AUTO":
-                self.num_streams = get_default_num_streams(cpu_pool) # The default selected value when auto selection is on.
+                if example_inputs is not None:
+                    # Calibrate the number of streams with the example inputs.
+                    self.num_streams = tune_num_streams(model,
+                                                        example_inputs,
+                                                        cpu_pool=cpu_pool,
+                                                        input_split_hint=input_split_hint,
+                                                        output_concat_hint=output_concat_hint)
+                else:
+                    self.num_streams = get_default_num_streams(cpu_pool) # The default selected value when auto selection is on.
             else:
                 assert False, "Input of num_streams must be Number of instances or string \"AUTO\""
         else:
@@ -118,6 +417,10 @@ class MultiStreamModule(nn.Module):
         else:
             self.cores_per_instance = self.core_list.__len__() // self.num_streams
             num_stream_allocated_extra_core = self.core_list.__len__() % self.num_streams
+            if numa_local:
+                # Replicate the model once per numa node, shared by all the streams on this node.
+                node_ids = get_node_id_of_cores(self.core_list)
+                numa_local_models = {}
             self.tasks = []
             start_core_list_idx = 0
             end_core_list_idx = 0
@@ -128,72 +431,69 @@ class MultiStreamModule(nn.Module):
                     end_core_list_idx += (self.cores_per_instance + 1)
                 else:
                     end_core_list_idx += self.cores_per_instance
-                self.tasks.append(Task(model, CPUPool(self.core_list[start_core_list_idx:end_core_list_idx])))
+                stream_model = model
+                if numa_local:
+                    node_id = node_ids[start_core_list_idx]
+                    if node_id not in numa_local_models:
+                        node_core_list = [core_id for core_id, core_node_id in zip(self.core_list, node_ids) if core_node_id == node_id]
+                        numa_local_models[node_id] = localize(model, CPUPool(node_core_list))
+                    stream_model = numa_local_models[node_id]
+                self.tasks.append(Task(stream_model, CPUPool(self.core_list[start_core_list_idx:end_core_list_idx])))
                 start_core_list_idx = end_core_list_idx
         self.concat_output = concat_output
         self.input_split_hint = input_split_hint
         self.output_concat_hint = output_concat_hint
 
-        # Deep copy the input structure for each stream based on input_split_hint.
-        # Each streams_input will be recursively visited and set to the split value in place.
-        self.args_streams_input = []
-        self.kwargs_streams_input = []
-        for _ in range(self.num_streams):
-            self.args_streams_input.append(copy.deepcopy(self.input_split_hint.args))
-            self.kwargs_streams_input.append(copy.deepcopy(self.input_split_hint.kwargs))
-
-        # Deep copy the output structure based on output_concat_hint.
-        # self.output will be recursively visited and set to the concat value in place.
-        self.output = copy.deepcopy(self.output_concat_hint)
-
-        # Init status needed for forward
-        self.reset_forward_status()
+        # Per thread structures of stream inputs and output reused by forward.
+        # Each thread gets its own copy so that several threads can run forward concurrently.
+        self.thread_local_status = threading.local()
+
+        assert schedule in ["static", "dynamic"], "Input of schedule must be \"static\" or \"dynamic\""
+        assert chunk_size is None or chunk_size > 0, "Input of chunk_size must be a positive int"
+        self.schedule = schedule if self.num_streams > 1 else "static"
+        self.chunk_size = chunk_size
+        self.preallocate_output = preallocate_output and self.num_streams > 1
+        if self.preallocate_output or self.schedule == "dynamic":
+            # Precompile the plan to split the inputs once for the hints.
+            self.split_args_plan = _compile_split_hint(self.input_split_hint.args)
+            self.split_kwargs_plan = _compile_split_hint(self.input_split_hint.kwargs)
+            self.split_leaves = [(0, path, dim) for path, dim in _compile_hint_leaves(self.input_split_hint.args)] + \
+                                [(1, path, dim) for path, dim in _compile_hint_leaves(self.input_split_hint.kwargs)]
+            assert self.split_leaves.__len__() > 0, "MultiStreamModule requires at least one input to be split"
+        if self.schedule == "dynamic":
+            assert not self.preallocate_output, "preallocate_output is not supported with schedule of \"dynamic\""
+            # The workers pulling chunks for each stream. The Task of each stream runs the chunk.
+            self.workers = concurrent.futures.ThreadPoolExecutor(max_workers=self.num_streams)
+        if self.preallocate_output:
+            assert self.concat_output, "preallocate_output requires concat_output to be True"
+            # Precompile the plan to concat the outputs once for the hint.
+            self.concat_plan = _compile_concat_hint(self.output_concat_hint.args[0])
+            if self.concat_plan is None:
+                warnings.warn("The output_concat_hint contains objects which can't be written into a preallocated buffer. "
+                "preallocate_output is disabled.")
+                self.preallocate_output = False
+            # The shape and dtype of each flattened output tensor recorded for each input signature.
+            self.output_specs = {}
 
     def reset_forward_status(self):
-        # Since the input batchsize for each forward invoking may change
-        # Need to reset the status for each forward invoking
-        #   * split_size: will be calculated by input batch size and num_streams.
-        #   * used_num_streams: is the num_streams actually used by this forward invoking.
-        #       It may less than self.num_streams when bs is less than self.num_streams.
-        #   * current_split_start_idx: used to record the split start idx for current stream.
-        #   * current_split_end_idx: used to record the split end idx for current stream.
-        self.split_size = None
-        self.used_num_streams = self.num_streams
-        self.current_split_start_idx = 0
-        self.current_split_end_idx = 0
-
-    def update_split_idx(self, stream_id):
-        # Set current_split_start_idx to last current_split_end_idx
-        self.current_split_start_idx = self.current_split_end_idx
-        # Calculate current_split_end_idx to new value
-        if stream_id < self.instance_need_extra_input:
-            # Tail case, when the input image size larger than num_streams and not divisible,
-            # the first remainder streams will have (mini_batch + 1) input size.
-            self.current_split_end_idx = self.current_split_end_idx + (self.batch_per_instance + 1)
-        else:
-            # Input image size divisible of num_streams or input image size less than num_streams.
-            self.current_split_end_idx = self.current_split_end_idx + self.batch_per_instance
-
-    def init_forward_status(self, split_size, stream_id):
-        # This function should be invoke only once at each forward
-        self.split_size = split_size
-        # Ensure each instance has input offload
-        self.batch_per_instance = self.split_size // self.num_streams
-        if self.batch_per_instance >= 1:
-            # The input batchsize larger or equal to num_streams.
-            self.used_num_streams = self.num_streams
-            # If input batchsize larger than num_streams and not divisible,
-            # the first remainder streams will have (mini_batch + 1) input size.
-            self.instance_need_extra_input = self.split_size % self.num_streams
-        else:
-            # The input batchsize less than num_streams,
-            # only the first batchsize stream will have mini_batch(1) input.
-            self.batch_per_instance = 1
-            self.used_num_streams = self.split_size
-            self.instance_need_extra_input = 0
-        self.update_split_idx(stream_id)
-
-    def _do_get_input_for_each_stream(self, hint_object, input_object, stream_input_object, idx_or_key, stream_id):
+        # Since the input batchsize for each forward invoking may change,
+        # a new status is created for each forward invoking. The status is
+        # owned by the invoking instead of self, so that forward is re-entrant.
+        return _MultiStreamForwardStatus(self.num_streams)
+
+    def _get_thread_local_streams_input_and_output(self):
+        local = self.thread_local_status
+        if not hasattr(local, "output"):
+            # Deep copy the input structure for each stream based on input_split_hint.
+            # Each streams_input will be recursively visited and set to the split value in place.
+            local.args_streams_input = [copy.deepcopy(self.input_split_hint.args) for _ in range(self.num_streams)]
+            local.kwargs_streams_input = [copy.deepcopy(self.input_split_hint.kwargs) for _ in range(self.num_streams)]
+            # Deep copy the output structure based on output_concat_hint.
+            # output will be recursively visited and set to the concat value in place.
+            local.output = copy.deepcopy(self.output_concat_hint)
+        return local.args_streams_input, local.kwargs_streams_input, local.output
+
+    def _do_get_input_for_each_stream(self, status, hint_object, input_object, stream_input_object, idx_or_key, stream_id):
         #* hint_object: input hint to tell whether we need to split corresponding
         #       input_object at current position.
         #* input_object: raw input used to split and generate stream_input_object
@@ -203,36 +503,37 @@ class MultiStreamModule(nn.Module):
         #* idx_or_key: idx (for list/tuple) and key (for dict) used for recursive
         #       visit of hint_object/input_object/stream_input_object.
         #* stream_id: the stream we are visiting now.
+        #* status: the forward status of current forward invoking.
         type_arg = type(hint_object[idx_or_key])
         if type_arg in [list]:
             for i in range(hint_object[idx_or_key].__len__()):
-                self._do_get_input_for_each_stream(hint_object[idx_or_key], input_object[idx_or_key], stream_input_object[idx_or_key], i, stream_id)
+                self._do_get_input_for_each_stream(status, hint_object[idx_or_key], input_object[idx_or_key], stream_input_object[idx_or_key], i, stream_id)
         if type_arg in [tuple]:
             # Tuple doesn't support item change in place
             # So we change it to list for next recursion and change it back to tuple.
             temp = list(stream_input_object[idx_or_key])
             for i in range(hint_object[idx_or_key].__len__()):
-                self._do_get_input_for_each_stream(hint_object[idx_or_key], input_object[idx_or_key], temp, i, stream_id)
+                self._do_get_input_for_each_stream(status, hint_object[idx_or_key], input_object[idx_or_key], temp, i, stream_id)
             stream_input_object[idx_or_key] = tuple(temp)
         elif type_arg in [dict]:
             for key in hint_object[idx_or_key]:
-                self._do_get_input_for_each_stream(hint_object[idx_or_key], input_object[idx_or_key], stream_input_object[idx_or_key], key, stream_id)
+                self._do_get_input_for_each_stream(status, hint_object[idx_or_key], input_object[idx_or_key], stream_input_object[idx_or_key], key, stream_id)
         elif (type_arg is int) or (hint_object[idx_or_key] is None):
             if hint_object[idx_or_key] is not None:
                 # If user tells us to split in this object,
-                if self.split_size is None:
+                if status.split_size is None:
                     # Init the input status for each stream here
                     # Here the stream_id must be 0
-                    self.init_forward_status(input_object[idx_or_key].size(hint_object[idx_or_key]), stream_id)
+                    status.init_forward_status(input_object[idx_or_key].size(hint_object[idx_or_key]), stream_id)
                 # Get the split input for each stream
                 # Here we assume split along the outside dim, otherwise memory copy happens and obviously hurt multi stream module's performance.
                 if hint_object[idx_or_key] == 0:
                     # Split along dim 0, the slice will not create new tensor
-                    stream_input_object[idx_or_key] = input_object[idx_or_key][self.current_split_start_idx:self.current_split_end_idx]
+                    stream_input_object[idx_or_key] = input_object[idx_or_key][status.current_split_start_idx:status.current_split_end_idx]
                 else:
                     # Otherwise, we use torch.narrow
-                    length = self.current_split_end_idx - self.current_split_start_idx
-                    stream_input_object[idx_or_key] = input_object[idx_or_key].narrow(hint_object[idx_or_key], self.current_split_start_idx, length)
+                    length = status.current_split_end_idx - status.current_split_start_idx
+                    stream_input_object[idx_or_key] = input_object[idx_or_key].narrow(hint_object[idx_or_key], status.current_split_start_idx, length)
             else:
                 # This object shouldn't be split, just set it as each stream's input
                 stream_input_object[idx_or_key] = input_object[idx_or_key]
@@ -240,42 +541,48 @@ class MultiStreamModule(nn.Module):
             assert False, "Generate stream input failed, unsupport input hint type of:{}".format(type_arg)
         return None
 
-    def _get_input_for_each_stream(self, multi_stream_module_split_hint, *args, **kwargs):
+    def _get_input_for_each_stream(self, multi_stream_module_split_hint, args_streams_input, kwargs_streams_input, *args, **kwargs):
+        status = self.reset_forward_status()
         # recursive once to init:
-        #   1. Decide the actual self.used_num_streams (it may less than number stream when input bs is small)
+        #   1. Decide the actual status.used_num_streams (it may less than number stream when input bs is small)
         #   2. Init the current_split_start_idx and current_split_end_idx for inputs split
         #   3. Decide the actual input for stream_id 0
         for i in range(multi_stream_module_split_hint.args_len):
-            self._do_get_input_for_each_stream(hint_object = multi_stream_module_split_hint.args,
+            self._do_get_input_for_each_stream(status = status,
+                                            hint_object = multi_stream_module_split_hint.args,
                                             input_object = args,
-                                            stream_input_object = self.args_streams_input[0],
+                                            stream_input_object = args_streams_input[0],
                                             idx_or_key = i,
                                             stream_id = 0)
         for key in multi_stream_module_split_hint.kwargs:
-            self._do_get_input_for_each_stream(hint_object = multi_stream_module_split_hint.kwargs,
+            self._do_get_input_for_each_stream(status = status,
+                                            hint_object = multi_stream_module_split_hint.kwargs,
                                         input_object = kwargs,
-                                        stream_input_object = self.kwargs_streams_input[0],
+                                        stream_input_object = kwargs_streams_input[0],
                                         idx_or_key = key,
                                         stream_id = 0)
-        # After we get the self.used_num_streams then we can
+        # After we get the status.used_num_streams then we can
         # decide the inputs for the left of used_num_streams
-        for stream_id in range(1, self.used_num_streams):
+        for stream_id in range(1, status.used_num_streams):
             # Update the split idx for current stream
-            self.update_split_idx(stream_id)
+            status.update_split_idx(stream_id)
             # Here we put stream go through as the outer for loop,
             # Since we assume the multi_stream_module_split_hint is not complicated to be recursive generally.
             for i in range(multi_stream_module_split_hint.args_len):
-                self._do_get_input_for_each_stream(hint_object = multi_stream_module_split_hint.args,
+                self._do_get_input_for_each_stream(status = status,
+                                            hint_object = multi_stream_module_split_hint.args,
                                                 input_object = args,
-                                                stream_input_object = self.args_streams_input[stream_id],
+                                                stream_input_object = args_streams_input[stream_id],
                                                 idx_or_key = i,
                                                 stream_id = stream_id)
             for key in multi_stream_module_split_hint.kwargs:
-                self._do_get_input_for_each_stream(hint_object = multi_stream_module_split_hint.kwargs,
+                self._do_get_input_for_each_stream(status = status,
+                                            hint_object = multi_stream_module_split_hint.kwargs,
                                                 input_object = kwargs,
-                                                stream_input_object = self.kwargs_streams_input[stream_id],
+                                                stream_input_object = kwargs_streams_input[stream_id],
                                                 idx_or_key = key,
                                                 stream_id = stream_id)
+        return status
 
     def _do_generate_outputs(self, hint_object, output_object, stream_output_object, idx_or_key, stream_id):
         type_arg = type(hint_object[idx_or_key])
@@ -305,11 +612,11 @@ class MultiStreamModule(nn.Module):
             assert False, "Generate outputs failed, unsupport output hint type of:{}".format(type_arg)
         return None
 
-    def _generate_outputs(self, stream_output_object, stream_id):
+    def _generate_outputs(self, output, stream_output_object, stream_id):
         # For each position, we will push the result generated by each stream into the list
         # multi_stream_module_split_hint.args_len must be 1, since the module output will be a single output or tuple for multi outputs
         self._do_generate_outputs(hint_object = self.output_concat_hint.args,
-                                output_object = self.output.args,
+                                output_object = output.args,
                                 stream_output_object = stream_output_object,
                                 idx_or_key = 0,
                                 stream_id = stream_id)
@@ -336,44 +643,236 @@ class MultiStreamModule(nn.Module):
             assert False, "Concat output failed, unsupport output hint type of:{}".format(type_arg)
         return None
 
-    def _concat_output_for_each_stream(self):
+    def _concat_output_for_each_stream(self, output):
         # Concat the output, when here each position is already a List of tensors to be concat.
-        self._do_concat_output_for_each_stream(self.output_concat_hint.args, self.output.args, 0)
-        return self.output.args[0]
-
-    def forward(self, *args, **kwargs):
-        # Reset the forward status to default value which mainly contains information
-        # to split inputs. They will init afterwards for each forward call.
-        self.reset_forward_status()
-        if self.num_streams == 1:
-            # Sync execution path if num_stream is 1
-            if not core.is_same_core_affinity_setting(self.core_list):
-                # If the main thread's core affinity has been changed, we should set it again.
-                core.pin_cpu_cores(self.cpu_pool.cpu_pool)
-            results_raw = self.model(*args, **kwargs)
-            return results_raw if self.concat_output else [results_raw]
-
-        # Split the raw input to generate input for each stream
-        self._get_input_for_each_stream(self.input_split_hint, *args, **kwargs)
+        self._do_concat_output_for_each_stream(self.output_concat_hint.args, output.args, 0)
+        return output.args[0]
 
-        results_raw_future = []
+    def _gather_outputs(self, results_raw_future, output):
         results_raw = []
-        for stream_id in range(self.used_num_streams):
-            results_raw_future.append(self.tasks[stream_id](*(self.args_streams_input[stream_id]), **(self.kwargs_streams_input[stream_id])))
-
-        for stream_id in range(self.used_num_streams):
+        for stream_id in range(results_raw_future.__len__()):
             # If we need to concat the output, for each position, we will push the result generated by each stream into a list for concat later.
             # For self._generate_outputs: here we put results_raw_future[stream_id].get() into a [results_raw_future[stream_id].get()]
             # to align the multi_stream_module_concat_hint structure.
-            self._generate_outputs([results_raw_future[stream_id].get()], stream_id)\
+            self._generate_outputs(output, [results_raw_future[stream_id].get()], stream_id)\
                                 if self.concat_output else\
                                 results_raw.append(results_raw_future[stream_id].get())
         # If we need to concat the output, for each position, we will concat the result in the list (generate in self._generate_outputs).
-        return self._concat_output_for_each_stream() if self.concat_output else results_raw
+        return self._concat_output_for_each_stream(output) if self.concat_output else results_raw
+
+    def _submit(self, args_streams_input, kwargs_streams_input, *args, **kwargs):
+        # Split the raw input to generate input for each stream.
+        # The forward status is created for this invoking, which mainly contains information to split inputs.
+        status = self._get_input_for_each_stream(self.input_split_hint, args_streams_input, kwargs_streams_input, *args, **kwargs)
+
+        results_raw_future = []
+        for stream_id in range(status.used_num_streams):
+            results_raw_future.append(self.tasks[stream_id](*(args_streams_input[stream_id]), **(kwargs_streams_input[stream_id])))
+        return results_raw_future
+
+    def _get_split_leaves(self, args, kwargs):
+        inputs = (args, kwargs)
+        return [(_get_by_path(inputs[i], path), dim) for i, path, dim in self.split_leaves]
+
+    def _submit_dynamic(self, *args, **kwargs):
+        # Cut the batch into chunks. Each stream pulls the next chunk after finishing the
+        # previous one, so the streams finish together with uneven chunks.
+        split_leaves = self._get_split_leaves(args, kwargs)
+        split_size = split_leaves[0][0].size(split_leaves[0][1])
+        chunk_size = self.chunk_size if self.chunk_size is not None else max(1, -(-split_size // (self.num_streams * 4)))
+        chunk_ranges = [(start, min(chunk_size, split_size - start)) for start in range(0, split_size, chunk_size)]
+        chunk_outputs = [None] * chunk_ranges.__len__()
+        # next() of itertools.count is atomic with GIL, which makes it a shared chunk counter.
+        next_chunk_id = itertools.count()
+        # Thread local status such as grad mode is not propagated into the workers.
+        grad_enabled = torch.is_grad_enabled()
+
+        def pull_chunks(stream_id):
+            with torch.set_grad_enabled(grad_enabled):
+                while True:
+                    chunk_id = next(next_chunk_id)
+                    if chunk_id >= chunk_ranges.__len__():
+                        return
+                    start, length = chunk_ranges[chunk_id]
+                    chunk_outputs[chunk_id] = self.tasks[stream_id].run_sync(*self.split_args_plan(args, start, length),
+                                                                             **self.split_kwargs_plan(kwargs, start, length))
+
+        assert self.workers is not None, "The MultiStreamModule is closed"
+        jobs = [self.workers.submit(pull_chunks, stream_id) for stream_id in range(min(self.num_streams, chunk_ranges.__len__()))]
+        return jobs, chunk_outputs
+
+    def _gather_outputs_dynamic(self, jobs, chunk_outputs):
+        for job in jobs:
+            job.result()
+        if not self.concat_output:
+            return chunk_outputs
+        output = copy.deepcopy(self.output_concat_hint)
+        for chunk_id, chunk_output in enumerate(chunk_outputs):
+            self._generate_outputs(output, [chunk_output], chunk_id)
+        return self._concat_output_for_each_stream(output)
+
+    def _submit_with_plan(self, *args, **kwargs):
+        # Split the inputs with the precompiled plan. If the output shapes of this input
+        # signature have been recorded, allocate the output buffers and let each stream
+        # write its output into its slice of the buffers.
+        split_leaves = self._get_split_leaves(args, kwargs)
+        split_size = split_leaves[0][0].size(split_leaves[0][1])
+        signature = tuple((tuple(leaf.shape), leaf.dtype) for leaf, _ in split_leaves)
+        output_spec = self.output_specs.get(signature)
+        output_buffers = None if output_spec is None else [torch.empty(shape, dtype=dtype) for shape, dtype in output_spec]
+
+        results_raw_future = []
+        for stream_id, (start, length) in enumerate(_get_split_ranges(split_size, self.num_streams)):
+            stream_args = self.split_args_plan(args, start, length)
+            stream_kwargs = self.split_kwargs_plan(kwargs, start, length)
+            if output_buffers is None:
+                results_raw_future.append(self.tasks[stream_id](*stream_args, **stream_kwargs))
+            else:
+                outs = [buffer.narrow(dim, start, length) for buffer, dim in zip(output_buffers, self.concat_plan[0])]
+                results_raw_future.append(self.tasks[stream_id].run_async_out(outs, *stream_args, **stream_kwargs))
+        return results_raw_future, output_buffers, signature, split_size
+
+    def _gather_outputs_with_plan(self, results_raw_future, output_buffers, signature, split_size):
+        dims, rebuild = self.concat_plan
+        if output_buffers is not None:
+            # Each stream has written its output into the buffers.
+            for future in results_raw_future:
+                future.get()
+            return rebuild(iter(output_buffers))
+
+        # The first batch of this input signature, concat the outputs and record the output shapes.
+        stream_outputs = [_flatten_output(self.output_concat_hint.args[0], future.get()) for future in results_raw_future]
+        outputs = [torch.cat([stream_output[i] for stream_output in stream_outputs], dim=dims[i]) for i in range(dims.__len__())]
+        if all(output.size(dim) == split_size for output, dim in zip(outputs, dims)):
+            # The output can only be written into the buffers if it's split in the same way as the input.
+            self.output_specs[signature] = [(output.shape, output.dtype) for output in outputs]
+        return rebuild(iter(outputs))
+
+    def _run_sync(self, *args, **kwargs):
+        # Sync execution path if num_stream is 1
+        if not core.is_same_core_affinity_setting(self.core_list):
+            # If the main thread's core affinity has been changed, we should set it again.
+            core.pin_cpu_cores(self.cpu_pool.cpu_pool)
+        results_raw = self.model(*args, **kwargs)
+        return results_raw if self.concat_output else [results_raw]
+
+    def forward(self, *args, **kwargs):
+        if self.num_streams == 1:
+            return self._run_sync(*args, **kwargs)
+
+        if self.schedule == "dynamic":
+            return self._gather_outputs_dynamic(*self._submit_dynamic(*args, **kwargs))
+
+        if self.preallocate_output:
+            return self._gather_outputs_with_plan(*self._submit_with_plan(*args, **kwargs))
+
+        args_streams_input, kwargs_streams_input, output = self._get_thread_local_streams_input_and_output()
+        results_raw_future = self._submit(args_streams_input, kwargs_streams_input, *args, **kwargs)
+        return self._gather_outputs(results_raw_future, output)
+
+    def forward_async(self, *args, **kwargs):
+        r"""
+        Submit the inputs to the streams and return without waiting for the
+        streams to finish.
+
+        Several batches can be in flight at the same time. The sub-batches of
+        each stream are executed in submission order, so a stream which
+        finishes its part of batch N early can start its part of batch N+1
+        while the other streams are still working on batch N.
+
+        Returns:
+            intel_extension_for_pytorch.cpu.runtime.MultiStreamModuleFuture:
+            The future of the output. Invoke ``get()`` to wait for and
+            retrieve the same output as ``forward``.
+        """
+        if self.num_streams == 1:
+            return MultiStreamModuleFuture(result=self._run_sync(*args, **kwargs))
+
+        if self.schedule == "dynamic":
+            submission = self._submit_dynamic(*args, **kwargs)
+            return MultiStreamModuleFuture(gather=lambda: self._gather_outputs_dynamic(*submission))
+
+        if self.preallocate_output:
+            # The precompiled plan generates new stream inputs for each submission.
+            submission = self._submit_with_plan(*args, **kwargs)
+            return MultiStreamModuleFuture(gather=lambda: self._gather_outputs_with_plan(*submission))
+
+        # The stream inputs and output structure are owned by each in flight batch,
+        # since the per thread ones are reused by the next submission of this thread.
+        args_streams_input = [copy.deepcopy(self.input_split_hint.args) for _ in range(self.num_streams)]
+        kwargs_streams_input = [copy.deepcopy(self.input_split_hint.kwargs) for _ in range(self.num_streams)]
+        results_raw_future = self._submit(args_streams_input, kwargs_streams_input, *args, **kwargs)
+        return MultiStreamModuleFuture(gather=lambda: self._gather_outputs(results_raw_future, copy.deepcopy(self.output_concat_hint)))
 
     def get_stream_number(self):
         return self.num_streams
 
+    def close(self):
+        r"""
+        Shut down the worker threads of the ``"dynamic"`` schedule. The batches
+        already submitted are finished first. The module can't run forward with
+        the ``"dynamic"`` schedule after it's closed.
+        """
+        workers = getattr(self, "workers", None)
+        if workers is not None:
+            self.workers = None
+            workers.shutdown(wait=True)
+
+    def __del__(self):
+        # Don't wait for the worker threads, __del__ may run in one of them.
+        workers = getattr(self, "workers", None)
+        if workers is not None:
+            workers.shutdown(wait=False)
+
+    def enable_telemetry(self, enabled: bool = True):
+        r"""
+        Enable or disable the telemetry of the Task of each stream. Refer to
+        ``intel_extension_for_pytorch.cpu.runtime.Task.get_telemetry``.
+        """
+        for task in getattr(self, "tasks", []):
+            task.enable_telemetry(enabled)
+
+    def reset_telemetry(self):
+        for task in getattr(self, "tasks", []):
+            task.reset_telemetry()
+
+    def get_telemetry(self):
+        r"""
+        Get a snapshot of the telemetry of each stream, which can be used to
+        detect imbalanced streams.
+
+        Returns:
+            list: The telemetry dict of the Task of each stream. It's empty
+            with ``num_streams`` of 1, which runs synchronously without Task.
+        """
+        return [task.get_telemetry() for task in getattr(self, "tasks", [])]
+
+class MultiStreamModuleFuture(object):
+    r"""
+    The future of the output of a batch submitted by
+    ``MultiStreamModule.forward_async``.
+
+    :meta public:
+    """
+
+    def __init__(self, gather=None, result=None):
+        # gather: the function waiting for the streams and generating the output.
+        self.gather = gather
+        self.result = result
+        self.done = gather is None
+
+    def get(self):
+        r"""
+        Block until all the streams finish this batch and return the output.
+        The output is generated once and the same object is returned by
+        later invocations.
+        """
+        if not self.done:
+            self.result = self.gather()
+            self.gather = None
+            self.done = True
+        return self.result
+
 class _MultiStreamBenchmarkModule(nn.Module):
     # Here is an internal Module for weight sharing benchmark
     # The diffence with MultiStreamModule:
@@ -1,10 +1,11 @@
-import subprocess
+from .._cpu_topology import get_cpu_topology
 
 def get_num_nodes():
-    return int(subprocess.check_output('LANG=C; lscpu | grep Socket | awk \'{print $2}\'', shell=True))
+    return len(get_cpu_topology().get_nodes())
 
 def get_num_cores_per_node():
-    return int(subprocess.check_output('LANG=C; lscpu | grep Core\'.* per socket\' | awk \'{print $4}\'', shell=True))
+    topology = get_cpu_topology()
+    return len(topology.get_physical_cpus(topology.get_nodes()[0]))
 
 def get_core_list_of_node_id(node_id):
     r"""
@@ -17,7 +18,22 @@ def get_core_list_of_node_id(node_id):
         list: List of CPU cores' ids on this numa node.
     """
 
-    num_of_nodes = get_num_nodes()
-    assert node_id < num_of_nodes, "input node_id:{0} must less than system number of nodes:{1}".format(node_id, num_of_nodes)
-    num_cores_per_node = get_num_cores_per_node()
-    return list(range(num_cores_per_node * node_id, num_cores_per_node * (node_id + 1)))
+    topology = get_cpu_topology()
+    nodes = topology.get_nodes()
+    assert node_id in nodes, "input node_id:{0} must be one of the numa nodes:{1}".format(node_id, nodes)
+    return topology.get_physical_cpus(node_id)
+
+def get_node_id_of_cores(core_ids):
+    r"""
+    Helper function to get the numa node id of each input CPU core.
+
+    Args:
+        core_ids (list): Input CPU cores' ids.
+
+    Returns:
+        list: List of numa node id of each CPU core. Logical cores are mapped to
+            the node of their physical cores.
+    """
+
+    topology = get_cpu_topology()
+    return [topology.node_of[core_id] for core_id in core_ids]
@@ -3,7 +3,21 @@ import functools
 import warnings
 import numpy as np
 import intel_extension_for_pytorch as ipex
-from .cpupool import CPUPool
+from .cpupool import CPUPool, localize
+
+# Bucket i of the telemetry histograms counts the durations less than
+# 2^i microseconds (and not less than 2^(i-1) for i > 0), the last bucket
+# counts all the longer ones.
+_TELEMETRY_HISTOGRAM_UPPER_BOUNDS_US = [2 ** i for i in range(31)] + [float("inf")]
+
+def _format_duration_telemetry(total_ns, max_ns, histogram, num_submissions):
+    return {
+        "total_us": total_ns / 1e3,
+        "mean_us": total_ns / 1e3 / num_submissions if num_submissions > 0 else 0.0,
+        "max_us": max_ns / 1e3,
+        "histogram": list(histogram),
+        "histogram_upper_bounds_us": _TELEMETRY_HISTOGRAM_UPPER_BOUNDS_US,
+    }
 
 class Task(object):
     r"""
@@ -15,15 +29,21 @@ class Task(object):
         cpu_pool (intel_extension_for_pytorch.cpu.runtime.CPUPool): An
             intel_extension_for_pytorch.cpu.runtime.CPUPool object, contains
             all CPU cores used to run Task asynchronously.
+        numa_local (bool): If True, the Task runs a replica of the module whose
+            parameters and buffers are placed on the numa node(s) of
+            ``cpu_pool`` by ``intel_extension_for_pytorch.cpu.runtime.localize``.
+            The default value is False.
 
     Returns:
         intel_extension_for_pytorch.cpu.runtime.Task: Generated
         intel_extension_for_pytorch.cpu.runtime.Task object.
     """
 
-    def __init__(self, module, cpu_pool: CPUPool):
+    def __init__(self, module, cpu_pool: CPUPool, numa_local: bool = False):
         self.cpu_pool = cpu_pool
         assert type(self.cpu_pool) is CPUPool
+        if numa_local:
+            module = localize(module, self.cpu_pool)
         if isinstance(module, torch.jit.ScriptModule):
             self._task = ipex._C.TaskModule(module._c, self.cpu_pool.cpu_pool, True)
         else:
@@ -33,6 +53,74 @@ class Task(object):
         # async execution
         return self._task.run_async(*args, **kwargs)
 
+    def run_async_out(self, out, *args, **kwargs):
+        r"""
+        Async execution which copies the output into preallocated tensors.
+
+        Args:
+            out (list of torch.Tensor): The tensors of the output, which is a
+                tensor or nested tuple/list of tensors, are flattened in depth
+                first order and copied into ``out`` inside the task thread.
+            *args: Inputs of the module.
+            **kwargs: Keyword inputs of the module.
+
+        Returns:
+            The future of the raw output.
+        """
+        return self._task.run_async_out(out, *args, **kwargs)
+
     def run_sync(self, *args, **kwargs):
         # sync execution
         return self._task.run_sync(*args, **kwargs)
+
+    def enable_telemetry(self, enabled: bool = True):
+        r"""
+        Enable or disable the telemetry of this Task. Telemetry is disabled
+        by default, and nothing is recorded until it's enabled.
+
+        Args:
+            enabled (bool): Whether to record the telemetry.
+        """
+        self._task.set_telemetry_enabled(enabled)
+
+    def reset_telemetry(self):
+        r"""
+        Clear the recorded telemetry of this Task.
+        """
+        self._task.reset_telemetry()
+
+    def get_telemetry(self):
+        r"""
+        Get a snapshot of the telemetry of this Task.
+
+        Returns:
+            dict: The snapshot with keys:
+
+                * ``core_ids``: The cores of the CPUPool of this Task.
+                * ``num_submissions``: Number of executed submissions.
+                * ``queue_wait_us``: Time from submission to the start of execution.
+                * ``exec_us``: Time of execution.
+                * ``idle_us``: Total time the Task thread waited for submissions.
+                * ``utilization``: Ratio of execution time to execution plus idle time.
+
+                ``queue_wait_us`` and ``exec_us`` are dicts of ``total_us``,
+                ``mean_us``, ``max_us`` and a ``histogram`` of counts with its
+                ``histogram_upper_bounds_us``.
+        """
+        telemetry = self._task.get_telemetry()
+        num_submissions = telemetry["num_submissions"]
+        total_ns = telemetry["exec_ns"] + telemetry["idle_ns"]
+        return {
+            "core_ids": self.cpu_pool.core_ids,
+            "num_submissions": num_submissions,
+            "queue_wait_us": _format_duration_telemetry(telemetry["queue_wait_ns"],
+                                                        telemetry["max_queue_wait_ns"],
+                                                        telemetry["queue_wait_histogram"],
+                                                        num_submissions),
+            "exec_us": _format_duration_telemetry(telemetry["exec_ns"],
+                                                  telemetry["max_exec_ns"],
+                                                  telemetry["exec_histogram"],
+                                                  num_submissions),
+            "idle_us": telemetry["idle_ns"] / 1e3,
+            "utilization": telemetry["exec_ns"] / total_ns if total_ns > 0 else 0.0,
+        }
@@ -197,7 +197,50 @@ void InitIpexModuleBindings(py::module m) {
             // Depending on this being ScriptModule of nn.Module we will release
             // the GIL or not further down in the stack
             return self.run_async(std::move(args), std::move(kwargs));
-          });
+          })
+      .def(
+          "run_async_out",
+          [](torch_ipex::runtime::TaskModule& self,
+             std::vector<at::Tensor> outs,
+             py::args& args,
+             py::kwargs& kwargs) {
+            // The tensors of the output are copied into outs inside the task
+            // thread
+            return self.run_async(
+                std::move(args), std::move(kwargs), std::move(outs));
+          })
+      .def(
+          "set_telemetry_enabled",
+          [](torch_ipex::runtime::TaskModule& self, bool enabled) {
+            self.get_task_executor()->set_telemetry_enabled(enabled);
+          })
+      .def(
+          "is_telemetry_enabled",
+          [](torch_ipex::runtime::TaskModule& self) {
+            return self.get_task_executor()->is_telemetry_enabled();
+          })
+      .def(
+          "reset_telemetry",
+          [](torch_ipex::runtime::TaskModule& self) {
+            self.get_task_executor()->reset_telemetry();
+          })
+      .def("get_telemetry", [](torch_ipex::runtime::TaskModule& self) {
+        // Raw counters in nanoseconds, formatted in Python
+        auto telemetry = self.get_task_executor()->get_telemetry();
+        py::dict res;
+        res["num_submissions"] = telemetry.num_submissions;
+        res["queue_wait_ns"] = telemetry.queue_wait_ns;
+        res["max_queue_wait_ns"] = telemetry.max_queue_wait_ns;
+        res["exec_ns"] = telemetry.exec_ns;
+        res["max_exec_ns"] = telemetry.max_exec_ns;
+        res["idle_ns"] = telemetry.idle_ns;
+        res["queue_wait_histogram"] = std::vector<int64_t>(
+            telemetry.queue_wait_histogram.begin(),
+            telemetry.queue_wait_histogram.end());
+        res["exec_histogram"] = std::vector<int64_t>(
+            telemetry.exec_histogram.begin(), telemetry.exec_histogram.end());
+        return res;
+      });
 
   m.def(
       "get_process_available_cores",
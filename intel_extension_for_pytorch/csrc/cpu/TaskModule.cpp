@@ -3,6 +3,53 @@
 namespace torch_ipex {
 namespace runtime {
 
+namespace {
+
+// Copy each tensor of the (nested tuple/list of) output into the out tensor
+// with the same index in depth first order.
+void copy_output_to_outs(
+    const c10::IValue& output,
+    const std::vector<at::Tensor>& outs,
+    size_t& idx) {
+  if (output.isTuple()) {
+    for (const auto& element : output.toTupleRef().elements()) {
+      copy_output_to_outs(element, outs, idx);
+    }
+  } else if (output.isList()) {
+    for (const auto& element : output.toListRef()) {
+      copy_output_to_outs(element, outs, idx);
+    }
+  } else {
+    TORCH_CHECK(
+        output.isTensor(),
+        "TaskModule: only tensor output can be copied into out tensors");
+    TORCH_CHECK(
+        idx < outs.size(),
+        "TaskModule: the number of output tensors is larger than the number of out tensors");
+    const auto& output_tensor = output.toTensor();
+    // Check the sizes explicitly since copy_ broadcasts the source tensor.
+    TORCH_CHECK(
+        outs[idx].sizes() == output_tensor.sizes(),
+        "TaskModule: the size of output tensor ",
+        output_tensor.sizes(),
+        " doesn't match the size of out tensor ",
+        outs[idx].sizes());
+    outs[idx++].copy_(output_tensor);
+  }
+}
+
+void copy_output_to_outs(
+    const c10::IValue& output,
+    const std::vector<at::Tensor>& outs) {
+  size_t idx = 0;
+  copy_output_to_outs(output, outs, idx);
+  TORCH_CHECK(
+      idx == outs.size(),
+      "TaskModule: the number of output tensors is less than the number of out tensors");
+}
+
+} // namespace
+
 py::object FutureTensor::get() {
   CHECK(this->script_module_initialized_ ^ this->module_initialized_);
   if (this->script_module_initialized_) {
@@ -45,7 +92,8 @@ TaskModule::~TaskModule() {
 
 std::unique_ptr<FutureTensor> TaskModule::run_async(
     py::args&& args,
-    py::kwargs&& kwargs) {
+    py::kwargs&& kwargs,
+    std::vector<at::Tensor>&& outs) {
   CHECK(this->script_module_initialized_ ^ this->module_initialized_);
   // FutureTensor is going to return
   std::unique_ptr<FutureTensor> future_tensor_result =
@@ -70,8 +118,15 @@ std::unique_ptr<FutureTensor> TaskModule::run_async(
       typedef decltype(SubmitFunctionType()(stack)) return_type;
       auto task = std::make_shared<std::packaged_task<return_type()>>(std::bind(
           std::forward<SubmitFunctionType>(
-              [&](std::vector<at::IValue> stack) -> c10::IValue {
-                return function(std::move(stack));
+              [&function, outs = std::move(outs)](
+                  std::vector<at::IValue> stack) -> c10::IValue {
+                auto output = function(std::move(stack));
+                if (!outs.empty()) {
+                  // Copy the output into the out tensors inside the task
+                  // thread, so the copy runs on the cores of this task.
+                  copy_output_to_outs(output, outs);
+                }
+                return output;
               }),
           std::forward<std::vector<at::IValue>>(stack)));
 
@@ -96,16 +151,31 @@ std::unique_ptr<FutureTensor> TaskModule::run_async(
     }
   } else {
     CHECK(this->module_initialized_);
-    this->args = args;
-    this->kwargs = kwargs;
+    // Capture the inputs per submission instead of storing them in the
+    // TaskModule. Otherwise, the inputs of a submission still waiting in the
+    // queue are overwritten by the next submission.
+    auto inputs = std::make_shared<std::pair<py::args, py::kwargs>>(
+        std::move(args), std::move(kwargs));
 
     typedef std::function<py::object()> SubmitFunctionType;
     typedef decltype(SubmitFunctionType()()) return_type;
     auto task = std::make_shared<std::packaged_task<return_type()>>(
-        [&, this]() -> py::object {
+        [this, inputs, outs = std::move(outs)]() -> py::object {
           {
             pybind11::gil_scoped_acquire gil_guard;
-            return this->module_(*(this->args), **(this->kwargs));
+            // Move the inputs out so that they are released with GIL held.
+            py::args task_args = std::move(inputs->first);
+            py::kwargs task_kwargs = std::move(inputs->second);
+            py::object output = this->module_(*task_args, **task_kwargs);
+            if (!outs.empty()) {
+              auto output_ivalue = torch::jit::toTypeInferredIValue(output);
+              {
+                // Copy the output into the out tensors without GIL.
+                pybind11::gil_scoped_release no_gil_guard;
+                copy_output_to_outs(output_ivalue, outs);
+              }
+            }
+            return output;
           }
         });
 
@@ -131,6 +201,10 @@ std::unique_ptr<FutureTensor> TaskModule::run_async(
   return future_tensor_result;
 }
 
+std::shared_ptr<TaskExecutor> TaskModule::get_task_executor() {
+  return this->task_executor;
+}
+
 py::object TaskModule::run_sync(py::args&& args, py::kwargs&& kwargs) {
   // sync API to run application inside task
   std::unique_ptr<FutureTensor> future_tensor_result =
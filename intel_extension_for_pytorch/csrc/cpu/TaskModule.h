@@ -43,9 +43,13 @@ class TORCH_API TaskModule {
   TaskModule& operator=(TaskModule&& task_module) = delete;
   ~TaskModule();
   py::object run_sync(py::args&& args, py::kwargs&& kwargs); /*sync execution*/
+  /*async execution in threadpool. If outs is not empty, the tensors of the
+   * (nested tuple/list of) output are copied into outs inside the threadpool*/
   std::unique_ptr<FutureTensor> run_async(
       py::args&& args,
-      py::kwargs&& kwargs); /*async execution in threadpool*/
+      py::kwargs&& kwargs,
+      std::vector<at::Tensor>&& outs = {});
+  std::shared_ptr<TaskExecutor> get_task_executor();
  private:
   // Script module input
   torch::jit::Module script_module_;
@@ -56,8 +60,6 @@ class TORCH_API TaskModule {
 
   // TaskExecutor
   std::shared_ptr<TaskExecutor> task_executor;
-  py::args args;
-  py::kwargs kwargs;
 };
 
 } // namespace runtime
@@ -1,10 +1,9 @@
 import copy
+import os
 import sys
-import pkg_resources
+import tempfile
 
 import torch
-import torch._dynamo
-import torch.fx.experimental.optimization as optimization
 from torch.jit._trace import TracerWarning
 import warnings
 
@@ -13,15 +12,14 @@ from .optim._optimizer_utils import optimizer_fusion, IPEX_FUSED_OPTIMIZER_LIST_
 import intel_extension_for_pytorch._C as core
 from intel_extension_for_pytorch.utils.channels_last_1d import to_channels_last_1d
 from intel_extension_for_pytorch.utils.linear_bn_folding import linear_bn_fuse
+from intel_extension_for_pytorch.utils import _disk_cache
 from enum import IntEnum
 from intel_extension_for_pytorch.cpu._auto_kernel_selection import _enable_dnnl, _disable_dnnl
 import intel_extension_for_pytorch._C as torch_ipex_cpp
-try:
-    from . import tpp 
-except:
-    warnings.warn("pls install transformers repo when you want to use fast_bert API")
 
 from typing import List
+import bisect
+import collections
 import functools
 import logging
 import threading
@@ -150,16 +148,215 @@ class RunMethods(IntEnum):
     EagerInfer = 3
     EagerTrain = 4
 
+def _map_tensors(fn, obj):
+    # Apply fn to each tensor of the (nested) inputs and keep the structure.
+    if isinstance(obj, torch.Tensor):
+        return fn(obj)
+    elif isinstance(obj, (list, tuple)):
+        return type(obj)(_map_tensors(fn, x) for x in obj)
+    elif isinstance(obj, dict):
+        return {key: _map_tensors(fn, value) for key, value in obj.items()}
+    return obj
+
+def _flatten_tensors(obj, tensors):
+    if isinstance(obj, torch.Tensor):
+        tensors.append(obj)
+    elif isinstance(obj, (list, tuple)):
+        for x in obj:
+            _flatten_tensors(x, tensors)
+    elif isinstance(obj, dict):
+        for key in sorted(obj.keys(), key=str):
+            _flatten_tensors(obj[key], tensors)
+    return tensors
+
+class ShapeBuckets(object):
+    r"""
+    Buckets of input shapes for ``ipex.optimize(graph_mode=True)``. A graph is
+    captured for each bucket of input shapes instead of a single graph for all
+    the shapes, and the graphs are kept in a cache with LRU eviction.
+
+    Args:
+        buckets (dict): Map from a dim of the input tensors to the sizes of the
+            buckets on this dim, e.g. ``{1: [32, 64, 128, 256, 512]}`` for the
+            sequence length of NLP models. The size of an input on this dim is
+            mapped to the smallest bucket not less than it. A size larger than
+            the largest bucket makes a bucket by itself. Dims not in ``buckets``
+            don't affect the bucket of the inputs.
+        pad (bool): Whether to pad the inputs on the dims in ``buckets`` with
+            ``pad_value`` to the size of the bucket, so that each graph always
+            runs with the static shape it is captured with. The outputs with
+            the padded size on these dims are narrowed back to the size of the
+            inputs. The model should ignore the padded positions, e.g. by the
+            attention mask padded with 0. Default value is ``False``.
+        pad_value (float): The value to pad the inputs with. Default value is ``0``.
+        cache_size (int): The maximum number of graphs kept in the cache. The
+            least recently used graph is evicted when a new graph is captured
+            on a full cache. Default value is ``8``.
+
+    Examples:
+
+        >>> buckets = ipex.ShapeBuckets({1: [32, 64, 128, 256, 512]}, pad=True)
+        >>> model = ipex.optimize(model, graph_mode=True, shape_buckets=buckets)
+
+    :meta public:
+    """
+
+    def __init__(self, buckets, pad=False, pad_value=0, cache_size=8):
+        assert isinstance(buckets, dict) and len(buckets) > 0, "buckets should be a non-empty dict"
+        self.buckets = {}
+        for dim, sizes in buckets.items():
+            assert isinstance(dim, int), "The dim of buckets should be int"
+            assert len(sizes) > 0 and all(isinstance(size, int) and size > 0 for size in sizes), \
+                "The sizes of buckets should be positive int"
+            self.buckets[dim] = sorted(set(sizes))
+        assert isinstance(cache_size, int) and cache_size > 0, "cache_size should be a positive int"
+        self.pad = pad
+        self.pad_value = pad_value
+        self.cache_size = cache_size
+
+    def get_bucket_size(self, dim, size):
+        sizes = self.buckets[dim]
+        idx = bisect.bisect_left(sizes, size)
+        return sizes[idx] if idx < len(sizes) else size
+
+    def _get_padded_shape(self, x):
+        shape = list(x.shape)
+        for dim in self.buckets:
+            if -x.dim() <= dim < x.dim():
+                shape[dim] = self.get_bucket_size(dim, shape[dim])
+        return shape
+
+    def get_key(self, input, kwargs):
+        # Only the dims in buckets, the rank and dtype of the input tensors decide the graph to run.
+        key = []
+        for x in _flatten_tensors((input, kwargs), []):
+            shape = self._get_padded_shape(x)
+            key.append((x.dim(), x.dtype, tuple(shape[dim] for dim in self.buckets if -x.dim() <= dim < x.dim())))
+        return tuple(key)
+
+    def pad_inputs(self, input, kwargs):
+        r"""
+        Pad the inputs to the size of their buckets. Return the padded inputs
+        and a dict from dim to (padded size, original size) of the inputs, which
+        is used to narrow the outputs back. The dims padded from different
+        sizes are not narrowed back since the original size is ambiguous.
+        """
+        narrow_sizes = {}
+
+        def pad(x):
+            shape = self._get_padded_shape(x)
+            if shape == list(x.shape):
+                return x
+            for dim in self.buckets:
+                if -x.dim() <= dim < x.dim() and shape[dim] != x.size(dim):
+                    size = (shape[dim], x.size(dim))
+                    narrow_sizes[dim] = size if narrow_sizes.get(dim, size) == size else None
+            padded = x.new_full(shape, self.pad_value)
+            padded[tuple(slice(0, size) for size in x.shape)] = x
+            return padded
+
+        input, kwargs = _map_tensors(pad, (input, kwargs))
+        return input, kwargs, {dim: size for dim, size in narrow_sizes.items() if size is not None}
+
+    def narrow_outputs(self, output, narrow_sizes):
+        def narrow(x):
+            for dim, (padded_size, size) in narrow_sizes.items():
+                if -x.dim() <= dim < x.dim() and x.size(dim) == padded_size:
+                    x = x.narrow(dim, 0, size)
+            return x
+
+        if len(narrow_sizes) == 0:
+            return output
+        return _map_tensors(narrow, output)
+
+class _GraphDiskCache(object):
+    # Save the frozen TorchScript graphs generated by JIT trace into cache_dir, and load them in later processes.
+    # The graphs are keyed by the structure and weights of the model, dtype, ISA, the versions of
+    # Intel® Extension for PyTorch* and PyTorch, and the signature of the inputs used to trace.
+
+    def __init__(self, cache_dir, model, dtype):
+        from ._version import __version__
+        self.cache_dir = cache_dir
+        self.model_key = _disk_cache.get_hash(_disk_cache.get_model_signature(model),
+                                              _disk_cache.get_weights_hash(model),
+                                              dtype,
+                                              core._get_current_isa_level(),
+                                              __version__,
+                                              torch.__version__)
+
+    def _get_file(self, key):
+        return os.path.join(self.cache_dir, _disk_cache.get_hash(self.model_key, key) + ".pt")
+
+    def get_key(self, input, kwargs, bucket_key=None):
+        if bucket_key is not None:
+            return bucket_key
+        # Without shape buckets, the graph is run for all the shapes, only the rank and dtype of the inputs matter.
+        return (tuple((x.dim(), x.dtype) for x in _flatten_tensors((input, kwargs), [])), tuple(sorted(kwargs.keys())))
+
+    def load(self, key):
+        cache_file = self._get_file(key)
+        if not os.path.exists(cache_file):
+            return None
+        try:
+            model = torch.jit.load(cache_file)
+        except Exception:
+            warnings.warn("Failed to load the cached graph from {}, it will be generated again.".format(cache_file))
+            return None
+        logging.debug("load graph from {}.".format(cache_file))
+        return model
+
+    def save(self, key, model):
+        # The file is replaced atomically, so the instances started together never read a partial file.
+        cache_file = self._get_file(key)
+        tmp_file = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            os.close(fd)
+            torch.jit.save(model, tmp_file)
+            os.replace(tmp_file, cache_file)
+        except Exception:
+            warnings.warn("Failed to save the graph into {}.".format(cache_file))
+            if tmp_file is not None and os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
 class GraphCapture(object):
 
-    def __init__(self, model, train, dtype, weights_prepack):
+    def __init__(self, model, train, dtype, weights_prepack, shape_buckets=None, graph_cache_dir=None):
         self.model = copy.deepcopy(model)
         self.train = train
         self.dtype = dtype
         self.weights_prepack = weights_prepack
-        self.method = None
+        self.shape_buckets = shape_buckets
+        self.graph_cache = None
+        if graph_cache_dir is not None and not train:
+            self.graph_cache = _GraphDiskCache(graph_cache_dir, self.model, dtype)
+        # Tuple of (method, model) used to run the captured graph for all the inputs,
+        # None before the graph is generated or when a graph is generated for each bucket of shapes.
+        self.graph = None
+        # Tuples of (method, model) generated for each bucket of shapes, in least recently used order.
+        self.bucket_graphs = collections.OrderedDict()
         self.lock = threading.Lock()
 
+    def _publish(self, method, model, key=None):
+        # Assign the tuple in one step, the fast path of forward reads the graphs without the lock.
+        if key is None:
+            self.graph = (method, model)
+            return
+        self.bucket_graphs[key] = (method, model)
+        while len(self.bucket_graphs) > self.shape_buckets.cache_size:
+            self.bucket_graphs.popitem(last=False)
+
+    def _get_bucket_graph(self, key):
+        graph = self.bucket_graphs.get(key)
+        if graph is not None:
+            try:
+                self.bucket_graphs.move_to_end(key)
+            except KeyError:
+                # Evicted by another thread, the graph is still valid for this call.
+                pass
+        return graph
+
     def __call__(self, func):
 
         def compiler(gm: torch.fx.GraphModule, example_inputs: List[torch.Tensor]):
@@ -174,60 +371,93 @@ class GraphCapture(object):
             traced_gm = torch.jit.freeze(traced_gm)
             return traced_gm
 
+        def run(graph, *input, **kwargs):
+            method, model = graph
+            if method == RunMethods.EagerTrain:
+                return func(*input, **kwargs)
+            return model(*input, **kwargs)
+
+        def generate(key, *input, **kwargs):
+            # Generate the graph and return the output of the inputs. Should be invoked with self.lock.
+            # The JIT graph is generated for the bucket of key, while the others are used for all the inputs.
+            if self.train:
+                warnings.warn("graph capture does not support training yet.")
+                self._publish(RunMethods.EagerTrain, self.model)
+                return func(*input, **kwargs)
+            try:
+                # Try JIT trace.
+                # Tracing only records operations done when the given function is run on the given tensors.
+                # Therefore, the returned ScriptModule will always run the same traced graph on any input.
+                # This has some important implications when your module is expected to run different sets of operations,
+                # depending on the input and/or the module state. In cases like these, tracing would not be appropriate,
+                # and the tracer will try to emit warnings when doing something that may cause an incorrect trace to be produced.
+                # Therefore, we catch these warnings and treat them as errors, and let TorchDynamo handle such models appropriately.
+                cached_model = None
+                if self.graph_cache is not None:
+                    cache_key = self.graph_cache.get_key(input, kwargs, key)
+                    cached_model = self.graph_cache.load(cache_key)
+                if cached_model is not None:
+                    output = cached_model(*input, **kwargs)
+                    self._publish(RunMethods.JIT, cached_model, key)
+                    return output
+                with warnings.catch_warnings():
+                    warnings.filterwarnings('error', category=TracerWarning)
+                    traced_model = torch.jit.trace(self.model.eval(), input).eval()
+                    traced_model = torch.jit.freeze(traced_model)
+                    output = traced_model(*input, **kwargs)
+                    if self.graph_cache is not None:
+                        self.graph_cache.save(cache_key, traced_model)
+                    self._publish(RunMethods.JIT, traced_model, key)
+                    logging.debug("generate graph by JIT trace.")
+                    return output
+            except:
+                try:
+                    # JIT trace failed, try torchdynamo with JIT trace backend.
+                    import torch._dynamo
+                    torch._dynamo.reset()
+                    dynamo_model = torch._dynamo.optimize(compiler, dynamic=True)(self.model)
+                    output = dynamo_model(*input, **kwargs)
+                    self._publish(RunMethods.TorchDynamo, dynamo_model)
+                    logging.debug("generate graph by TorchDynamo.")
+                    return output
+                except:
+                    warnings.warn("Both JIT and TorchDynamo failed, fallback to original model.")
+                    self._publish(RunMethods.EagerInfer, self.model)
+                    return self.model(*input, **kwargs)
+
+        def run_bucket(*input, **kwargs):
+            shape_buckets = self.shape_buckets
+            key = shape_buckets.get_key(input, kwargs)
+            narrow_sizes = {}
+            if shape_buckets.pad:
+                input, kwargs, narrow_sizes = shape_buckets.pad_inputs(input, kwargs)
+            graph = self._get_bucket_graph(key)
+            if graph is None:
+                # Lock the graph generation process to avoid multiple threads generating graph simultaneously.
+                with self.lock:
+                    graph = self.graph if self.graph is not None else self._get_bucket_graph(key)
+                    if graph is None:
+                        return shape_buckets.narrow_outputs(generate(key, *input, **kwargs), narrow_sizes)
+            return shape_buckets.narrow_outputs(run(graph, *input, **kwargs), narrow_sizes)
+
         @functools.wraps(func)
         def forward(*input, **kwargs):
             if torch.jit.is_tracing():
                 return func(*input, **kwargs)
             with torch.cpu.amp.autocast(enabled=(self.dtype == torch.bfloat16 or self.dtype == torch.half), dtype=self.dtype):
-                if self.method:
-                    if self.train:
-                        return func(*input, **kwargs)
-                    else:
-                        return self.model(*input, **kwargs)
-                else:
-                    # Lock the graph generation process to avoid multiple threads generating graph simultaneously. 
-                    with self.lock:
-                        if self.method:
-                            if self.train:
-                                return func(*input, **kwargs)
-                            else:
-                                return self.model(*input, **kwargs)
-                        if self.train:
-                            warnings.warn("graph capture does not support training yet.")
-                            self.method = RunMethods.EagerTrain
-                            return func(*input, **kwargs)
-                        else:
-                            try:
-                                # Try JIT trace.
-                                # Tracing only records operations done when the given function is run on the given tensors.
-                                # Therefore, the returned ScriptModule will always run the same traced graph on any input.
-                                # This has some important implications when your module is expected to run different sets of operations,
-                                # depending on the input and/or the module state. In cases like these, tracing would not be appropriate,
-                                # and the tracer will try to emit warnings when doing something that may cause an incorrect trace to be produced.
-                                # Therefore, we catch these warnings and treat them as errors, and let TorchDynamo handle such models appropriately.
-                                with warnings.catch_warnings():
-                                    warnings.filterwarnings('error', category=TracerWarning)
-                                    traced_model = torch.jit.trace(self.model.eval(), input).eval()
-                                    traced_model = torch.jit.freeze(traced_model)
-                                    output = traced_model(*input, **kwargs)
-                                    self.model = traced_model
-                                    self.method = RunMethods.JIT
-                                    logging.debug("generate graph by JIT trace.")
-                                    return output
-                            except:
-                                try:
-                                    # JIT trace failed, try torchdynamo with JIT trace backend.
-                                    torch._dynamo.reset()
-                                    dynamo_model = torch._dynamo.optimize(compiler, dynamic=True)(self.model)
-                                    output = dynamo_model(*input, **kwargs)
-                                    self.model = dynamo_model
-                                    self.method = RunMethods.TorchDynamo
-                                    logging.debug("generate graph by TorchDynamo.")
-                                    return output
-                                except:
-                                    warnings.warn("Both JIT and TorchDynamo failed, fallback to original model.")
-                                    self.method = RunMethods.EagerInfer
-                                    return self.model(*input, **kwargs)
+                # The generated graph and its run method are published together as one tuple,
+                # so that concurrent threads read them once per call and never see a partial state.
+                graph = self.graph
+                if graph is not None:
+                    return run(graph, *input, **kwargs)
+                if self.shape_buckets is not None and not self.train:
+                    return run_bucket(*input, **kwargs)
+                # Lock the graph generation process to avoid multiple threads generating graph simultaneously. 
+                with self.lock:
+                    graph = self.graph
+                    if graph is not None:
+                        return run(graph, *input, **kwargs)
+                    return generate(None, *input, **kwargs)
 
         return forward
 
@@ -246,7 +476,9 @@ def optimize(
     fuse_update_step=None,
     auto_kernel_selection=None,
     sample_input=None,
-    graph_mode=None
+    graph_mode=None,
+    shape_buckets=None,
+    graph_cache_dir=None
 ):
     r"""
     Apply optimizations at Python frontend to the given model (nn.Module), as
@@ -334,6 +566,21 @@ def optimize(
             configuration set by ``level`` knob.
         graph_mode: (bool) [experimental]: It will automatically apply a combination of methods
             to generate graph or multiple subgraphs if True. The default value is ``False``.
+        shape_buckets: (ShapeBuckets) [experimental]: Buckets of input shapes for
+            ``graph_mode``. If set, a graph is generated by JIT trace for each
+            bucket of input shapes and kept in a LRU cache, instead of one graph
+            for all the input shapes. Refer to :class:`ShapeBuckets`. It only
+            works for inference model. The default value is ``None``.
+        graph_cache_dir: (str) [experimental]: The directory to save the frozen
+            TorchScript graphs generated by ``graph_mode``. Later processes
+            optimizing the same model with the same settings load the graphs
+            from this directory instead of running JIT trace and freeze again.
+            The graphs are keyed by the structure and weights of the model,
+            ``dtype``, ISA, the versions of Intel® Extension for PyTorch* and
+            PyTorch, and the signature of the inputs. If not set, the value of
+            the environment variable ``IPEX_GRAPH_CACHE_DIR`` is used. It only
+            works for inference model. The default value is ``None``, meaning
+            the graphs are not cached on disk.
 
     Returns:
         Model and optimizer (if given) modified according to the ``level`` knob
@@ -466,6 +713,7 @@ def optimize(
     if not model.training:
         if opt_properties.conv_bn_folding:
             try:
+                import torch.fx.experimental.optimization as optimization
                 optimized_model = optimization.fuse(optimized_model, inplace=inplace)
             except:  # noqa E722
                 warnings.warn("Conv BatchNorm folding failed during the optimize process.")
@@ -529,6 +777,7 @@ def optimize(
                         "please set dtype to torch.float or set weights_prepack to False."
             optimized_model, optimized_optimizer, params_attr = utils._weight_prepack.weight_prepack_with_ipex(
                 optimized_model, optimized_optimizer, params_attr, 'cpu')
+            import torch._dynamo
             torch._dynamo.allow_in_graph(utils._weight_prepack._IPEXConv2d)
             torch._dynamo.allow_in_graph(utils._weight_prepack._IPEXConvTranspose2d)
             torch._dynamo.allow_in_graph(utils._weight_prepack._IPEXLinear)
@@ -539,8 +788,13 @@ def optimize(
                 optimized_model, optimized_optimizer, params_attr, 'xpu')
 
     if opt_properties.graph_mode:
+        assert shape_buckets is None or isinstance(shape_buckets, ShapeBuckets), \
+            "shape_buckets should be an instance of ShapeBuckets"
         _old_forward = optimized_model.forward
-        wrapper = GraphCapture(optimized_model, optimizer is not None, dtype, opt_properties.weights_prepack)
+        if graph_cache_dir is None:
+            graph_cache_dir = os.environ.get("IPEX_GRAPH_CACHE_DIR")
+        wrapper = GraphCapture(optimized_model, optimizer is not None, dtype, opt_properties.weights_prepack,
+                               shape_buckets, graph_cache_dir)
         optimized_model.forward = wrapper(_old_forward)
 
     # TODO: model list, optimizer list.
@@ -712,6 +966,7 @@ def fast_bert(model, dtype=torch.float, optimizer=None, unpad=False):
 
     """
     #tpp bert optimization depends on the transformers repo to implementate the related module
+    import pkg_resources
     installed_pkg = {pkg.key for pkg in pkg_resources.working_set}
     min_version = '4.6.0'
     max_version = '4.20.0'
@@ -723,6 +978,7 @@ def fast_bert(model, dtype=torch.float, optimizer=None, unpad=False):
     trans_version = transformers.__version__
     if version.parse(trans_version) < version.parse(min_version) or version.parse(trans_version) > version.parse(max_version):
         raise RuntimeError("Please installed the transformers with version: between {} and {} while now transformers== {}".format(min_version, max_version, trans_version))
+    from . import tpp
     PT_OPTIMIZER_TO_TPP_OPTIMIZER = {torch.optim.AdamW : tpp.optim.AdamW,
                                       transformers.optimization.AdamW : tpp.optim.AdamW,
                                       torch.optim.SGD : tpp.optim.SGD}
@@ -3,7 +3,7 @@ import torch.nn as nn
 import copy
 import logging
 
-from intel_extension_for_pytorch import optim, frontend
+from intel_extension_for_pytorch import optim
 from intel_extension_for_pytorch.cpu._auto_kernel_selection import _using_dnnl
 import intel_extension_for_pytorch._C as core
 
@@ -381,6 +381,8 @@ def weight_prepack_with_ipex_xpu(module):
     return module
 
 def weight_prepack_with_ipex(module, optimizer, params_attr, device_type='cpu'):
+    from intel_extension_for_pytorch import frontend
+
     def convert(m, optimizer, params_attr):
         if _should_prepack(m, is_training=(optimizer!=None)) and (m.weight.dtype == torch.float32 or m.weight.dtype == torch.bfloat16 or m.weight.dtype == torch.half):
             weight = m.master_weight if hasattr(m, "master_weight") else m.weight
@@ -1,3 +1,5 @@
 from ._quantize import prepare, convert
 from ._qconfig import default_static_qconfig, default_dynamic_qconfig
 from ._autotune import autotune
+from ._calibrate import calibrate
+from ._profile import profile_quantization
@@ -1,17 +1,95 @@
-import sys
-import subprocess
-import copy
+import logging
 import time
-from . import default_static_qconfig, prepare
+import warnings
+import torch
 
+from ._quantize import convert
+from ._quantize_utils import copy_prepared_model
+from ._recipe import get_default_recipe
+from ._utils import attach_scale_zp_values_to_model, convert_quant_state_map_to_nodes, \
+    sync_pool_and_lstm_input_output_scale_zp, _is_quantized_op, _QuantizationError
+from ._calibrate import _default_run_fn
 
-def autotune(prepared_model, calib_dataloader, eval_func, sampling_sizes=[100], accuracy_criterion={'relative': 0.01}, tuning_time=0):
+logger = logging.getLogger(__name__)
+
+# The number of calibration batches cached to measure the sensitivity of the ops.
+_NUM_SENSITIVITY_BATCHES = 4
+
+def _default_autotune_run_fn(model, batch):
+    # The batches are (input, label) like the data loaders of Intel® Neural Compressor.
+    return _default_run_fn(model, batch[0])
+
+def _get_batch_size(batch):
+    if isinstance(batch, torch.Tensor):
+        return batch.size(0) if batch.dim() > 0 else 1
+    if isinstance(batch, (tuple, list)) and len(batch) > 0:
+        return _get_batch_size(batch[0])
+    if isinstance(batch, dict) and len(batch) > 0:
+        return _get_batch_size(next(iter(batch.values())))
+    return 1
+
+def _relative_error(outputs, ref_outputs):
+    r"""
+    The squared error of ``outputs`` relative to the energy of ``ref_outputs``, i.e. 1/SQNR.
+    """
+    error = _QuantizationError()
+    for output, ref_output in zip(outputs, ref_outputs):
+        error.update(output, ref_output)
+    return error.get_relative_error()
+
+def _get_quantized_ops(model):
+    r"""
+    The (quant state key, op index) of the quantizable ops which have quantized inputs or
+    weights in the recipe of ``model``.
+    """
+    ops = []
+    for k, v in model._fqn_to_auto_quant_state_map.items():
+        for idx, q_op_info in v.idx_to_seen_q_op_infos.items():
+            if q_op_info.qconfig is not None and _is_quantized_op(q_op_info):
+                ops.append((k, idx))
+    return ops
+
+def _apply_recipe(model, fallback_ops):
+    r"""
+    Return a copy of ``model``, whose scales and zero points are computed, with the default
+    recipe computed as if the ops in ``fallback_ops`` were not quantizable.
+    """
+    model = copy_prepared_model(model)
+    quant_state_map = model._fqn_to_auto_quant_state_map
+    qconfigs = {}
+    for k, idx in fallback_ops:
+        q_op_info = quant_state_map[k].idx_to_seen_q_op_infos[idx]
+        qconfigs[(k, idx)] = q_op_info.qconfig
+        q_op_info.qconfig = None
+    get_default_recipe(convert_quant_state_map_to_nodes(quant_state_map))
+    # The fallback ops keep their qconfig after the recipe is computed, so that the
+    # tuned model can be saved and re-calibrated, their inputs and weights stay FP32.
+    for (k, idx), qconfig in qconfigs.items():
+        quant_state_map[k].idx_to_seen_q_op_infos[idx].qconfig = qconfig
+    # The recipe is computed, convert and save_qconf_summary don't compute the default recipe again.
+    model._qconf_summary = None
+    return model
+
+def _run(model, batches, run_fn):
+    with torch.no_grad():
+        return [run_fn(model, batch) for batch in batches]
+
+def autotune(prepared_model, calib_dataloader, eval_func, sampling_sizes=[100], accuracy_criterion={'relative': 0.01},
+             tuning_time=0, max_trials=100, run_fn=None):
     r"""
     Automatic accuracy-driven tuning helps users quickly find out the advanced recipe for INT8 inference.
 
+    The model is calibrated once with ``calib_dataloader``, and the default recipe is evaluated with
+    the calibration statistics of each sampling size. If the accuracy criterion is not met, the
+    quantizable ops are sorted by their sensitivity, i.e. how much the error of the model outputs on
+    a few cached calibration batches decreases if the op alone falls back to FP32, which is measured
+    once. Then the most sensitive ops fall back to FP32 one by one, reusing the calibration statistics,
+    until the accuracy criterion is met. The ops fallen back run in BF16 if the converted model
+    runs under ``torch.cpu.amp.autocast``.
+
     Args:
         prepared_model (torch.nn.Module): the FP32 prepared model returned from ipex.quantization.prepare.
-        calib_dataloader (generator): set a dataloader for calibration.
+        calib_dataloader (iterable): set a dataloader for calibration, which yields (input, label) batches.
         eval_func (function): set a evaluation function. This function takes "model" as input parameter
             executes entire evaluation process with self contained metrics,
             and returns an accuracy value which is a scalar number. The higher the better.
@@ -19,46 +97,102 @@ def autotune(prepared_model, calib_dataloader, eval_func, sampling_sizes=[100],
             The default value is ``[100]``.
         accuracy_criterion ({accuracy_criterion_type(str, 'relative' or 'absolute') : accuracy_criterion_value(float)}):
             set the maximum allowed accuracy loss, either relative or absolute. The default value is ``{'relative': 0.01}``.
-        tuning_time (seconds): tuning timeout. The default value is ``0`` which means early stop.
+        tuning_time (seconds): tuning timeout. The default value is ``0`` which means no timeout. The tuning always
+            stops once the accuracy criterion is met.
+        max_trials (int): the maximum number of evaluated recipes. The default value is ``100``.
+        run_fn (callable): function to run the model with one calibration batch, called as ``run_fn(model, batch)``.
+            The default value is ``None``, which runs ``model(*input)`` if the input is a tuple or list,
+            otherwise ``model(input)``.
 
     Returns:
         FP32 tuned model (torch.nn.Module)
     """
-    try:
-        import neural_compressor
-    except ImportError:
-        try:
-            subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'neural_compressor==1.14.1'])
-            import neural_compressor
-        except:
-            assert False, "Unable to import neural_compressor from the local environment."
-    from neural_compressor import config
-    from neural_compressor.experimental import Quantization, common
-    from neural_compressor.adaptor.torch_utils.util import auto_copy
-    from neural_compressor.adaptor.pytorch import get_example_inputs
-
-    config.quantization.backend = 'pytorch_ipex'
-    config.quantization.approach = 'post_training_static_quant'
-    config.quantization.device = 'cpu'
-    config.quantization.use_bf16 = False
-    config.quantization.calibration_sampling_size = sampling_sizes
-    if accuracy_criterion.get('relative'):
-        config.quantization.accuracy_criterion.relative = accuracy_criterion.get('relative')
-    if accuracy_criterion.get('absolute'):
-        config.quantization.accuracy_criterion.absolute = accuracy_criterion.get('absolute')
-    config.quantization.timeout = tuning_time
-    quantizer = Quantization(config)
-    fp32_model = auto_copy(prepared_model)
-    quantizer.model = common.Model(fp32_model)
-    quantizer.calib_dataloader = calib_dataloader
-    quantizer.eval_func = eval_func
-    q_model = quantizer.fit()
-    dirname_str = './saved_tuning_results_'+time.strftime("%Y%m%d_%H%M%S")
-    q_model.save(dirname_str)
-
-    # This is a workaround for the bug that the auto_copy function will change its input prepared_model.
-    qconfig = default_static_qconfig
-    new_prepared_model = prepare(fp32_model, qconfig, example_inputs=get_example_inputs(calib_dataloader), inplace=True)
-    new_prepared_model.load_qconf_summary(qconf_summary=dirname_str+'/best_configure.json')
-
-    return new_prepared_model
+    assert hasattr(prepared_model, '_fqn_to_auto_quant_state_map'), \
+        "Please prepare the model for static quantization before doing autotune"
+    assert len(sampling_sizes) > 0, "Please give at least one sampling size"
+    if run_fn is None:
+        run_fn = _default_autotune_run_fn
+    start_time = time.time()
+
+    def out_of_budget(num_trials):
+        return num_trials >= max_trials or (tuning_time > 0 and time.time() - start_time > tuning_time)
+
+    fp32_accuracy = eval_func(copy_prepared_model(prepared_model))
+    # Both criteria must be met if both are given.
+    thresholds = []
+    if accuracy_criterion.get('relative') is not None:
+        thresholds.append(fp32_accuracy - abs(fp32_accuracy) * accuracy_criterion.get('relative'))
+    if accuracy_criterion.get('absolute') is not None:
+        thresholds.append(fp32_accuracy - accuracy_criterion.get('absolute'))
+    min_accuracy = max(thresholds) if len(thresholds) > 0 else fp32_accuracy
+    logger.info("FP32 accuracy: {:.4f}, target INT8 accuracy: {:.4f}".format(fp32_accuracy, min_accuracy))
+
+    best_model, best_accuracy, num_trials = None, float('-inf'), 0
+
+    def evaluate(model, description):
+        nonlocal best_model, best_accuracy, num_trials
+        accuracy = eval_func(convert(model))
+        num_trials += 1
+        logger.info("Trial {}: {}, accuracy: {:.4f}".format(num_trials, description, accuracy))
+        if accuracy > best_accuracy:
+            best_model, best_accuracy = model, accuracy
+        return accuracy >= min_accuracy
+
+    # Step 1: calibrate once, the calibration of a larger sampling size continues from the
+    # statistics of the smaller one, and evaluate the default recipe of each sampling size.
+    calibrated_model = copy_prepared_model(prepared_model)
+    data_iter = iter(calib_dataloader)
+    cached_batches = []
+    num_samples = 0
+    base_model = None
+    for sampling_size in sorted(sampling_sizes):
+        with torch.no_grad():
+            while num_samples < sampling_size:
+                batch = next(data_iter, None)
+                if batch is None:
+                    break
+                run_fn(calibrated_model, batch)
+                num_samples += _get_batch_size(batch)
+                if len(cached_batches) < _NUM_SENSITIVITY_BATCHES:
+                    cached_batches.append(batch)
+        assert len(cached_batches) > 0, "The calibration data loader is empty"
+        # The scales and zero points of this sampling size, the observers of calibrated_model are kept.
+        base_model = copy_prepared_model(calibrated_model)
+        attach_scale_zp_values_to_model(base_model)
+        quant_state_map = base_model._fqn_to_auto_quant_state_map
+        sync_pool_and_lstm_input_output_scale_zp(quant_state_map, convert_quant_state_map_to_nodes(quant_state_map))
+        if evaluate(_apply_recipe(base_model, []), "default recipe, {} calibration samples".format(num_samples)):
+            return best_model
+        if out_of_budget(num_trials) or num_samples < sampling_size:
+            break
+
+    # Step 2: measure the sensitivity of each quantized op once on the cached calibration batches.
+    # The sensitivity is the decrease of the output error if the op alone falls back to FP32.
+    ops = _get_quantized_ops(_apply_recipe(base_model, []))
+    if len(ops) > 0 and not out_of_budget(num_trials):
+        ref_outputs = _run(copy_prepared_model(prepared_model), cached_batches, run_fn)
+        int8_error = _relative_error(_run(convert(_apply_recipe(base_model, [])), cached_batches, run_fn), ref_outputs)
+        sensitivity = {}
+        for op in ops:
+            if out_of_budget(num_trials):
+                break
+            converted_model = convert(_apply_recipe(base_model, [op]), inplace=True)
+            sensitivity[op] = int8_error - _relative_error(_run(converted_model, cached_batches, run_fn), ref_outputs)
+        # The ops not measured within the tuning time keep their order in the model after the measured ones.
+        measured_ops = sorted([op for op in ops if op in sensitivity], key=lambda op: sensitivity[op], reverse=True)
+        ops = measured_ops + [op for op in ops if op not in sensitivity]
+
+    # Step 3: fall back the most sensitive ops one by one.
+    fallback_ops = []
+    for op in ops:
+        if out_of_budget(num_trials):
+            break
+        fallback_ops.append(op)
+        k, idx = op
+        op_info = base_model._fqn_to_auto_quant_state_map[k].idx_to_seen_q_op_infos[idx]
+        if evaluate(_apply_recipe(base_model, fallback_ops), "fallback {} {} to FP32".format(op_info.fqn, op_info.type)):
+            return best_model
+
+    warnings.warn("The accuracy criterion is not met within the tuning budget, "
+                  "return the recipe of the best accuracy {:.4f}".format(best_accuracy))
+    return best_model
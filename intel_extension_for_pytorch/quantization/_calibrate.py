@@ -0,0 +1,219 @@
+import io
+import queue
+import traceback
+import warnings
+import torch
+import torch.multiprocessing as mp
+from torch.ao.quantization import HistogramObserver, MinMaxObserver, PerChannelMinMaxObserver, \
+    MovingAverageMinMaxObserver, MovingAveragePerChannelMinMaxObserver
+
+def _default_run_fn(model, batch):
+    if isinstance(batch, (tuple, list)):
+        return model(*batch)
+    return model(batch)
+
+def _get_observers(model):
+    r"""
+    The unique observers of the prepared model, in a deterministic order which
+    is the same in the forked workers. Some observers are shared by several
+    tensors, e.g. the weights of LSTM, so they are deduplicated.
+    """
+    observers = []
+    seen = set()
+    for _, qstate in model._fqn_to_auto_quant_state_map.items():
+        for observer_dict in [qstate.tensor_id_to_observer, qstate.weight_tensor_id_to_observer]:
+            for _, observer in observer_dict.items():
+                if id(observer) not in seen:
+                    seen.add(id(observer))
+                    observers.append(observer)
+    return observers
+
+def _get_observer_state(observer):
+    return {name: buf.clone() for name, buf in observer.named_buffers()}
+
+def _reset_histogram(observer):
+    observer.histogram.zero_()
+    observer.min_val.fill_(float('inf'))
+    observer.max_val.fill_(float('-inf'))
+
+def _has_run(state):
+    return state['min_val'].numel() > 0 and bool(torch.all(state['min_val'] <= state['max_val']))
+
+def _rebin_histogram(histogram, min_val, max_val, new_min_val, new_max_val, bins):
+    # Redistribute the counts of a uniform histogram over [min_val, max_val] into
+    # ``bins`` uniform bins over [new_min_val, new_max_val], assuming the counts are
+    # uniformly distributed in each bin, i.e. linear interpolation of the CDF.
+    edges = torch.linspace(min_val, max_val, histogram.numel() + 1, dtype=torch.float64)
+    cdf = torch.cat([torch.zeros(1, dtype=torch.float64), histogram.to(torch.float64).cumsum(0)])
+    new_edges = torch.linspace(new_min_val, new_max_val, bins + 1, dtype=torch.float64)
+    if max_val == min_val:
+        # all the values are the same
+        new_cdf = torch.where(new_edges >= min_val, cdf[-1], torch.zeros_like(new_edges))
+    else:
+        idx = torch.searchsorted(edges, new_edges, right=True).clamp(1, edges.numel() - 1)
+        left, right = edges[idx - 1], edges[idx]
+        weight = ((new_edges - left) / (right - left)).clamp(0, 1)
+        new_cdf = cdf[idx - 1] + weight * (cdf[idx] - cdf[idx - 1])
+    new_cdf[-1] = cdf[-1]
+    return new_cdf.diff().to(histogram.dtype)
+
+def _merge_observer_states(observer, states, weights):
+    r"""
+    Merge the states of the same observer collected on different data into
+    ``observer``. ``weights`` are the number of batches observed by each state,
+    which are used to average the moving averages.
+    """
+    runs = [(state, weight) for state, weight in zip(states, weights) if _has_run(state)]
+    if len(runs) == 0:
+        return
+    min_vals = torch.stack([state['min_val'] for state, _ in runs])
+    max_vals = torch.stack([state['max_val'] for state, _ in runs])
+    if isinstance(observer, HistogramObserver):
+        min_val, max_val = min_vals.min(), max_vals.max()
+        histogram = sum([_rebin_histogram(state['histogram'], state['min_val'].item(), state['max_val'].item(),
+                                          min_val.item(), max_val.item(), observer.bins) for state, _ in runs])
+        observer.histogram.copy_(histogram)
+    elif isinstance(observer, (MovingAverageMinMaxObserver, MovingAveragePerChannelMinMaxObserver)):
+        # The moving averages don't compose, the averages of the workers are averaged.
+        weight = torch.tensor([float(weight) for _, weight in runs]).view([-1] + [1] * (min_vals.dim() - 1))
+        min_val = (min_vals * weight).sum(0) / weight.sum()
+        max_val = (max_vals * weight).sum(0) / weight.sum()
+    elif isinstance(observer, (MinMaxObserver, PerChannelMinMaxObserver)):
+        min_val, max_val = min_vals.min(0)[0], max_vals.max(0)[0]
+    else:
+        assert False, "{} is not supported by parallel calibration".format(type(observer).__name__)
+    observer.min_val = min_val.to(observer.min_val.dtype)
+    observer.max_val = max_val.to(observer.max_val.dtype)
+
+def _calibration_worker(model, observers, run_fn, num_threads, batch_queue, result_queue):
+    try:
+        torch.set_num_threads(num_threads)
+        # The worker starts with the states of the master. The histograms are reset to
+        # not count the data of the master several times, min/max are idempotent and
+        # moving averages continue from the master's state like sequential calibration.
+        for observer in observers:
+            if isinstance(observer, HistogramObserver):
+                _reset_histogram(observer)
+        num_batches = 0
+        with torch.no_grad():
+            while True:
+                batch = batch_queue.get()
+                if batch is None:
+                    break
+                run_fn(model, batch)
+                num_batches += 1
+        # The states are serialized instead of sharing the tensors, which needs the worker alive.
+        buffer = io.BytesIO()
+        torch.save([_get_observer_state(observer) for observer in observers], buffer)
+        result_queue.put((num_batches, buffer.getvalue(), None))
+    except Exception:
+        result_queue.put((0, None, traceback.format_exc()))
+
+def calibrate(prepared_model, calib_dataloader, num_workers=None, num_threads=1, run_fn=None):
+    r"""
+    Calibrate a model prepared by :func:`prepare` with the batches of
+    ``calib_dataloader`` in ``num_workers`` worker processes. The batches are
+    read in the current process and streamed to the workers, each worker
+    collects the observer statistics of its batches independently, and the
+    statistics are merged into the observers of ``prepared_model`` at the end.
+
+    The result is the same as calibrating sequentially for ``MinMaxObserver``
+    and ``PerChannelMinMaxObserver``. The histograms of ``HistogramObserver``
+    are merged over the union of their ranges, which may differ slightly from
+    the sequential result in the bin boundaries. The moving averages of
+    ``MovingAverageMinMaxObserver`` are averaged over the workers.
+
+    The workers are forked from the current process, so ``calib_dataloader``
+    is iterated in the current process and ``run_fn`` doesn't need to be
+    picklable. Since the Python hooks of the prepared model are the bottleneck
+    of calibration, more single-threaded workers are usually faster than fewer
+    multi-threaded ones. Multi-threaded workers need an OpenMP runtime which
+    supports fork, e.g. Intel OpenMP.
+
+    Args:
+        prepared_model (torch.nn.Module): The model returned by :func:`prepare`.
+        calib_dataloader (iterable): The calibration batches.
+        num_workers (int): Number of worker processes. Default to the number of
+            threads of the current process. With 1 worker, the model is
+            calibrated in the current process.
+        num_threads (int): Number of threads of each worker.
+        run_fn (callable): Function to run the model with one batch, called as
+            ``run_fn(model, batch)``. Default to ``model(*batch)`` if the batch
+            is a tuple or list, otherwise ``model(batch)``.
+
+    Returns:
+        torch.nn.Module: ``prepared_model`` with the merged observer statistics.
+    """
+    assert hasattr(prepared_model, '_fqn_to_auto_quant_state_map'), \
+        "Please prepare the model for static quantization before doing calibration"
+    if num_workers is None:
+        num_workers = torch.get_num_threads() // num_threads
+    num_workers = max(num_workers, 1)
+    if run_fn is None:
+        run_fn = _default_run_fn
+
+    if num_workers == 1:
+        with torch.no_grad():
+            for batch in calib_dataloader:
+                run_fn(prepared_model, batch)
+        return prepared_model
+
+    observers = _get_observers(prepared_model)
+    ctx = mp.get_context("fork")
+    batch_queue = ctx.Queue(maxsize=2 * num_workers)
+    result_queue = ctx.Queue()
+    workers = [ctx.Process(target=_calibration_worker,
+                           args=(prepared_model, observers, run_fn, num_threads, batch_queue, result_queue),
+                           daemon=True)
+               for _ in range(num_workers)]
+    for worker in workers:
+        worker.start()
+
+    def put(item):
+        while True:
+            try:
+                batch_queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                if not all(worker.is_alive() for worker in workers):
+                    return
+
+    def get():
+        while True:
+            try:
+                return result_queue.get(timeout=1)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers) and result_queue.empty():
+                    raise RuntimeError("Calibration workers exited unexpectedly")
+
+    try:
+        for batch in calib_dataloader:
+            if not all(worker.is_alive() for worker in workers):
+                break
+            put(batch)
+        for _ in workers:
+            put(None)
+        results = []
+        for _ in workers:
+            num_batches, states, error = get()
+            if error is not None:
+                raise RuntimeError("Calibration worker failed:\n" + error)
+            results.append((num_batches, torch.load(io.BytesIO(states))))
+    finally:
+        for worker in workers:
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
+
+    if sum([num_batches for num_batches, _ in results]) == 0:
+        warnings.warn("No batch is calibrated, the calibration data loader is empty")
+        return prepared_model
+    for i, observer in enumerate(observers):
+        # The states of the master are merged too, to keep the statistics of calibrations done before.
+        states = [_get_observer_state(observer)] + [worker_states[i] for _, worker_states in results]
+        weights = [0] + [num_batches for num_batches, _ in results]
+        if isinstance(observer, (MovingAverageMinMaxObserver, MovingAveragePerChannelMinMaxObserver)):
+            # The workers have started from the state of the master already.
+            states, weights = states[1:], weights[1:]
+        _merge_observer_states(observer, states, weights)
+    return prepared_model
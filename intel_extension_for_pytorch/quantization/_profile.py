@@ -0,0 +1,267 @@
+import csv
+import json
+import warnings
+import torch
+from torch.fx.node import map_aggregate
+
+from ._quantize import prepare, convert, _freeze
+from ._quantize_utils import copy_prepared_model
+from ._calibrate import _default_run_fn
+from ._utils import _flatten_tensors, _is_quantized_op, _QuantizationError
+
+def _to_tensor(x):
+    # Unwrap the tensor proxies of the prepared and converted models.
+    if isinstance(x, torch.nn.Parameter):
+        return x
+    if isinstance(x, torch.Tensor):
+        return x.as_subclass(torch.Tensor).detach().clone()
+    return x
+
+class _Placeholder(object):
+    def __init__(self, kind, key):
+        self.kind = kind
+        self.key = key
+
+class _SingleOpModule(torch.nn.Module):
+    r"""
+    Run one op of the model with the captured args, the parameters are kept as
+    parameters, so that they are constants after freezing, and the other tensors
+    are the inputs of the module.
+    """
+
+    def __init__(self, op, args, kwargs):
+        super(_SingleOpModule, self).__init__()
+        self.op = op
+        self.num_params = 0
+        self.inputs = []
+
+        def to_placeholder(x):
+            if isinstance(x, torch.nn.Parameter):
+                name = "param{}".format(self.num_params)
+                self.register_parameter(name, x)
+                self.num_params += 1
+                return _Placeholder("param", name)
+            if isinstance(x, torch.Tensor):
+                self.inputs.append(x)
+                return _Placeholder("input", len(self.inputs) - 1)
+            return x
+        self.args = map_aggregate(args, to_placeholder)
+        self.kwargs = map_aggregate(kwargs, to_placeholder)
+
+    def forward(self, *inputs):
+        def from_placeholder(x):
+            if isinstance(x, _Placeholder):
+                return getattr(self, x.key) if x.kind == "param" else inputs[x.key]
+            return x
+        args = map_aggregate(self.args, from_placeholder)
+        kwargs = map_aggregate(self.kwargs, from_placeholder)
+        return self.op(*args, **kwargs)
+
+def _get_latency(model, inputs, max_time):
+    from ..cpu.benchmark import benchmark
+    with torch.no_grad():
+        return benchmark(model, args=tuple(inputs), min_iterations=10, min_time=0, max_time=max_time).mean
+
+def _measure_op_latency(op, args, kwargs, qconfig, max_time):
+    r"""
+    Measure the FP32 and INT8 latency of one op alone, traced and frozen with the
+    IPEX fusions. The INT8 op is quantized with the default recipe of this op alone.
+    """
+    single_op = _SingleOpModule(op, args, kwargs).eval()
+    inputs = tuple(single_op.inputs)
+    fp32_latency = _get_latency(_freeze(single_op, inputs), inputs, max_time)
+    with warnings.catch_warnings():
+        # The conv+bn folding of prepare doesn't apply to a single op.
+        warnings.simplefilter("ignore")
+        prepared = prepare(single_op, qconfig, example_inputs=inputs, inplace=False)
+    with torch.no_grad():
+        prepared(*inputs)
+    int8_latency = _get_latency(convert(prepared, freeze=True, example_inputs=inputs), inputs, max_time)
+    return fp32_latency, int8_latency
+
+class QuantizationProfile(object):
+    r"""
+    Result of :func:`profile_quantization`, one row per quantizable op ranked by
+    the accuracy/speed tradeoff: the ops which lose the most accuracy for the
+    least speedup come first, they are the best candidates to fall back to FP32.
+    The ops whose latency is not measured come last, ranked by the accuracy loss.
+
+    Attributes:
+        rows (list): A dict per op with the keys ``fqn``, ``op_type``, ``op_idx``,
+            ``quantized``, ``sqnr`` (dB), ``cosine``, ``fp32_ms``, ``int8_ms``
+            and ``speedup``. The latencies are None if not measured.
+    """
+
+    columns = ["fqn", "op_type", "op_idx", "quantized", "sqnr", "cosine", "fp32_ms", "int8_ms", "speedup"]
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def to_dict(self):
+        return {"columns": self.columns, "rows": self.rows}
+
+    def save(self, path):
+        r"""
+        Save the table as a CSV file if ``path`` ends with ".csv", otherwise as a JSON file.
+        """
+        with open(path, 'w') as f:
+            if path.endswith(".csv"):
+                writer = csv.DictWriter(f, fieldnames=self.columns)
+                writer.writeheader()
+                writer.writerows(self.rows)
+            else:
+                json.dump(self.to_dict(), f, indent=2)
+
+    def __repr__(self):
+        def format_value(value):
+            if value is None:
+                return "-"
+            if isinstance(value, float):
+                return "{:.4f}".format(value)
+            return str(value)
+        table = [self.columns] + [[format_value(row[c]) for c in self.columns] for row in self.rows]
+        widths = [max(len(line[i]) for line in table) for i in range(len(self.columns))]
+        return "\n".join("  ".join(v.ljust(w) for v, w in zip(line, widths)) for line in table)
+
+def _get_tradeoff_key(row):
+    # The relative quantization noise, i.e. 1/SQNR, paid per millisecond saved by INT8.
+    # The keys are only compared within the same tier, since they have different units.
+    noise = 10 ** (-row["sqnr"] / 10) if row["sqnr"] != float('inf') else 0.0
+    if row["fp32_ms"] is None or row["int8_ms"] is None:
+        # The latency is not measured, the ops are ranked by the noise after the measured ones.
+        return (0, noise)
+    saved = row["fp32_ms"] - row["int8_ms"]
+    if saved <= 0:
+        # INT8 doesn't speed up the op, any noise is not worth it.
+        return (2, noise)
+    return (1, noise / saved)
+
+def profile_quantization(prepared_model, dataloader, run_fn=None, measure_latency=True, max_time_per_op=1.0):
+    r"""
+    Profile the quantization error and the speedup of each quantizable op of a
+    model prepared by :func:`prepare` and calibrated, or loaded with a qconf summary.
+
+    The quantization error of an op is measured in isolation: the model is run in FP32
+    on each batch of ``dataloader`` to capture the inputs and outputs of each op, then
+    the converted model is run on the same batch, with the inputs of each quantizable
+    op replaced by the captured FP32 inputs, so that the errors of the previous ops don't
+    accumulate. The SQNR and the cosine similarity of each op output are computed
+    against the FP32 output.
+
+    If ``measure_latency`` is True, each op is traced and frozen alone with the inputs
+    captured on the first batch, and its FP32 and INT8 latencies are measured. The INT8
+    op is quantized with the default recipe of the op alone, so the ops quantized only
+    when fused with their neighbours, e.g. relu and pooling, show no speedup.
+
+    Args:
+        prepared_model (torch.nn.Module): The model returned by :func:`prepare`, which
+            is not modified.
+        dataloader (iterable): A small dataset, e.g. a few calibration batches.
+        run_fn (callable): Function to run the model with one batch, called as
+            ``run_fn(model, batch)``. Default to ``model(*batch)`` if the batch
+            is a tuple or list, otherwise ``model(batch)``.
+        measure_latency (bool): Measure the FP32 and INT8 latency of each op.
+        max_time_per_op (float): The maximum seconds to measure each latency.
+
+    Returns:
+        QuantizationProfile: The table of the ops ranked by the accuracy/speed tradeoff.
+    """
+    assert hasattr(prepared_model, '_fqn_to_auto_quant_state_map'), \
+        "Please prepare the model for static quantization before doing profile"
+    if run_fn is None:
+        run_fn = _default_run_fn
+    fp32_model = copy_prepared_model(prepared_model)
+    int8_model = convert(prepared_model)
+    fp32_states = fp32_model._fqn_to_auto_quant_state_map
+    int8_states = int8_model._fqn_to_auto_quant_state_map
+
+    stats = {}
+    captured = {}
+    first_captured = {}
+    num_calls = {}
+
+    # The hooks are overridden per quant state, the key of an op is (quant state key, op index),
+    # and an op is called several times per forward if its parent module is.
+    def capture_fp32(k, qstate):
+        orig_before_hook, orig_after_hook = qstate.op_prepare_before_hook, qstate.op_prepare_after_hook
+
+        def before_hook(op, args, kwargs):
+            args, kwargs = orig_before_hook(op, args, kwargs)
+            key = (k, qstate.idx)
+            inputs = (map_aggregate(args, _to_tensor), map_aggregate(kwargs, _to_tensor))
+            captured.setdefault(key, []).append(inputs)
+            first_captured.setdefault(key, (op,) + inputs)
+            return args, kwargs
+
+        def after_hook(op, outputs, args, global_op_idx):
+            key = (k, qstate.idx)
+            captured[key][-1] = captured[key][-1] + (map_aggregate(outputs, _to_tensor),)
+            return orig_after_hook(op, outputs, args, global_op_idx)
+        object.__setattr__(qstate, 'op_prepare_before_hook', before_hook)
+        object.__setattr__(qstate, 'op_prepare_after_hook', after_hook)
+
+    def replay_int8(k, qstate):
+        orig_before_hook, orig_after_hook = qstate.op_convert_before_hook, qstate.op_convert_after_hook
+
+        def before_hook(op, args, kwargs, root_module):
+            key = (k, qstate.idx)
+            call = num_calls.get(key, 0)
+            if key in captured and call < len(captured[key]):
+                # Keep the tensor proxy class, so that the following ops are still intercepted.
+                proxy_class = next((type(t) for t in _flatten_tensors(args) if not isinstance(t, torch.nn.Parameter)),
+                                   torch.Tensor)
+
+                def to_proxy(x):
+                    if isinstance(x, torch.Tensor) and not isinstance(x, torch.nn.Parameter):
+                        return x.as_subclass(proxy_class)
+                    return x
+                args = map_aggregate(captured[key][call][0], to_proxy)
+                kwargs = map_aggregate(captured[key][call][1], to_proxy)
+            return orig_before_hook(op, args, kwargs, root_module)
+
+        def after_hook(op, outputs):
+            outputs = orig_after_hook(op, outputs)
+            key = (k, qstate.idx)
+            call = num_calls.get(key, 0)
+            num_calls[key] = call + 1
+            if key in captured and call < len(captured[key]):
+                stats.setdefault(key, _QuantizationError()).update(outputs, captured[key][call][2])
+            return outputs
+        object.__setattr__(qstate, 'op_convert_before_hook', before_hook)
+        object.__setattr__(qstate, 'op_convert_after_hook', after_hook)
+
+    for k, qstate in fp32_states.items():
+        capture_fp32(k, qstate)
+    for k, qstate in int8_states.items():
+        replay_int8(k, qstate)
+    with torch.no_grad():
+        for batch in dataloader:
+            captured.clear()
+            num_calls.clear()
+            run_fn(fp32_model, batch)
+            run_fn(int8_model, batch)
+
+    rows = []
+    for k, qstate in int8_states.items():
+        for idx, op_info in qstate.idx_to_seen_q_op_infos.items():
+            if (k, idx) not in stats:
+                continue
+            row = {"fqn": op_info.fqn,
+                   "op_type": op_info.type,
+                   "op_idx": idx,
+                   "quantized": _is_quantized_op(op_info),
+                   "sqnr": stats[(k, idx)].get_sqnr(),
+                   "cosine": stats[(k, idx)].get_cosine(),
+                   "fp32_ms": None,
+                   "int8_ms": None,
+                   "speedup": None}
+            if measure_latency and op_info.qconfig is not None:
+                op, args, kwargs = first_captured[(k, idx)]
+                try:
+                    row["fp32_ms"], row["int8_ms"] = _measure_op_latency(op, args, kwargs, op_info.qconfig, max_time_per_op)
+                    row["speedup"] = row["fp32_ms"] / row["int8_ms"]
+                except Exception as e:
+                    warnings.warn("Fail to measure the latency of {} {}: {}".format(op_info.fqn, op_info.type, e))
+            rows.append(row)
+    rows.sort(key=_get_tradeoff_key, reverse=True)
+    return QuantizationProfile(rows)
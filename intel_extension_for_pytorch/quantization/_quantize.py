@@ -55,9 +55,26 @@ def prepare(
         example_inputs = tuple(example_inputs)
     return auto_prepare(prepare_model, configure, example_inputs)
 
+def _freeze(convert_model, example_inputs):
+    # Trace the converted model to record the quant/dequant ops inserted by the hooks as
+    # explicit graph nodes, so no Python hook runs at inference time.
+    if isinstance(example_inputs, (torch.Tensor, dict)):
+        example_inputs = (example_inputs,)
+    elif not isinstance(example_inputs, tuple):
+        example_inputs = tuple(example_inputs)
+    with torch.no_grad():
+        traced_model = torch.jit.trace(convert_model, example_inputs, check_trace=False, strict=False)
+        traced_model = torch.jit.freeze(traced_model.eval())
+        # The graph is optimized and fused in the first runs.
+        for _ in range(2):
+            traced_model(*example_inputs)
+    return traced_model
+
 def convert(
     model,
-    inplace=False):
+    inplace=False,
+    freeze=False,
+    example_inputs=None):
     r"""
     Convert an FP32 prepared model to a model which will automatically insert fake quant
     before a quantizable module or operator.
@@ -65,12 +82,18 @@ def convert(
     Args:
         model (torch.nn.Module): The FP32 model to be convert.
         inplace: (bool): It will change the given model in-place if True. The default value is ``False``.
+        freeze (bool): Return a frozen TorchScript model traced with ``example_inputs`` if True,
+            where the quantize/dequantize ops are explicit nodes of the graph instead of being
+            inserted by the Python hooks at each call. The model must be traceable, i.e. the
+            control flow doesn't depend on the inputs. The default value is ``False``.
+        example_inputs (tuple or torch.Tensor): Inputs to trace the model when ``freeze`` is True.
 
     Returns:
-        torch.nn.Module
+        torch.nn.Module, or torch.jit.ScriptModule if ``freeze`` is True
     """
     assert isinstance(model, torch.nn.Module), "Only support nn.Module convert for quantization path"
     assert hasattr(model, 'q_config'), "Please do prepare the model before doing convert"
+    assert not freeze or example_inputs is not None, "Please give the example_inputs to freeze the converted model"
 
     if inplace:
         convert_model = model
@@ -91,7 +114,8 @@ def convert(
             torch.nn.RNNCell : convert_model.q_config,
             torch.nn.GRUCell : convert_model.q_config,
         }
-        return torch.quantization.quantize_dynamic(convert_model, qconfig_spec=qconfig_spec, inplace=True)
+        convert_model = torch.quantization.quantize_dynamic(convert_model, qconfig_spec=qconfig_spec, inplace=True)
+        return _freeze(convert_model, example_inputs) if freeze else convert_model
 
     # Convert linear, conv, and Embedding's weight dtype when use autocast,
     # which will reduce the dtype conversion.
@@ -100,4 +124,4 @@ def convert(
         convert_model = nn.utils._model_convert.convert_module_data_type(convert_model, torch.bfloat16)
 
     convert_model = auto_convert(convert_model)
-    return convert_model
+    return _freeze(convert_model, example_inputs) if freeze else convert_model
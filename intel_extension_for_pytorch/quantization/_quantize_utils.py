@@ -340,7 +340,8 @@ def auto_prepare(
 
         def save_qconf_summary(self, qconf_summary):
             r"""
-            This function is about save model's quant_state_map to a json file.
+            This function is about save model's quant_state_map to a json file, or to a binary file
+            which loads faster if the file name ends with ".qconf".
             """
             assert qconf_summary is not None, "A configure file name should be given to save the qconf_summary"
             quant_state_map = self._fqn_to_auto_quant_state_map
@@ -364,13 +365,15 @@ def auto_prepare(
             self._qconf_summary = qconf_summary
             save_quant_state(quant_state_map, qconf_summary)
         
-        def load_qconf_summary(self, qconf_summary):
+        def load_qconf_summary(self, qconf_summary, modules=None):
             r"""
             This function is about load the user qconf_summary, which will overwrite the model's quant_state_map.
+            The qconf_summary can be a json file or a binary file saved with a ".qconf" suffix. If modules (a list
+            of module names) is given, only the quant states of these modules and their submodules are loaded.
             """
             if (os.path.exists(qconf_summary) and os.stat(qconf_summary).st_size != 0):
                 self._qconf_summary = qconf_summary
-                load_qconf_summary_to_model(self, qconf_summary)
+                load_qconf_summary_to_model(self, qconf_summary, modules)
             else:
                 assert False, "Can not load a empty file or none existed file" + qconf_summary
 
@@ -3,6 +3,8 @@ import json
 from collections import OrderedDict
 from typing import Callable, Optional
 import inspect
+import math
+import mmap
 import numbers
 
 import torch
@@ -441,6 +443,60 @@ def set_node_output_quantized(nodes):
                         node.insert_fake_quant_after_outputs[0] = True
                         _reset_post_node_input_infos(node)
 
+def _is_quantized_op(q_op_info):
+    r"""
+    Whether the recipe quantizes the inputs or the weights of the op.
+    """
+    quantized_dtype = [torch.qint8, torch.quint8]
+    return any(dtype in quantized_dtype for dtype in q_op_info.input_tensor_force_inf_dtype) or \
+        any(info is not None and info.inf_dtype in quantized_dtype for info in q_op_info.weight_tensor_infos)
+
+def _flatten_tensors(output):
+    if isinstance(output, torch.Tensor):
+        return [output]
+    if isinstance(output, (tuple, list)):
+        return [t for o in output for t in _flatten_tensors(o)]
+    if isinstance(output, dict):
+        return [t for o in output.values() for t in _flatten_tensors(o)]
+    return []
+
+class _QuantizationError(object):
+    r"""
+    Accumulate the error of the floating point tensors of the outputs against the
+    reference outputs, e.g. of the quantized model against the FP32 model.
+    """
+    def __init__(self):
+        self.error = 0.0
+        self.energy = 0.0
+        self.dot = 0.0
+        self.norm = 0.0
+
+    def update(self, output, ref_output):
+        for t, ref in zip(_flatten_tensors(output), _flatten_tensors(ref_output)):
+            if not ref.is_floating_point():
+                continue
+            # Unwrap the tensor proxies of the prepared and converted models.
+            t, ref = t.as_subclass(torch.Tensor).float(), ref.as_subclass(torch.Tensor).float()
+            self.error += (t - ref).pow(2).sum().item()
+            self.energy += ref.pow(2).sum().item()
+            self.dot += (t * ref).sum().item()
+            self.norm += t.pow(2).sum().item()
+        return self
+
+    def get_relative_error(self):
+        # The squared error relative to the energy of the reference, i.e. 1/SQNR.
+        return self.error / max(self.energy, 1e-12)
+
+    def get_sqnr(self):
+        if self.error == 0:
+            return float('inf')
+        return 10 * math.log10(max(self.energy, 1e-30) / self.error)
+
+    def get_cosine(self):
+        if self.energy == 0 or self.norm == 0:
+            return 1.0 if self.error == 0 else 0.0
+        return self.dot / math.sqrt(self.energy * self.norm)
+
 qscheme_dict = {
     str(torch.per_tensor_affine): torch.per_tensor_affine,
     str(torch.per_tensor_symmetric): torch.per_tensor_symmetric,
@@ -505,8 +561,135 @@ def _create_observer(setting):
     else:
         raise NameError('torch.quantization.observer %s not found' % setting["name"])
 
+# The binary qconf summary, saved if the file name ends with ".qconf":
+#   magic | version (uint64) | index size (uint64) | index | records | padding | blob
+# The index is a JSON dict of {quant state key: [record offset, record size]} plus
+# "blob_offset", each record is the JSON of a quant state like the JSON summary, but
+# the scales and zero points are [offset, numel] of float32 and int64 arrays in the blob,
+# so that they are loaded from the memory mapped file without copy.
+_QCONF_MAGIC = b"IPEXQCNF"
+_QCONF_VERSION = 1
+_QCONF_BINARY_SUFFIX = ".qconf"
+_QCONF_BLOB_ALIGNMENT = 64
+_QCONF_SCALE_DTYPE = torch.float32
+_QCONF_ZP_DTYPE = torch.int64
+
+def _get_scale_zp_tensor_infos(layer_infos):
+    r"""
+    Yield the tensor infos with scale and zero point of a quant state dict.
+    """
+    for op_info in layer_infos["q_op_infos"].values():
+        for key in ["input_tensor_infos", "weight_tensor_infos", "output_tensor_infos"]:
+            for tensor_info in op_info[key]:
+                if "scale" in tensor_info:
+                    yield tensor_info
+    for tensor_info in layer_infos["layer_output_infos"]:
+        if "scale" in tensor_info:
+            yield tensor_info
+
+def _save_quant_state_dict_binary(quant_state_dict, configure_file):
+    blob = bytearray()
+    def add_to_blob(t, dtype):
+        offset = len(blob)
+        blob.extend(t.detach().to(dtype).contiguous().reshape(-1).numpy().tobytes())
+        # Keep the arrays aligned to their element size for the zero-copy views.
+        blob.extend(bytes(-len(blob) % 8))
+        return [offset, t.numel()]
+
+    records = bytearray()
+    index = OrderedDict()
+    for k, layer_infos in quant_state_dict.items():
+        for tensor_info in _get_scale_zp_tensor_infos(layer_infos):
+            tensor_info["scale"] = add_to_blob(tensor_info["scale"], _QCONF_SCALE_DTYPE)
+            tensor_info["zero_point"] = add_to_blob(tensor_info["zero_point"], _QCONF_ZP_DTYPE)
+        record = json.dumps(layer_infos).encode("utf-8")
+        index[k] = [len(records), len(record)]
+        records.extend(record)
+
+    # The offsets in the index are relative to the end of the index, whose size depends on
+    # the blob offset, so the blob offset is given a fixed width.
+    index["blob_offset"] = "{:020d}".format(0)
+    header_size = len(_QCONF_MAGIC) + 16 + len(json.dumps(index).encode("utf-8"))
+    blob_offset = header_size + len(records)
+    blob_offset += -blob_offset % _QCONF_BLOB_ALIGNMENT
+    index["blob_offset"] = "{:020d}".format(blob_offset)
+    index = json.dumps(index).encode("utf-8")
+    with open(configure_file, 'wb') as fp:
+        fp.write(_QCONF_MAGIC)
+        fp.write(_QCONF_VERSION.to_bytes(8, "little"))
+        fp.write(len(index).to_bytes(8, "little"))
+        fp.write(index)
+        fp.write(records)
+        fp.write(bytes(blob_offset - header_size - len(records)))
+        fp.write(blob)
+
+def _is_binary_qconf_summary(qconf_summary):
+    with open(qconf_summary, 'rb') as f:
+        return f.read(len(_QCONF_MAGIC)) == _QCONF_MAGIC
+
+def _select_quant_state_keys(keys, modules):
+    r"""
+    Select the keys of the quant states of ``modules`` and their submodules.
+    """
+    if modules is None:
+        return list(keys)
+    selected = []
+    for name in modules:
+        if name == '':
+            return list(keys)
+        key = get_fqn_valid_for_module_dict_key(name)
+        matched = [k for k in keys if k == key or k.startswith(key + ':')]
+        assert len(matched) > 0, "The qconf summary doesn't have the quant state of module {}".format(name)
+        selected += [k for k in matched if k not in selected]
+    return selected
+
+def _load_quant_state_dict(qconf_summary, modules=None):
+    r"""
+    Load the quant states of ``modules`` (all if None) from a JSON or binary qconf summary,
+    with the scales and zero points as tensors.
+    """
+    if not _is_binary_qconf_summary(qconf_summary):
+        with open(qconf_summary, 'r') as f:
+            quant_state_dict = json.load(f)
+        quant_state_dict = OrderedDict(
+            (k, quant_state_dict[k]) for k in _select_quant_state_keys(quant_state_dict.keys(), modules))
+        for layer_infos in quant_state_dict.values():
+            for tensor_info in _get_scale_zp_tensor_infos(layer_infos):
+                tensor_info["scale"] = torch.FloatTensor(tensor_info["scale"])
+                tensor_info["zero_point"] = torch.LongTensor(tensor_info["zero_point"])
+        return quant_state_dict
+
+    with open(qconf_summary, 'rb') as f:
+        # Copy-on-write mapping, so the tensors are writable but never change the file.
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    header_size = len(_QCONF_MAGIC) + 16
+    version = int.from_bytes(buffer[len(_QCONF_MAGIC):len(_QCONF_MAGIC) + 8], "little")
+    assert version <= _QCONF_VERSION, "The qconf summary version {} is not supported".format(version)
+    index_size = int.from_bytes(buffer[len(_QCONF_MAGIC) + 8:header_size], "little")
+    index = json.loads(buffer[header_size:header_size + index_size].decode("utf-8"))
+    records_offset = header_size + index_size
+    blob_offset = int(index.pop("blob_offset"))
+
+    def from_blob(location, dtype):
+        offset, numel = location
+        if numel == 0:
+            return torch.empty(0, dtype=dtype)
+        # The tensor keeps a reference of the mapping.
+        return torch.frombuffer(buffer, dtype=dtype, count=numel, offset=blob_offset + offset)
+
+    quant_state_dict = OrderedDict()
+    for k in _select_quant_state_keys(index.keys(), modules):
+        offset, size = index[k]
+        start = records_offset + offset
+        layer_infos = json.loads(buffer[start:start + size].decode("utf-8"))
+        for tensor_info in _get_scale_zp_tensor_infos(layer_infos):
+            tensor_info["scale"] = from_blob(tensor_info["scale"], _QCONF_SCALE_DTYPE)
+            tensor_info["zero_point"] = from_blob(tensor_info["zero_point"], _QCONF_ZP_DTYPE)
+        quant_state_dict[k] = layer_infos
+    return quant_state_dict
+
 def save_quant_state(quant_state_map, configure_file):
-    # save qparam's as json file for tunning
+    # save qparam's as json file for tunning, or as binary file for fast loading.
     quant_state_dict = OrderedDict()
     for k, v in quant_state_map.items():
         layer_infos = OrderedDict()
@@ -529,8 +712,8 @@ def save_quant_state(quant_state_map, configure_file):
                         cur_tensor_infos["inf_dtype"] = str(tensor_info.inf_dtype)
                         cur_tensor_infos["force_dtype"] = str(force_dtype)
                         if tensor_info.id in v.tensor_id_to_scale_zp:
-                            cur_tensor_infos["scale"] = v.tensor_id_to_scale_zp[tensor_info.id][0].tolist()
-                            cur_tensor_infos["zero_point"] = v.tensor_id_to_scale_zp[tensor_info.id][1].tolist()
+                            cur_tensor_infos["scale"] = v.tensor_id_to_scale_zp[tensor_info.id][0]
+                            cur_tensor_infos["zero_point"] = v.tensor_id_to_scale_zp[tensor_info.id][1]
                     input_tensor_infos.append(cur_tensor_infos)
                 info["input_tensor_infos"] = input_tensor_infos
                 # weight infos
@@ -542,8 +725,8 @@ def save_quant_state(quant_state_map, configure_file):
                         cur_tensor_infos["inf_dtype"] = str(tensor_info.inf_dtype)
                         weight_idx = str(op_info.idx) + "_" + str(tensor_info.id)
                         if weight_idx in v.weight_tensor_id_to_scale_zp:
-                            cur_tensor_infos["scale"] = v.weight_tensor_id_to_scale_zp[weight_idx][0].tolist()
-                            cur_tensor_infos["zero_point"] = v.weight_tensor_id_to_scale_zp[weight_idx][1].tolist()
+                            cur_tensor_infos["scale"] = v.weight_tensor_id_to_scale_zp[weight_idx][0]
+                            cur_tensor_infos["zero_point"] = v.weight_tensor_id_to_scale_zp[weight_idx][1]
                     weight_tensor_infos.append(cur_tensor_infos)
                 info["weight_tensor_infos"] = weight_tensor_infos
                 # output infos
@@ -555,8 +738,8 @@ def save_quant_state(quant_state_map, configure_file):
                         cur_tensor_infos["orig_dtype"] = str(tensor_info.orig_dtype)
                         cur_tensor_infos["inf_dtype"] = str(tensor_info.inf_dtype)
                         if tensor_info.id in v.tensor_id_to_scale_zp:
-                            cur_tensor_infos["scale"] = v.tensor_id_to_scale_zp[tensor_info.id][0].tolist()
-                            cur_tensor_infos["zero_point"] = v.tensor_id_to_scale_zp[tensor_info.id][1].tolist()
+                            cur_tensor_infos["scale"] = v.tensor_id_to_scale_zp[tensor_info.id][0]
+                            cur_tensor_infos["zero_point"] = v.tensor_id_to_scale_zp[tensor_info.id][1]
                     output_tensor_infos.append(cur_tensor_infos)
                 info["output_tensor_infos"] = output_tensor_infos
                 # qconfig
@@ -600,24 +783,31 @@ def save_quant_state(quant_state_map, configure_file):
                 cur_tensor_infos["orig_dtype"] = str(tensor_info.orig_dtype)
                 cur_tensor_infos["inf_dtype"] = str(tensor_info.inf_dtype)
                 if tensor_info.id in v.tensor_id_to_scale_zp:
-                    cur_tensor_infos["scale"] = v.tensor_id_to_scale_zp[tensor_info.id][0].tolist()
-                    cur_tensor_infos["zero_point"] = v.tensor_id_to_scale_zp[tensor_info.id][1].tolist()
+                    cur_tensor_infos["scale"] = v.tensor_id_to_scale_zp[tensor_info.id][0]
+                    cur_tensor_infos["zero_point"] = v.tensor_id_to_scale_zp[tensor_info.id][1]
             layer_output_infos.append(cur_tensor_infos)
         layer_infos["layer_output_infos"] = layer_output_infos
         quant_state_dict[k] = layer_infos
     # save qparms as json file
     if configure_file is not None:
-        with open(configure_file, 'w') as fp:
-            json.dump(quant_state_dict, fp, indent = 4)
+        if configure_file.endswith(_QCONF_BINARY_SUFFIX):
+            _save_quant_state_dict_binary(quant_state_dict, configure_file)
+        else:
+            with open(configure_file, 'w') as fp:
+                json.dump(quant_state_dict, fp, indent = 4, default=lambda t: t.tolist())
 
-def load_qconf_summary_to_model(model, qconf_summary):
+def load_qconf_summary_to_model(model, qconf_summary, modules=None):
     """
     This function is about load the user given configure to origin model.
+    If modules is given, only the quant states of these modules and their
+    submodules are loaded, and the other modules keep their current states.
     """
-    with open(qconf_summary, 'r') as f:
-        quant_state_dict = json.load(f)
+    quant_state_dict = _load_quant_state_dict(qconf_summary, modules)
     quant_state_map = model._fqn_to_auto_quant_state_map
     for k, v in quant_state_map.items():
+        if k not in quant_state_dict:
+            assert modules is not None, "The qconf summary doesn't have the quant state of module {}".format(k)
+            continue
         layer_info = quant_state_dict[k]
         user_q_op_infos = layer_info["q_op_infos"]
         for i, q_op_info in user_q_op_infos.items():
@@ -632,8 +822,8 @@ def load_qconf_summary_to_model(model, qconf_summary):
                     input_tensor_infos.append(QTensorInfo(tensor_info["id"], dtype_dict[tensor_info["orig_dtype"]], dtype_dict[tensor_info["inf_dtype"]]))
                     input_force_dtype_infos.append(dtype_dict[tensor_info["force_dtype"]])
                     if "scale" in tensor_info:
-                        scale = torch.FloatTensor(tensor_info["scale"])
-                        zp = torch.LongTensor(tensor_info["zero_point"])
+                        scale = tensor_info["scale"]
+                        zp = tensor_info["zero_point"]
                         v.tensor_id_to_scale_zp[tensor_info["id"]] = (scale, zp)
                 else:
                     input_tensor_infos.append(None)
@@ -644,8 +834,8 @@ def load_qconf_summary_to_model(model, qconf_summary):
                 if len(tensor_info) > 0:
                     weight_tensor_infos.append(QTensorInfo(weight_idx, dtype_dict[tensor_info["orig_dtype"]], dtype_dict[tensor_info["inf_dtype"]]))
                     if "scale" in tensor_info:
-                        scale = torch.FloatTensor(tensor_info["scale"])
-                        zp = torch.LongTensor(tensor_info["zero_point"])
+                        scale = tensor_info["scale"]
+                        zp = tensor_info["zero_point"]
                         v.weight_tensor_id_to_scale_zp[str(i) + "_" + str(weight_idx)] = (scale, zp)
                     weight_idx += 1
                 else:
@@ -657,8 +847,8 @@ def load_qconf_summary_to_model(model, qconf_summary):
                     output_tensor_infos.append(QTensorInfo(tensor_info["id"], dtype_dict[tensor_info["orig_dtype"]], dtype_dict[tensor_info["inf_dtype"]]))
                     insert_fake_quant_after_outputs.append(False)
                     if "scale" in tensor_info:
-                        scale = torch.FloatTensor(tensor_info["scale"])
-                        zp = torch.LongTensor(tensor_info["zero_point"])
+                        scale = tensor_info["scale"]
+                        zp = tensor_info["zero_point"]
                         v.tensor_id_to_scale_zp[tensor_info["id"]] = (scale, zp)
                 else:
                     output_tensor_infos.append(None)
@@ -701,15 +891,15 @@ def load_qconf_summary_to_model(model, qconf_summary):
             if len(tensor_info) > 0:
                 layer_output_info.append(QTensorInfo(tensor_info["id"], dtype_dict[tensor_info["orig_dtype"]], dtype_dict[tensor_info["inf_dtype"]]))
                 if "scale" in tensor_info:
-                    scale = torch.FloatTensor(tensor_info["scale"])
-                    zp = torch.LongTensor(tensor_info["zero_point"])
+                    scale = tensor_info["scale"]
+                    zp = tensor_info["zero_point"]
                     v.tensor_id_to_scale_zp[tensor_info["id"]] = (scale, zp)
             else:
                 layer_output_info.append(None)
         v.output_qtensor_infos = layer_output_info
     # insert observer according to user's setting.
-    for _, v in model.named_modules():
-        if hasattr(v, '_auto_quant_state'):
+    for name, v in model.named_modules():
+        if hasattr(v, '_auto_quant_state') and get_fqn_valid_for_module_dict_key(name) in quant_state_dict:
             v._auto_quant_state.tensor_id_to_observer.clear()
             v._auto_quant_state.weight_tensor_id_to_observer.clear()
             v._auto_quant_state.insert_observers(v)
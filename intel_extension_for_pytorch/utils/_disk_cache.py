@@ -0,0 +1,102 @@
+import os
+import json
+import hashlib
+import tempfile
+import torch
+
+def get_cache_dir(sub_dir=None):
+    r"""
+    Get the directory used by Intel® Extension for PyTorch* to cache results
+    on disk across processes. It is ``$IPEX_CACHE_DIR`` if set, otherwise
+    ``$XDG_CACHE_HOME/intel_extension_for_pytorch`` (``~/.cache`` by default).
+    """
+    cache_dir = os.environ.get("IPEX_CACHE_DIR")
+    if cache_dir is None:
+        xdg_cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+        cache_dir = os.path.join(xdg_cache_home, "intel_extension_for_pytorch")
+    if sub_dir is not None:
+        cache_dir = os.path.join(cache_dir, sub_dir)
+    return cache_dir
+
+def get_hash(*items):
+    # Stable hash of the str of the items, used as the key of cache entries.
+    sha = hashlib.sha256()
+    for item in items:
+        sha.update(str(item).encode("utf-8"))
+        sha.update(b"\0")
+    return sha.hexdigest()
+
+def get_model_signature(model):
+    r"""
+    Hash of the model structure, together with the name, shape and dtype of its
+    parameters and buffers. The values of the parameters are not included.
+    """
+    items = [type(model).__qualname__]
+    if isinstance(model, torch.jit.ScriptModule):
+        items.append(model.inlined_graph if hasattr(model, "inlined_graph") else model.graph)
+    else:
+        items.append(repr(model))
+    if isinstance(model, torch.nn.Module):
+        for name, tensor in list(model.named_parameters()) + list(model.named_buffers()):
+            items.append((name, tuple(tensor.shape), tensor.dtype))
+    return get_hash(*items)
+
+def get_weights_hash(model):
+    r"""
+    Hash of the values of the parameters and buffers of the model, so that the
+    results cached for a model are not reused after its weights change.
+    """
+    sha = hashlib.sha256()
+    for name, tensor in list(model.named_parameters()) + list(model.named_buffers()):
+        sha.update(name.encode("utf-8"))
+        tensor = tensor.detach()
+        if tensor.is_quantized:
+            tensor = tensor.int_repr()
+        if tensor.layout != torch.strided:
+            # The bytes of opaque tensors are not accessible, only the metadata is hashed.
+            sha.update(str((tuple(tensor.shape), tensor.dtype, tensor.layout)).encode("utf-8"))
+            continue
+        sha.update(memoryview(tensor.cpu().contiguous().view(-1).view(torch.uint8).numpy()))
+    return sha.hexdigest()
+
+def get_inputs_signature(inputs):
+    r"""
+    Signature of the (nested) inputs: shape and dtype of each tensor, and the
+    value of other objects.
+    """
+    if isinstance(inputs, torch.Tensor):
+        return ("Tensor", tuple(inputs.shape), str(inputs.dtype))
+    elif isinstance(inputs, (list, tuple)):
+        return tuple(get_inputs_signature(x) for x in inputs)
+    elif isinstance(inputs, dict):
+        return tuple((key, get_inputs_signature(inputs[key])) for key in sorted(inputs.keys(), key=str))
+    return repr(inputs)
+
+def load_json_cache(cache_file):
+    r"""
+    Load the dict stored in ``cache_file``. Return an empty dict if the file
+    doesn't exist or can't be parsed.
+    """
+    try:
+        with open(cache_file, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def update_json_cache(cache_file, key, value):
+    r"""
+    Set ``key`` to ``value`` in the dict stored in ``cache_file``. The file is
+    replaced atomically, so concurrent processes never read a partial file.
+    Failure to write the cache is ignored.
+    """
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        cache = load_json_cache(cache_file)
+        cache[key] = value
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cache_file)))
+        with os.fdopen(fd, "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
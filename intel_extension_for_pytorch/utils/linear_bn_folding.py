@@ -1,11 +1,11 @@
 import torch.nn as nn
 import torch.fx as fx
-import torch.fx.experimental.optimization as optimization
 from torch.nn.utils.fusion import fuse_linear_bn_eval
 import copy
 
 def linear_bn_fuse(model: nn.Module, inplace=False) -> nn.Module:
     # implementation follows https://github.com/pytorch/pytorch/blob/master/torch/fx/experimental/optimization.py#L50 
+    import torch.fx.experimental.optimization as optimization
     patterns = [(nn.Linear, nn.BatchNorm1d),
               (nn.Linear, nn.BatchNorm2d),
               (nn.Linear, nn.BatchNorm3d),
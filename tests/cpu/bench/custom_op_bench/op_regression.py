@@ -0,0 +1,361 @@
+r"""
+Performance regression suite of the custom operators and fused kernels.
+Each case is measured with the IPEX kernel and with the stock PyTorch
+fallback, for the given dtypes and thread counts, and the results are saved
+into a JSON file which can be compared with the results of another release.
+
+The operators only available through the JIT fusion (e.g. AddLayerNorm) are
+measured with a traced and frozen model, where the stock PyTorch fallback is
+the same model with the IPEX JIT fusion disabled.
+"""
+
+import torch
+import intel_extension_for_pytorch as ipex
+from intel_extension_for_pytorch.cpu import benchmark
+import argparse
+import copy
+import itertools
+import math
+import sys
+from optimizer import non_fused_sgd, non_fused_lamb, non_fused_adagrad, non_fused_adam
+
+def _trace(model, inputs, jit_opt, autocast=False):
+    previous_jit_opt = ipex._C.get_jit_opt()
+    ipex.enable_onednn_fusion(jit_opt)
+    try:
+        with torch.no_grad(), torch.cpu.amp.autocast(enabled=autocast):
+            traced = torch.jit.freeze(torch.jit.trace(model, inputs).eval())
+            # The fusion passes are applied to the graph in the first runs.
+            for _ in range(3):
+                traced(*inputs)
+    finally:
+        ipex.enable_onednn_fusion(previous_jit_opt)
+
+    def run():
+        with torch.no_grad(), torch.cpu.amp.autocast(enabled=autocast):
+            return traced(*inputs)
+    return run
+
+def _jit_case(model, inputs, dtype, optimize=False):
+    # Returns the ipex and stock functions of a model fused by the IPEX JIT passes.
+    # Models needing ipex.optimize are run with autocast for bf16 like the unit tests.
+    inputs = tuple(x.to(dtype) if x.is_floating_point() else x for x in inputs)
+    model = model.eval()
+    if optimize:
+        autocast = dtype == torch.bfloat16
+        ipex_model = ipex.optimize(copy.deepcopy(model), dtype=dtype)
+        stock_model = model
+    else:
+        autocast = False
+        ipex_model = copy.deepcopy(model).to(dtype)
+        stock_model = copy.deepcopy(model).to(dtype)
+    return _trace(ipex_model, inputs, True, autocast), _trace(stock_model, inputs, False, autocast)
+
+class AddLayerNorm(torch.nn.Module):
+    def __init__(self, size):
+        super(AddLayerNorm, self).__init__()
+        self.layer_norm = torch.nn.LayerNorm(size)
+
+    def forward(self, a, b):
+        return self.layer_norm(torch.add(a, b))
+
+class RMSNorm(torch.nn.Module):
+    def __init__(self, hidden_size, eps=1e-6):
+        super(RMSNorm, self).__init__()
+        self.weight = torch.nn.Parameter(torch.ones(hidden_size))
+        self.variance_epsilon = eps
+
+    def forward(self, hidden_states):
+        variance = hidden_states.pow(2).mean(-1, keepdim=True)
+        hidden_states = hidden_states * torch.rsqrt(variance + self.variance_epsilon)
+        return self.weight * hidden_states
+
+class DivMaskedfillSoftmax(torch.nn.Module):
+    def __init__(self, dim_per_head, fill_value=-1e9):
+        super(DivMaskedfillSoftmax, self).__init__()
+        self.dim_per_head = dim_per_head
+        self.fill = fill_value
+
+    def forward(self, mat1, mat2, mask):
+        mask_shape = [mat1.shape[0], 1, 1, mat1.shape[3]]
+        mat1 = mat1 / math.sqrt(self.dim_per_head)
+        qk = torch.matmul(mat1, mat2.transpose(2, 3))
+        mask = (mask == 0).view(mask_shape).expand_as(qk)
+        qk = qk.masked_fill(mask, self.fill)
+        return torch.nn.functional.softmax(qk, dim=-1)
+
+class BertMHA(torch.nn.Module):
+    def __init__(self, num_heads, head_dims):
+        super(BertMHA, self).__init__()
+        self.scale = math.sqrt(head_dims)
+        self.num_heads = num_heads
+        self.head_dims = head_dims
+        self.embed_dims = num_heads * head_dims
+        self.query = torch.nn.Linear(self.embed_dims, self.embed_dims)
+        self.key = torch.nn.Linear(self.embed_dims, self.embed_dims)
+        self.value = torch.nn.Linear(self.embed_dims, self.embed_dims)
+
+    def transpose_for_scores(self, x):
+        new_x_shape = x.size()[:-1] + (self.num_heads, self.head_dims)
+        return x.view(new_x_shape).permute(0, 2, 1, 3)
+
+    def forward(self, x, mask):
+        query_layer = self.transpose_for_scores(self.query(x))
+        key_layer = self.transpose_for_scores(self.key(x)).transpose(-1, -2)
+        value_layer = self.transpose_for_scores(self.value(x))
+        attention_scores = torch.matmul(query_layer, key_layer) / self.scale + mask
+        attention_probs = torch.nn.functional.softmax(attention_scores, dim=-1)
+        context_layer = torch.matmul(attention_probs, value_layer).permute(0, 2, 1, 3).contiguous()
+        return context_layer.view(context_layer.size()[:-2] + (self.embed_dims,))
+
+class ConcatBnRelu(torch.nn.Module):
+    def __init__(self, in_channels):
+        super(ConcatBnRelu, self).__init__()
+        self.bn = torch.nn.BatchNorm2d(in_channels)
+        self.relu = torch.nn.ReLU()
+
+    def forward(self, x1, x2, x3):
+        return self.relu(self.bn(torch.cat((x1, x2, x3), dim=1)))
+
+def add_layernorm_cases(dtype):
+    for shape in [(64, 384, 768), (16, 512, 1024)]:
+        a, b = torch.randn(shape), torch.randn(shape)
+        yield shape, _jit_case(AddLayerNorm(shape[-1]), (a, b), dtype)
+
+def rms_norm_cases(dtype):
+    for shape in [(64, 384, 768), (1, 2048, 4096)]:
+        yield shape, _jit_case(RMSNorm(shape[-1]), (torch.randn(shape),), dtype)
+
+def add_softmax_cases(dtype):
+    for shape in [(64, 12, 384, 384), (16, 16, 512, 512)]:
+        a, b = torch.randn(shape).to(dtype), torch.randn(shape).to(dtype)
+
+        # Both ops update a in place, a fresh copy is used in every call to keep the inputs unchanged.
+        def stock(a=a, b=b):
+            return torch.softmax(a.clone().add_(b), dim=-1)
+        yield shape, (lambda a=a, b=b: torch.ops.torch_ipex.add_softmax_(a.clone(), b), stock)
+
+def div_softmax_cases(dtype):
+    for bs, num_heads, seq_len, head_dims in [(64, 12, 384, 64), (16, 16, 512, 64)]:
+        mat1 = torch.randn(bs, num_heads, seq_len, head_dims)
+        mat2 = torch.randn(bs, num_heads, seq_len, head_dims)
+        mask = (torch.rand(bs, seq_len) > 0.1).to(torch.long)
+        yield (bs, num_heads, seq_len, head_dims), _jit_case(DivMaskedfillSoftmax(head_dims), (mat1, mat2, mask), dtype)
+
+def mha_cases(dtype):
+    for bs, seq_len, num_heads, head_dims in [(64, 384, 12, 64), (16, 512, 16, 64)]:
+        x = torch.randn(bs, seq_len, num_heads * head_dims)
+        mask = torch.randn(bs, 1, 1, seq_len)
+        yield (bs, seq_len, num_heads, head_dims), _jit_case(BertMHA(num_heads, head_dims), (x, mask), dtype, optimize=True)
+
+def concat_bn_relu_cases(dtype):
+    for bs, channels, size in [(32, 64, 56), (32, 256, 14)]:
+        inputs = tuple(torch.randn(bs, channels, size, size).to(memory_format=torch.channels_last) for _ in range(3))
+        model = ConcatBnRelu(channels * 3).to(memory_format=torch.channels_last)
+        yield (bs, channels * 3, size, size), _jit_case(model, inputs, dtype, optimize=True)
+
+def _roi_align_ref(input, rois, pooled_height, pooled_width, spatial_scale, sampling_ratio):
+    # Vectorized aligned RoIAlign in PyTorch ops, with a fixed sampling ratio.
+    height, width = input.shape[-2:]
+    boxes = rois[:, 1:] * spatial_scale - 0.5
+    grid = (torch.arange(pooled_height * sampling_ratio, dtype=boxes.dtype) + 0.5) / sampling_ratio
+    y = boxes[:, 1:2] + grid * ((boxes[:, 3:4] - boxes[:, 1:2]) / pooled_height)
+    grid = (torch.arange(pooled_width * sampling_ratio, dtype=boxes.dtype) + 0.5) / sampling_ratio
+    x = boxes[:, 0:1] + grid * ((boxes[:, 2:3] - boxes[:, 0:1]) / pooled_width)
+    y, x = y.clamp(0, height - 1), x.clamp(0, width - 1)
+    y_low, x_low = y.floor().long(), x.floor().long()
+    y_high, x_high = (y_low + 1).clamp(max=height - 1), (x_low + 1).clamp(max=width - 1)
+    ly, lx = (y - y_low)[:, :, None, None], (x - x_low)[:, None, :, None]
+    batch_idx = rois[:, 0].long()[:, None, None]
+
+    def at(yy, xx):
+        # [K, PH * sr, PW * sr, C]
+        return input[batch_idx, :, yy[:, :, None], xx[:, None, :]]
+    val = at(y_low, x_low) * (1 - ly) * (1 - lx) + at(y_low, x_high) * (1 - ly) * lx + \
+          at(y_high, x_low) * ly * (1 - lx) + at(y_high, x_high) * ly * lx
+    val = val.view(rois.size(0), pooled_height, sampling_ratio, pooled_width, sampling_ratio, -1).mean(dim=(2, 4))
+    return val.permute(0, 3, 1, 2)
+
+def roi_align_cases(dtype):
+    for bs, channels, size, num_rois in [(2, 256, 200, 1000), (2, 256, 50, 1000)]:
+        x = torch.randn(bs, channels, size, size).to(dtype)
+        xy = torch.rand(num_rois, 2) * size * 0.8
+        wh = torch.rand(num_rois, 2) * size * 0.2 + 1
+        rois = torch.cat([torch.randint(0, bs, (num_rois, 1)).float(), xy, xy + wh], dim=1).to(dtype)
+        roi_align = ipex.nn.modules._roi_align.RoIAlign((7, 7), spatial_scale=1.0, sampling_ratio=2, aligned=True)
+        yield (bs, channels, size, num_rois), (lambda x=x, rois=rois: roi_align(x, rois),
+                                               lambda x=x, rois=rois: _roi_align_ref(x, rois, 7, 7, 1.0, 2))
+
+def _nms_ref(dets, scores, threshold):
+    # Greedy NMS with the IoU matrix computed by PyTorch ops.
+    area = (dets[:, 2] - dets[:, 0]) * (dets[:, 3] - dets[:, 1])
+    lt = torch.max(dets[:, None, :2], dets[None, :, :2])
+    rb = torch.min(dets[:, None, 2:], dets[None, :, 2:])
+    inter = (rb - lt).clamp(min=0).prod(dim=2)
+    iou = inter / (area[:, None] + area[None, :] - inter)
+    order = scores.argsort(descending=True)
+    suppressed = torch.zeros(dets.size(0), dtype=torch.bool)
+    keep = []
+    for i in order.tolist():
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        suppressed |= iou[i] > threshold
+    return torch.tensor(keep, dtype=torch.long)
+
+def nms_cases(dtype):
+    if dtype != torch.float32:
+        return
+    for num_boxes in [1000, 5000]:
+        xy = torch.rand(num_boxes, 2)
+        dets = torch.cat([xy, xy + torch.rand(num_boxes, 2) * 0.2], dim=1)
+        scores = torch.rand(num_boxes)
+        yield (num_boxes,), (lambda dets=dets, scores=scores: torch.ops.torch_ipex.nms(dets, scores, 0.5, False),
+                             lambda dets=dets, scores=scores: _nms_ref(dets, scores, 0.5))
+
+def cumsum_cases(dtype):
+    for shape in [(17, 4097), (1024, 16384)]:
+        x = torch.randn(shape).to(dtype)
+        yield shape, (lambda x=x: torch.ops.torch_ipex.cumsum(x, 1), lambda x=x: torch.cumsum(x, 1))
+
+def rnnt_embedding_cases(dtype):
+    sos = -1
+    for batch_size, vocab_size, embedding_dim in [(448, 29, 320), (1024, 1024, 512)]:
+        embedding = torch.nn.Embedding(vocab_size, embedding_dim).to(dtype)
+        y_in = torch.randint(-1, vocab_size, (batch_size, 1))
+        y = torch.empty([batch_size, 1, embedding_dim], dtype=dtype)
+
+        def stock(y_in=y_in, embedding=embedding):
+            y_mask = y_in.eq(sos)
+            y = embedding(y_in.masked_fill(y_mask, 0))
+            return y.masked_fill_(y_mask.unsqueeze(2), 0.0)
+        yield (batch_size, vocab_size, embedding_dim), (
+            lambda y_in=y_in, y=y, embedding=embedding: torch.ops.torch_ipex.rnnt_embedding(
+                embedding.weight, y_in, y, sos, batch_size, embedding_dim),
+            stock)
+
+def _optimizer_tensors(param_size, dtype, num_states):
+    # The bf16 parameters are updated with the fp32 master weights split into the bf16 parameters and the trails.
+    param = torch.randn(param_size)
+    grad = torch.randn(param_size)
+    states = [torch.randn(param_size).abs() for _ in range(num_states)]
+    if dtype == torch.bfloat16:
+        return param.bfloat16(), grad.bfloat16(), states, torch.randn(param_size).bfloat16(), param, grad
+    return param, grad, states, torch.Tensor(), param.clone(), grad
+
+def _with_bf16_copy(dtype, update, param):
+    # The stock fallback of the bf16 training keeps the fp32 master weights and copies them to the bf16 parameters.
+    if dtype != torch.bfloat16:
+        return update
+
+    def run():
+        update()
+        return param.bfloat16()
+    return run
+
+def sgd_cases(dtype):
+    momentum, lr, weight_decay, dampening, nesterov = 0.5, 0.1, 0.3, 0.5, True
+    for param_size in [512 * 1024, 8 * 1024 * 1024]:
+        param, grad, (buf,), trail, ref_param, ref_grad = _optimizer_tensors(param_size, dtype, 1)
+        ref_buf = buf.clone()
+        yield (param_size,), (
+            lambda: torch.ops.torch_ipex.sgd_fused_step(param, grad, buf, trail, momentum, lr, weight_decay, dampening, nesterov),
+            _with_bf16_copy(dtype, lambda: non_fused_sgd(ref_param, ref_grad, ref_buf, momentum, lr, weight_decay, dampening, nesterov), ref_param))
+
+def lamb_cases(dtype):
+    step, beta1, beta2, lr, weight_decay, eps = 10, 0.8, 0.9, 0.1, 0.3, 0.001
+    for param_size in [512 * 1024, 8 * 1024 * 1024]:
+        param, grad, (exp_avg, exp_avg_sq), trail, ref_param, ref_grad = _optimizer_tensors(param_size, dtype, 2)
+        ref_exp_avg, ref_exp_avg_sq = exp_avg.clone(), exp_avg_sq.clone()
+        yield (param_size,), (
+            lambda: torch.ops.torch_ipex.lamb_fused_step(param, exp_avg, exp_avg_sq, grad, trail, step, beta1, beta2, lr, weight_decay, eps),
+            _with_bf16_copy(dtype, lambda: non_fused_lamb(ref_param, ref_exp_avg, ref_exp_avg_sq, ref_grad, step, beta1, beta2, lr, weight_decay, eps), ref_param))
+
+def adagrad_cases(dtype):
+    step, lr, weight_decay, lr_decay, eps = 10, 0.1, 0.3, 0.01, 0.001
+    for param_size in [512 * 1024, 8 * 1024 * 1024]:
+        param, grad, (state_sum,), trail, ref_param, ref_grad = _optimizer_tensors(param_size, dtype, 1)
+        ref_state_sum = state_sum.clone()
+        yield (param_size,), (
+            lambda: torch.ops.torch_ipex.adagrad_fused_step(param, grad, state_sum, trail, step, lr, weight_decay, lr_decay, eps),
+            _with_bf16_copy(dtype, lambda: non_fused_adagrad(ref_param, ref_grad, ref_state_sum, step, lr, weight_decay, lr_decay, eps), ref_param))
+
+def adam_cases(dtype):
+    step, beta1, beta2, lr, weight_decay, eps, amsgrad = 10, 0.8, 0.9, 0.1, 0.3, 0.001, True
+    for param_size in [512 * 1024, 8 * 1024 * 1024]:
+        param, grad, (exp_avg, exp_avg_sq, max_exp_avg_sq), trail, ref_param, ref_grad = _optimizer_tensors(param_size, dtype, 3)
+        ref_states = [exp_avg.clone(), exp_avg_sq.clone(), max_exp_avg_sq.clone()]
+        yield (param_size,), (
+            lambda: torch.ops.torch_ipex.adam_fused_step(param, exp_avg, exp_avg_sq, max_exp_avg_sq, grad, trail, amsgrad, step, beta1, beta2, lr, weight_decay, eps),
+            _with_bf16_copy(dtype, lambda: non_fused_adam(ref_param, *ref_states, ref_grad, amsgrad, step, beta1, beta2, lr, weight_decay, eps), ref_param))
+
+CASES = {
+    'add_layernorm': add_layernorm_cases,
+    'add_softmax': add_softmax_cases,
+    'div_softmax': div_softmax_cases,
+    'rms_norm': rms_norm_cases,
+    'mha': mha_cases,
+    'roi_align': roi_align_cases,
+    'nms': nms_cases,
+    'cumsum': cumsum_cases,
+    'concat_bn_relu': concat_bn_relu_cases,
+    'rnnt_embedding': rnnt_embedding_cases,
+    'sgd': sgd_cases,
+    'lamb': lamb_cases,
+    'adagrad': adagrad_cases,
+    'adam': adam_cases,
+}
+
+DTYPES = {
+    'float32': torch.float32,
+    'bfloat16': torch.bfloat16,
+}
+
+def run_cases(ops, dtypes, num_threads_list, min_time, max_time):
+    results = []
+    previous_num_threads = torch.get_num_threads()
+    print("{:<16} {:<10} {:<28} {:>8} {:>12} {:>12} {:>8}".format("op", "dtype", "shape", "threads", "stock ms", "ipex ms", "speedup"))
+    try:
+        with torch.no_grad():
+            for op, dtype in itertools.product(ops, dtypes):
+                for shape, (ipex_fn, stock_fn) in CASES[op](DTYPES[dtype]):
+                    for num_threads in num_threads_list:
+                        torch.set_num_threads(num_threads)
+                        name = "{}/{}/{}/threads{}".format(op, dtype, "x".join(str(s) for s in shape), num_threads)
+                        ipex_result = benchmark.benchmark(ipex_fn, name=name + "/ipex", min_time=min_time, max_time=max_time)
+                        stock_result = benchmark.benchmark(stock_fn, name=name + "/stock", min_time=min_time, max_time=max_time)
+                        results += [ipex_result, stock_result]
+                        print("{:<16} {:<10} {:<28} {:>8} {:>12.4f} {:>12.4f} {:>7.2f}x".format(
+                            op, dtype, str(shape), num_threads, stock_result.mean, ipex_result.mean,
+                            stock_result.mean / ipex_result.mean))
+    finally:
+        torch.set_num_threads(previous_num_threads)
+    return results
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="performance regression suite for ipex custom ops and fused kernels"
+    )
+    parser.add_argument("--ops", type=str, nargs="+", choices=list(CASES.keys()), default=list(CASES.keys()))
+    parser.add_argument("--dtypes", type=str, nargs="+", choices=list(DTYPES.keys()), default=list(DTYPES.keys()))
+    parser.add_argument("--num-threads", type=int, nargs="+", default=[torch.get_num_threads()])
+    parser.add_argument("--min-time", type=float, default=1.0, help="minimum seconds to measure each case")
+    parser.add_argument("--max-time", type=float, default=10.0, help="maximum seconds to measure each case")
+    parser.add_argument("--output", type=str, default="op_regression.json", help="JSON file to save the results")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON file of the results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.02, help="relative slowdown regarded as a regression")
+    args = parser.parse_args()
+
+    results = run_cases(args.ops, args.dtypes, args.num_threads, args.min_time, args.max_time)
+    benchmark.save_results(results, args.output)
+    if args.baseline is not None:
+        comparisons = benchmark.compare_results(results, benchmark.load_results(args.baseline), args.threshold)
+        regressions = [comparison for comparison in comparisons if comparison["regression"]]
+        for comparison in regressions:
+            print("Regression of {}: {:.4f} ms -> {:.4f} ms ({:+.2%})".format(
+                comparison["name"], comparison["baseline"], comparison["current"], comparison["change"]))
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    run()
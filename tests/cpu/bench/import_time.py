@@ -0,0 +1,66 @@
+r"""
+Benchmark of the import time of intel_extension_for_pytorch on top of
+`import torch`. Each run imports torch and then intel_extension_for_pytorch
+in a fresh process, so that the modules already imported don't affect the
+result. The results are saved into a JSON file which can be compared with
+the results of another release.
+
+    python import_time.py --num-runs 10 --output baseline.json # on the current release
+    python import_time.py --num-runs 10 --output current.json --baseline baseline.json # on the upgrade
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from intel_extension_for_pytorch.cpu import benchmark
+
+_CODE = "import time, json\n" \
+        "start = time.perf_counter()\n" \
+        "import torch\n" \
+        "torch_time = time.perf_counter() - start\n" \
+        "start = time.perf_counter()\n" \
+        "import intel_extension_for_pytorch\n" \
+        "ipex_time = time.perf_counter() - start\n" \
+        "print(json.dumps({'torch': torch_time, 'ipex': ipex_time}))"
+
+def run_import():
+    output = subprocess.check_output([sys.executable, "-c", _CODE], stderr=subprocess.DEVNULL)
+    # The result is in the last line, the lines before may be printed by the imported modules.
+    return json.loads(str(output, 'utf-8').strip().splitlines()[-1])
+
+def run_cases(num_runs):
+    times = [run_import() for _ in range(num_runs)]
+    # The latencies are in milliseconds, each run is one sample.
+    torch_result = benchmark.BenchmarkResult("import/torch", 1, [t["torch"] * 1000 for t in times], 0,
+                                             metadata=benchmark._get_metadata())
+    ipex_result = benchmark.BenchmarkResult("import/intel_extension_for_pytorch", 1, [t["ipex"] * 1000 for t in times], 0,
+                                            metadata=benchmark._get_metadata())
+    print("import torch: best {:.1f} ms, mean {:.1f} ms".format(torch_result.min, torch_result.mean))
+    print("import intel_extension_for_pytorch on top of torch: best {:.1f} ms, mean {:.1f} ms".format(
+        ipex_result.min, ipex_result.mean))
+    return [torch_result, ipex_result]
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="benchmark of the import time of ipex on top of torch"
+    )
+    parser.add_argument("--num-runs", type=int, default=10, help="number of fresh processes to import in")
+    parser.add_argument("--output", type=str, default="import_time.json", help="JSON file to save the results")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON file of the results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.05, help="relative slowdown regarded as a regression")
+    args = parser.parse_args()
+
+    results = run_cases(args.num_runs)
+    benchmark.save_results(results, args.output)
+    if args.baseline is not None:
+        comparisons = benchmark.compare_results(results, benchmark.load_results(args.baseline), args.threshold)
+        regressions = [comparison for comparison in comparisons if comparison["regression"]]
+        for comparison in regressions:
+            print("Regression of {}: {:.4f} ms -> {:.4f} ms ({:+.2%})".format(
+                comparison["name"], comparison["baseline"], comparison["current"], comparison["change"]))
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    run()
@@ -24,6 +24,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--conv_bn", action='store_true', help='test conv_bn model', default=False)
     parser.add_argument("--conv_bn_with_module_created_in_forward", action='store_true', help='test module created in forward', default=False)
+    parser.add_argument("--conv_bn_output", type=str, help='save the output of conv_bn model with a batch into this file', default=None)
     args = parser.parse_args()
     if args.conv_bn:
         input = torch.randn(1, 3, 224, 224)
@@ -35,3 +36,10 @@ if __name__ == "__main__":
         model = ConvBatchNormSoftmax().eval()
         for i in range(10):
             model(input)
+    if args.conv_bn_output is not None:
+        torch.manual_seed(0)
+        input = torch.randn(4, 3, 224, 224)
+        model = ConvBatchNorm().eval()
+        for i in range(3):
+            output = model(input)
+        torch.save(output, args.conv_bn_output)
@@ -439,6 +439,124 @@ class TestIpexQuantizationConvertAPI(JitLlgaTestCase):
                 new_json = json.load(f)
             self.assertTrue(old_json == new_json)
 
+    def test_qconf_summary_binary_save_load(self):
+        class Block(nn.Module):
+            def __init__(self):
+                super(Block, self).__init__()
+                self.conv = nn.Conv2d(64, 64, 1, 1)
+
+            def forward(self, x):
+                return torch.relu(self.conv(x))
+
+        class M(nn.Module):
+            def __init__(self):
+                super(M, self).__init__()
+                self.conv = nn.Conv2d(3, 64, 1, 1)
+                self.block1 = Block()
+                self.block2 = Block()
+
+            def forward(self, x):
+                x = self.conv(x)
+                x = self.block1(x)
+                x = self.block2(x)
+                return x
+
+        m = M()
+        x = torch.rand(1, 3, 2, 2)
+        prepared_model = ipex.quantization.prepare(m, static_qconfig[0], example_inputs=x, inplace=False)
+        prepared_model(x)
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path = os.path.join(tmp, "configure.json")
+            binary_path = os.path.join(tmp, "configure.qconf")
+            prepared_model.save_qconf_summary(json_path)
+            prepared_model.save_qconf_summary(binary_path)
+            with open(binary_path, 'rb') as f:
+                self.assertEqual(f.read(8), b"IPEXQCNF")
+            # The binary and json summary give the same model.
+            y = []
+            for path in [json_path, binary_path]:
+                prepared_model = ipex.quantization.prepare(m, static_qconfig[0], example_inputs=x, inplace=False)
+                prepared_model.load_qconf_summary(path)
+                convert_model = ipex.quantization.convert(prepared_model)
+                traced_model = torch.jit.trace(convert_model, x).eval()
+                traced_model = torch.jit.freeze(traced_model)
+                for i in range(2):
+                    out = traced_model(x)
+                y.append(out)
+            self.assertEqual(y[0], y[1])
+            # Save the loaded binary summary as json again, it is the same as the original one.
+            json_path2 = os.path.join(tmp, "configure_new.json")
+            prepared_model = ipex.quantization.prepare(m, static_qconfig[0], example_inputs=x, inplace=False)
+            prepared_model.load_qconf_summary(binary_path)
+            prepared_model.save_qconf_summary(json_path2)
+            with open(json_path, 'r') as f:
+                old_json = json.load(f)
+            with open(json_path2, 'r') as f:
+                new_json = json.load(f)
+            self.assertEqual(old_json, new_json)
+            # Partial load only changes the quant states of the given modules.
+            prepared_model = ipex.quantization.prepare(m, static_qconfig[0], example_inputs=x, inplace=False)
+            prepared_model.load_qconf_summary(binary_path, modules=["block1"])
+            quant_state_map = prepared_model._fqn_to_auto_quant_state_map
+            self.assertTrue(len(quant_state_map["block1"].tensor_id_to_scale_zp) > 0)
+            self.assertEqual(len(quant_state_map["block2"].tensor_id_to_scale_zp), 0)
+            self.assertEqual(len(quant_state_map[" "].tensor_id_to_scale_zp), 0)
+            for i, op_info in old_json["block1"]["q_op_infos"].items():
+                for tensor_info in op_info["input_tensor_infos"]:
+                    if "scale" in tensor_info:
+                        scale, zp = quant_state_map["block1"].tensor_id_to_scale_zp[tensor_info["id"]]
+                        self.assertEqual(scale.tolist(), tensor_info["scale"])
+                        self.assertEqual(zp.tolist(), tensor_info["zero_point"])
+
+    def test_autotune(self):
+        class M(nn.Module):
+            def __init__(self):
+                super(M, self).__init__()
+                self.linear1 = nn.Linear(16, 16)
+                self.linear2 = nn.Linear(16, 4)
+
+            def forward(self, x):
+                x = self.linear1(x)
+                x = torch.relu(x)
+                x = self.linear2(x)
+                return x
+
+        m = M().eval()
+        x = torch.rand(8, 16)
+        with torch.no_grad():
+            y_ref = m(x)
+        calib_dataloader = [(torch.rand(4, 16), None) for _ in range(4)]
+
+        def eval_func(model):
+            with torch.no_grad():
+                return -(model(x) - y_ref).abs().max().item()
+
+        def get_quantized_ops(model):
+            return [op_info for _, v in model._fqn_to_auto_quant_state_map.items() for op_info in v.idx_to_seen_q_op_infos.values()
+                    if any(dtype in [torch.qint8, torch.quint8] for dtype in op_info.input_tensor_force_inf_dtype)]
+
+        prepared_model = ipex.quantization.prepare(m, static_qconfig[0], example_inputs=x, inplace=False)
+        # The default recipe meets a loose criterion.
+        tuned_model = ipex.quantization.autotune(prepared_model, calib_dataloader, eval_func, sampling_sizes=[8, 16],
+                                                 accuracy_criterion={'absolute': 1e3})
+        self.assertEqual(len(get_quantized_ops(tuned_model)), 2)
+        # No accuracy loss is allowed, so all the ops fall back to FP32.
+        tuned_model = ipex.quantization.autotune(prepared_model, calib_dataloader, eval_func, accuracy_criterion={'absolute': 0})
+        self.assertEqual(len(get_quantized_ops(tuned_model)), 0)
+        self.assertEqual(ipex.quantization.convert(tuned_model)(x), y_ref)
+        # The tuned recipe can be saved and loaded.
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "tuned_conf.json")
+            tuned_model.save_qconf_summary(path)
+            prepared_model = ipex.quantization.prepare(m, static_qconfig[0], example_inputs=x, inplace=False)
+            prepared_model.load_qconf_summary(path)
+            self.assertEqual(len(get_quantized_ops(prepared_model)), 0)
+        # The best recipe is returned when the budget is used up.
+        prepared_model = ipex.quantization.prepare(m, static_qconfig[0], example_inputs=x, inplace=False)
+        tuned_model = ipex.quantization.autotune(prepared_model, calib_dataloader, eval_func,
+                                                 accuracy_criterion={'absolute': 0}, max_trials=1)
+        self.assertEqual(len(get_quantized_ops(tuned_model)), 2)
+
     def test_subclass_format(self):
         class M(nn.Module):
             def __init__(self):
@@ -457,6 +575,37 @@ class TestIpexQuantizationConvertAPI(JitLlgaTestCase):
         out = converted_model(x)
         print(out.__format__('.4f'))
 
+    def test_convert_freeze(self):
+        class M(nn.Module):
+            def __init__(self):
+                super(M, self).__init__()
+                self.conv = nn.Conv2d(3, 64, 1, 1)
+                self.linear = nn.Linear(256, 1)
+
+            def forward(self, x):
+                x = self.conv(x)
+                x = torch.flatten(x, 1)
+                x = self.linear(x)
+                return x
+
+        m = M().eval()
+        x = torch.rand(1, 3, 2, 2)
+        prepared_model = ipex.quantization.prepare(m, static_qconfig[0], example_inputs=x, inplace=False)
+        prepared_model(x)
+        with torch.no_grad():
+            convert_model = ipex.quantization.convert(prepared_model)
+            traced_model = torch.jit.trace(convert_model, x).eval()
+            traced_model = torch.jit.freeze(traced_model)
+            for i in range(2):
+                y_ref = traced_model(x)
+            frozen_model = ipex.quantization.convert(prepared_model, freeze=True, example_inputs=x)
+            self.assertTrue(isinstance(frozen_model, torch.jit.ScriptModule))
+            y = frozen_model(x)
+            self.assertEqual(y_ref, y)
+            self.assertFused(frozen_model.graph_for(x), ['aten::_convolution', 'aten::linear', 'aten::dequantize'])
+        with self.assertRaises(AssertionError):
+            ipex.quantization.convert(prepared_model, freeze=True)
+
 
 class TestRemoveMutate(JitLlgaTestCase):
     def test_mutated_value_alive_after_inplace_op(self):
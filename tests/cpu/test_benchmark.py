@@ -0,0 +1,69 @@
+import unittest
+from common_utils import TestCase
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import torch
+from intel_extension_for_pytorch.cpu.benchmark import BenchmarkResult, benchmark, compare, save_results, load_results
+
+class TestBenchmark(TestCase):
+    def test_benchmark(self):
+        model = torch.nn.Linear(64, 64).eval()
+        x = torch.randn(8, 64)
+        with torch.no_grad():
+            result = benchmark(model, args=(x,), batch_size=8, min_iterations=10, min_time=0, max_time=5)
+        self.assertTrue(result.warmup_iterations >= 20)
+        self.assertTrue(len(result.latencies) >= 10)
+        self.assertTrue(result.ci[0] <= result.mean <= result.ci[1])
+        self.assertTrue(result.p50 <= result.p90 <= result.p99 <= result.max)
+        self.assertAlmostEqual(result.throughput, 8 * 1000 / result.mean)
+        self.assertEqual(result.metadata["num_threads"], torch.get_num_threads())
+
+    def test_stop_at_target_precision(self):
+        result = benchmark(lambda: time.sleep(0.002), warmup_iterations=1, min_iterations=10, min_time=0,
+                           max_time=5, target_precision=0.5)
+        self.assertEqual(len(result.latencies), 10)
+
+    def test_statistics(self):
+        latencies = [1.0 + 0.01 * (i % 5) for i in range(100)] + [10.0, 20.0]
+        result = BenchmarkResult("test", 4, latencies, 0)
+        # The outliers are rejected from the mean but kept in the percentiles
+        self.assertEqual(result.num_outliers, 2)
+        self.assertAlmostEqual(result.mean, 1.02)
+        self.assertEqual(result.max, 20.0)
+        self.assertTrue(result.ci[0] < 1.02 < result.ci[1])
+        self.assertTrue(result.get_relative_ci_width() < 0.01)
+        self.assertAlmostEqual(result.throughput_ci[0], 4000 / result.ci[1])
+
+    def test_compare(self):
+        baseline = BenchmarkResult("test", 1, [1.0 + 0.001 * (i % 10) for i in range(100)], 0)
+        noisy = BenchmarkResult("test", 1, [1.03 + 0.1 * ((i % 10) - 4.5) for i in range(100)], 0)
+        slower = BenchmarkResult("test", 1, [1.03 + 0.001 * (i % 10) for i in range(100)], 0)
+        self.assertFalse(compare(baseline, baseline)["regression"])
+        # Slower by more than the threshold, but within the noise
+        self.assertFalse(compare(noisy, baseline)["regression"])
+        self.assertTrue(compare(slower, baseline)["regression"])
+        self.assertFalse(compare(slower, baseline, threshold=0.05)["regression"])
+        self.assertTrue(compare(baseline, slower)["improvement"])
+
+    def test_compare_cli(self):
+        baseline = BenchmarkResult("test", 1, [1.0 + 0.001 * (i % 10) for i in range(100)], 0)
+        slower = BenchmarkResult("test", 1, [1.03 + 0.001 * (i % 10) for i in range(100)], 0)
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline_path = os.path.join(tmp, "baseline.json")
+            result_path = os.path.join(tmp, "result.json")
+            save_results([baseline], baseline_path)
+            loaded = load_results(baseline_path)[0]
+            self.assertEqual(loaded.to_dict(), baseline.to_dict())
+            cmd = [sys.executable, "-m", "intel_extension_for_pytorch.cpu.benchmark", result_path, baseline_path]
+            save_results([baseline], result_path)
+            self.assertEqual(subprocess.run(cmd).returncode, 0)
+            save_results([slower], result_path)
+            r = subprocess.run(cmd, stdout=subprocess.PIPE)
+            self.assertEqual(r.returncode, 1)
+            self.assertTrue("REGRESSION" in str(r.stdout, "utf-8"))
+
+if __name__ == '__main__':
+    test = unittest.main()
@@ -7,6 +7,9 @@ from common_utils import TestCase
 import os
 import subprocess
 import itertools
+import tempfile
+from intel_extension_for_pytorch.cpu.auto_ipex import add_auto_ipex_params, apply_monkey_patch_with_args
+from intel_extension_for_pytorch.cpu.hypertune.objective import MultiObjective
 
 import logging
 logging.getLogger().setLevel(logging.DEBUG)
@@ -98,5 +101,64 @@ class TestCodeFreeOptimization(TestCase):
             assert _ipex_convolution , 'Expect use ipex convolution by ipex.optimize'
             assert _has_batchnorm is False, 'should not see bn'
 
+    @unittest.skipIf(not ipex.cpu.runtime.is_runtime_ext_enabled(), "Skip when IPEX Runtime extension is not enabled")
+    def test_num_streams(self):
+        loc = os.path.dirname(os.path.abspath(__file__))
+        with tempfile.TemporaryDirectory() as tmp:
+            outputs = []
+            for num_streams in [1, 2]:
+                output_file = os.path.join(tmp, "output{}.pt".format(num_streams))
+                cmd = 'python -m intel_extension_for_pytorch.cpu.launch --ninstance 1 '
+                cmd += '--auto_ipex '
+                cmd += '--num_streams {} '.format(num_streams)
+                cmd += '{}/code_free_optimization.py --conv_bn_output {}'.format(loc, output_file)
+                r = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                assert r.returncode == 0, str(r.stdout, 'utf-8')
+                outputs.append(torch.load(output_file))
+        # The batch is split into 2 streams.
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_ipex_options(self):
+        loc = os.path.dirname(os.path.abspath(__file__))
+        parser = argparse.ArgumentParser()
+        add_auto_ipex_params(parser, auto_ipex_default_enabled=True)
+        parser.add_argument("program", type=str)
+        parser.add_argument('program_args', nargs=argparse.REMAINDER)
+        args = parser.parse_args(['--disable_weights_prepack', '--disable_conv_bn_folding', '--fp32_math_mode', 'BF32',
+                                  '{}/code_free_optimization.py'.format(loc), '--conv_bn'])
+        program = apply_monkey_patch_with_args(args)
+        try:
+            with open(program) as f:
+                content = f.read()
+        finally:
+            os.remove(program)
+        assert 'ipex.set_fp32_math_mode(ipex.FP32MathMode.BF32)' in content
+        assert 'weights_prepack=False' in content
+        assert 'conv_bn_folding=False' in content
+        assert 'ipex.enable_onednn_fusion(True)' in content
+        assert 'if 1 > 1:' in content, 'MultiStreamModule is not used by default'
+        # The original program follows the monkey patch.
+        assert content.endswith(open('{}/code_free_optimization.py'.format(loc)).read())
+
+    def test_decode_ipex_cfg(self):
+        cfg = {"level": "O0",
+               "weights_prepack": False,
+               "conv_bn_folding": True,
+               "auto_kernel_selection": True,
+               "graph_mode": False,
+               "dtype": "bfloat16",
+               "fp32_math_mode": "BF32",
+               "onednn_fusion": False,
+               "num_streams": 2}
+        objective = MultiObjective("program.py", [], tune_launcher=False, tune_ipex=True)
+        self.assertEqual(objective.decode_ipex_cfg(cfg),
+                         ["--auto_ipex", "--ipex_level", "O0", "--disable_weights_prepack", "--auto_kernel_selection",
+                          "--disable_ipex_graph_mode", "--dtype", "bfloat16", "--fp32_math_mode", "BF32",
+                          "--disable_onednn_fusion", "--num_streams", "2"])
+        # The ipex flags are passed to the launcher before the program.
+        cmd = objective.get_cmd(cfg)
+        self.assertEqual(cmd[-1], "program.py")
+        self.assertTrue("--auto_ipex" in cmd)
+
 if __name__ == '__main__':
     test = unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from common_utils import TestCase
+import os
+import tempfile
+from intel_extension_for_pytorch.cpu._cpu_topology import CPUTopology, get_cpu_topology, parse_cpu_list
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content + "\n")
+
+def create_fake_sysfs(root):
+    # 2 sockets x 2 cores x 2 threads, one numa node per socket.
+    # The thread siblings are (0, 4), (1, 5), (2, 6) and (3, 7).
+    sys_cpu_dir = os.path.join(root, "cpu")
+    sys_node_dir = os.path.join(root, "node")
+    write_file(os.path.join(sys_cpu_dir, "online"), "0-7")
+    for cpu in range(8):
+        socket_id = (cpu % 4) // 2
+        core_id = cpu % 2
+        cpu_dir = os.path.join(sys_cpu_dir, "cpu{}".format(cpu))
+        write_file(os.path.join(cpu_dir, "topology", "physical_package_id"), str(socket_id))
+        write_file(os.path.join(cpu_dir, "topology", "core_id"), str(core_id))
+        caches = [(1, "Data", "{},{}".format(cpu % 4, cpu % 4 + 4)),
+                  (1, "Instruction", "{},{}".format(cpu % 4, cpu % 4 + 4)),
+                  (2, "Unified", "{},{}".format(cpu % 4, cpu % 4 + 4)),
+                  (3, "Unified", "{}-{},{}-{}".format(socket_id * 2, socket_id * 2 + 1, socket_id * 2 + 4, socket_id * 2 + 5))]
+        for index, (level, cache_type, shared_cpu_list) in enumerate(caches):
+            index_dir = os.path.join(cpu_dir, "cache", "index{}".format(index))
+            write_file(os.path.join(index_dir, "level"), str(level))
+            write_file(os.path.join(index_dir, "type"), cache_type)
+            write_file(os.path.join(index_dir, "shared_cpu_list"), shared_cpu_list)
+    write_file(os.path.join(sys_node_dir, "online"), "0-1")
+    write_file(os.path.join(sys_node_dir, "node0", "cpulist"), "0-1,4-5")
+    write_file(os.path.join(sys_node_dir, "node0", "distance"), "10 21")
+    write_file(os.path.join(sys_node_dir, "node1", "cpulist"), "2-3,6-7")
+    write_file(os.path.join(sys_node_dir, "node1", "distance"), "21 10")
+    return sys_cpu_dir, sys_node_dir
+
+class TestCPUTopology(TestCase):
+    def test_parse_cpu_list(self):
+        self.assertEqual(parse_cpu_list("0-3,8,10-11"), [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(parse_cpu_list(""), [])
+
+    def test_topology_from_sysfs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            topology = CPUTopology.from_sysfs(*create_fake_sysfs(tmp))
+            self.assertEqual(topology.cpus, list(range(8)))
+            self.assertEqual([topology.core_of[cpu] for cpu in range(8)], [0, 1, 2, 3, 0, 1, 2, 3])
+            self.assertEqual([topology.socket_of[cpu] for cpu in range(8)], [0, 0, 1, 1, 0, 0, 1, 1])
+            self.assertEqual(topology.get_nodes(), [0, 1])
+            self.assertEqual(topology.get_node_cpus(1), [2, 3, 6, 7])
+            self.assertEqual(topology.get_physical_cpus(), [0, 1, 2, 3])
+            self.assertEqual(topology.get_physical_cpus(1), [2, 3])
+            self.assertEqual(topology.thread_siblings[5], [1, 5])
+            self.assertEqual(topology.cache_groups["L2"], [[0, 4], [1, 5], [2, 6], [3, 7]])
+            self.assertEqual(topology.get_cache_group(6, "L3"), [2, 3, 6, 7])
+            self.assertEqual(topology.node_distances, {0: [10, 21], 1: [21, 10]})
+            self.assertEqual(CPUTopology.from_dict(topology.to_dict()).to_dict(), topology.to_dict())
+
+    def test_topology_without_numa(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sys_cpu_dir, _ = create_fake_sysfs(tmp)
+            topology = CPUTopology.from_sysfs(sys_cpu_dir, os.path.join(tmp, "not_exist"))
+            # The socket is used as the node like lscpu
+            self.assertEqual(topology.node_of, topology.socket_of)
+
+    def test_topology_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            sys_cpu_dir, sys_node_dir = create_fake_sysfs(os.path.join(tmp, "sys"))
+            cache_dir = os.path.join(tmp, "cache")
+            old_cache_dir = os.environ.get("IPEX_CACHE_DIR")
+            os.environ["IPEX_CACHE_DIR"] = cache_dir
+            try:
+                topology = get_cpu_topology(sys_cpu_dir, sys_node_dir)
+                # Memoized in the process
+                self.assertTrue(get_cpu_topology(sys_cpu_dir, sys_node_dir) is topology)
+                self.assertTrue(os.path.exists(os.path.join(cache_dir, "cpu_topology.json")))
+            finally:
+                if old_cache_dir is None:
+                    del os.environ["IPEX_CACHE_DIR"]
+                else:
+                    os.environ["IPEX_CACHE_DIR"] = old_cache_dir
+
+if __name__ == '__main__':
+    test = unittest.main()
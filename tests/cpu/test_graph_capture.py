@@ -2,6 +2,7 @@ import unittest
 import copy
 import os
 import tempfile
+import threading
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -524,6 +525,100 @@ class TestGraphCapture(TestCase):
                 if var_name == 'state':
                     self.assertEqual(origin_optimizer_state[var_name], ipex_optimizer_state[var_name])
 
+    def test_graph_capture_shape_buckets(self):
+        model = torch.nn.Sequential(torch.nn.Linear(32, 32), torch.nn.ReLU())
+        model.eval()
+        inputs = [torch.rand(2, seq_len, 32) for seq_len in [5, 8, 16, 30, 7, 40]]
+        with torch.no_grad():
+            y = [model(x) for x in inputs]
+        for pad in [False, True]:
+            # The cache is smaller than the number of buckets, so graphs are evicted and generated again.
+            buckets = ipex.ShapeBuckets({1: [8, 16, 32]}, pad=pad, cache_size=2)
+            ipex_model = ipex.optimize(model, graph_mode=True, shape_buckets=buckets)
+            with torch.no_grad():
+                for _ in range(2):
+                    for x, y_ref in zip(inputs, y):
+                        y_ipex = ipex_model(x)
+                        self.assertEqual(y_ref.shape, y_ipex.shape)
+                        self.assertEqual(y_ref, y_ipex)
+
+    def test_graph_capture_disk_cache(self):
+        model = Conv_Bn_Relu().to(memory_format=torch.channels_last)
+        model.eval()
+        x = torch.rand(3, 6, 10, 10).to(memory_format=torch.channels_last)
+        with torch.no_grad():
+            y = model(x)
+        with tempfile.TemporaryDirectory() as tmp:
+            ipex_model = ipex.optimize(model, graph_mode=True, graph_cache_dir=tmp)
+            with torch.no_grad():
+                y1 = ipex_model(x)
+            self.assertEqual(y, y1)
+            cached_files = os.listdir(tmp)
+            self.assertEqual(len(cached_files), 1)
+            self.assertTrue(cached_files[0].endswith(".pt"))
+
+            # The graph is loaded from the cache instead of traced again
+            ipex_model = ipex.optimize(model, graph_mode=True, graph_cache_dir=tmp)
+            with torch.no_grad():
+                y2 = ipex_model(x)
+            self.assertEqual(y, y2)
+            self.assertEqual(os.listdir(tmp), cached_files)
+
+            # The graph is not reused when the weights change
+            with torch.no_grad():
+                model.conv.weight.add_(1)
+                y = model(x)
+            ipex_model = ipex.optimize(model, graph_mode=True, graph_cache_dir=tmp)
+            with torch.no_grad():
+                y3 = ipex_model(x)
+            self.assertEqual(y, y3)
+            self.assertEqual(len(os.listdir(tmp)), 2)
+
+    def test_shape_buckets(self):
+        buckets = ipex.ShapeBuckets({1: [32, 8, 16]}, pad=True, pad_value=-1)
+        self.assertEqual(buckets.get_bucket_size(1, 5), 8)
+        self.assertEqual(buckets.get_bucket_size(1, 16), 16)
+        self.assertEqual(buckets.get_bucket_size(1, 40), 40)
+        x = torch.rand(2, 5, 4)
+        mask = torch.ones(2, 5, dtype=torch.long)
+        self.assertEqual(buckets.get_key((x,), {"mask": mask}), buckets.get_key((torch.rand(3, 7, 4),), {"mask": mask}))
+        self.assertNotEqual(buckets.get_key((x,), {}), buckets.get_key((torch.rand(2, 9, 4),), {}))
+        (x_padded,), kwargs, narrow_sizes = buckets.pad_inputs((x,), {"mask": mask})
+        self.assertEqual(x_padded.shape, torch.Size([2, 8, 4]))
+        self.assertEqual(x_padded[:, :5], x)
+        self.assertTrue((x_padded[:, 5:] == -1).all())
+        self.assertEqual(kwargs["mask"].shape, torch.Size([2, 8]))
+        self.assertEqual(narrow_sizes, {1: (8, 5)})
+        output = buckets.narrow_outputs((x_padded, torch.rand(2, 3)), narrow_sizes)
+        self.assertEqual(output[0], x)
+        self.assertEqual(output[1].shape, torch.Size([2, 3]))
+
+    def test_graph_capture_concurrent_threads(self):
+        model = Conv_Bn_Relu().to(memory_format=torch.channels_last)
+        model.eval()
+        inputs = [torch.rand(bs, 6, 10, 10).to(memory_format=torch.channels_last) for bs in [1, 2, 3, 4]]
+        with torch.no_grad():
+            y = [model(x) for x in inputs]
+        ipex_model = ipex.optimize(model, graph_mode=True)
+        errors = []
+
+        # All the threads call the model before the graph is generated,
+        # only one of them generates the graph while the others wait for it.
+        def serve(idx):
+            try:
+                with torch.no_grad():
+                    for _ in range(10):
+                        self.assertEqual(y[idx], ipex_model(inputs[idx]))
+            except BaseException as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=serve, args=(idx,)) for idx in range(inputs.__len__())]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors.__len__(), 0)
+
 class TestGraphCaptureMultiStream(TestCase):
     @unittest.skipIf(not ipex.cpu.runtime.is_runtime_ext_enabled(), "Skip when IPEX Runtime extension is not enabled")
     @runtime_thread_affinity_test_env
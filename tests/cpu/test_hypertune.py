@@ -0,0 +1,284 @@
+import unittest
+from common_utils import TestCase
+import csv
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import torch
+import intel_extension_for_pytorch as ipex
+from intel_extension_for_pytorch.cpu.launch import CPUinfo
+from intel_extension_for_pytorch.cpu.hypertune.objective import MultiObjective
+from intel_extension_for_pytorch.cpu.hypertune.scheduler import TrialScheduler, MEDIAN_STOPPING_MIN_TRIALS
+from intel_extension_for_pytorch.cpu.hypertune.conf.config import Conf
+from intel_extension_for_pytorch.cpu.hypertune.strategy import STRATEGIES
+from intel_extension_for_pytorch.cpu.hypertune.inprocess import _get_available_physical_cores
+
+# Reports the value of argv[1] and sleeps for argv[2] seconds.
+_FAKE_TRIAL = """import sys, time
+print("@hypertune {'name': 'latency'}")
+print(sys.argv[1], flush=True)
+time.sleep(float(sys.argv[2]))
+"""
+
+# Counts its runs in argv[1] and reports 1.0.
+_FAKE_PROGRAM = """import sys
+with open(sys.argv[1], "a") as f:
+    f.write("run\\n")
+print("@hypertune {'name': 'latency'}")
+print(1.0)
+"""
+
+_FAKE_MULTI_OBJECTIVE_PROGRAM = """print("@hypertune {'name': 'latency'}")
+print(1.0)
+print("@hypertune {'name': 'throughput', 'higher_is_better': True}")
+print(1.0)
+"""
+
+class _FakeObjective(MultiObjective):
+    # Runs the fake trial directly instead of the launcher, the value and the
+    # sleeping time are taken from the configuration.
+    def __init__(self, program):
+        super().__init__(program, [], tune_launcher=False)
+        self.core_lists = []
+
+    def get_cmd(self, cfg, core_list=None):
+        self.core_lists.append(core_list)
+        return [sys.executable, self.program, str(cfg["value"]), str(cfg["sleep"])]
+
+    def get_num_cores(self, cfg):
+        return cfg["ncores"]
+
+def _trial_cfg(value, sleep, ncores=None):
+    return {"value": value, "sleep": sleep, "ncores": ncores, "use_logical_core": False, "use_all_nodes": True}
+
+class TestTrialScheduler(TestCase):
+    objectives = [{'name': 'latency', 'higher_is_better': False, 'target_val': -float('inf')}]
+
+    def create_objective(self, tmp):
+        program = os.path.join(tmp, "fake_trial.py")
+        with open(program, "w") as f:
+            f.write(_FAKE_TRIAL)
+        return _FakeObjective(program)
+
+    def wait_all(self, scheduler):
+        finished_trials = []
+        while scheduler.num_running() > 0:
+            finished_trials += scheduler.wait()
+        return sorted(finished_trials, key=lambda trial: trial.idx)
+
+    @unittest.skipIf(len(CPUinfo().get_all_physical_cores()) < 2, "Need at least 2 physical cores")
+    def test_disjoint_cores(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            objective = self.create_objective(tmp)
+            scheduler = TrialScheduler(objective, self.objectives, parallel_trials=2)
+            num_free_cores = len(scheduler.core_pool.free_cores)
+            self.assertTrue(scheduler.try_start(1, _trial_cfg(1.0, 1, ncores=1)))
+            self.assertTrue(scheduler.try_start(2, _trial_cfg(2.0, 1, ncores=1)))
+            self.assertFalse(scheduler.try_start(3, _trial_cfg(3.0, 1, ncores=1)))
+            self.assertEqual(scheduler.num_running(), 2)
+            cores = [set(trial.physical_cores) for trial in scheduler.running_trials]
+            self.assertEqual(len(cores[0]), 1)
+            self.assertEqual(len(cores[1]), 1)
+            self.assertTrue(cores[0].isdisjoint(cores[1]))
+            self.assertTrue(set(objective.core_lists[0]).isdisjoint(objective.core_lists[1]))
+
+            finished_trials = self.wait_all(scheduler)
+            self.assertEqual([trial.status for trial in finished_trials], ["ok", "ok"])
+            self.assertEqual([trial.result for trial in finished_trials], [[1.0], [2.0]])
+            self.assertEqual(len(scheduler.core_pool.free_cores), num_free_cores)
+
+    def test_unknown_cores_run_exclusively(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            objective = self.create_objective(tmp)
+            scheduler = TrialScheduler(objective, self.objectives, parallel_trials=2)
+            self.assertTrue(scheduler.try_start(1, _trial_cfg(1.0, 1)))
+            self.assertFalse(scheduler.try_start(2, _trial_cfg(2.0, 1, ncores=1)))
+            self.assertEqual(len(scheduler.core_pool.free_cores), 0)
+            self.assertEqual(objective.core_lists, [None])
+            finished_trials = self.wait_all(scheduler)
+            self.assertEqual(finished_trials[0].status, "ok")
+
+    def test_trial_timeout(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            scheduler = TrialScheduler(self.create_objective(tmp), self.objectives, trial_timeout=1)
+            start = time.time()
+            self.assertTrue(scheduler.try_start(1, _trial_cfg(1.0, 60)))
+            finished_trials = scheduler.wait()
+            self.assertTrue(time.time() - start < 30)
+            self.assertEqual(len(finished_trials), 1)
+            self.assertEqual(finished_trials[0].status, "timeout")
+            self.assertEqual(finished_trials[0].result, None)
+            self.assertTrue(finished_trials[0].process.poll() is not None)
+            self.assertEqual(scheduler.num_running(), 0)
+
+    def test_median_stopping(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            scheduler = TrialScheduler(self.create_objective(tmp), self.objectives, median_stopping=True)
+            for _ in range(MEDIAN_STOPPING_MIN_TRIALS):
+                scheduler.add_completed([[1.0]])
+
+            # A clearly worse trial is stopped as soon as it reports.
+            start = time.time()
+            self.assertTrue(scheduler.try_start(1, _trial_cfg(100.0, 60)))
+            finished_trials = scheduler.wait()
+            self.assertTrue(time.time() - start < 30)
+            self.assertEqual(finished_trials[0].status, "stopped")
+            self.assertEqual(finished_trials[0].result, None)
+
+            # A better trial runs to the end.
+            self.assertTrue(scheduler.try_start(2, _trial_cfg(0.5, 1)))
+            finished_trials = scheduler.wait()
+            self.assertEqual(finished_trials[0].status, "ok")
+            self.assertEqual(finished_trials[0].result, [0.5])
+
+class TestTuneStrategy(TestCase):
+    def create_strategy(self, tmp, conf, strategy="grid", program_content=_FAKE_PROGRAM):
+        program = os.path.join(tmp, "fake_program.py")
+        with open(program, "w") as f:
+            f.write(program_content)
+        conf_file = os.path.join(tmp, "conf.yaml")
+        with open(conf_file, "w") as f:
+            f.write(conf.format(strategy=strategy, output_dir=tmp))
+        return STRATEGIES[strategy](Conf(conf_file, program, [os.path.join(tmp, "runs.txt")]))
+
+    @unittest.skipIf(len(CPUinfo().get_all_physical_cores()) < 2, "Need at least 2 physical cores")
+    def test_resume(self):
+        conf = """tuning:
+  strategy: {strategy}
+  max_trials: {max_trials}
+  resume: true
+hyperparams:
+  launcher:
+    hp: ['ncore_per_instance', 'ninstances']
+    ncore_per_instance: [1, 2]
+    ninstances: [1]
+output_dir: {output_dir}
+"""
+        with tempfile.TemporaryDirectory() as tmp:
+            # Interrupted after the first trial.
+            self.create_strategy(tmp, conf.replace("{max_trials}", "1")).traverse()
+            strategy = self.create_strategy(tmp, conf.replace("{max_trials}", "2"))
+            self.assertEqual(len(strategy.tried_tune_cfgs), 1)
+            self.assertEqual(strategy.best_tune_result, [1.0])
+            strategy.traverse()
+
+            # The configuration in record.csv is not run again.
+            with open(os.path.join(tmp, "runs.txt")) as f:
+                self.assertEqual(len(f.read().split()), 2)
+            with open(os.path.join(tmp, "record.csv"), newline='') as f:
+                rows = list(csv.reader(f))
+            self.assertEqual(len(rows), 3)
+            self.assertEqual(rows[0][:2], ["ncore_per_instance", "ninstances"])
+            self.assertEqual([row[0] for row in rows[1:]], ["1", "2"])
+            self.assertEqual([row[-1] for row in rows[1:]], ["ok", "ok"])
+
+    def test_pareto_front(self):
+        conf = """tuning:
+  strategy: {strategy}
+hyperparams:
+  launcher:
+    hp: ['ninstances']
+    ninstances: [1]
+output_dir: {output_dir}
+"""
+        with tempfile.TemporaryDirectory() as tmp:
+            strategy = self.create_strategy(tmp, conf, program_content=_FAKE_MULTI_OBJECTIVE_PROGRAM)
+            strategy.csvfile.close()
+            # (latency, throughput)
+            self.assertTrue(strategy._dominates([1, 10], [2, 5]))
+            self.assertTrue(strategy._dominates([1, 10], [1, 5]))
+            self.assertFalse(strategy._dominates([2, 5], [1, 10]))
+            self.assertFalse(strategy._dominates([1, 10], [1, 10]))
+            self.assertFalse(strategy._dominates([1, 5], [2, 10]))
+            self.assertFalse(strategy._dominates([2, 10], [1, 5]))
+
+            strategy._update_best_tune_result([2, 10], {"id": "a"})
+            strategy._update_best_tune_result([1, 5], {"id": "b"})
+            self.assertEqual(strategy.pareto_front, [({"id": "a"}, [2, 10]), ({"id": "b"}, [1, 5])])
+            # The best on the Pareto front has the best latency.
+            self.assertEqual(strategy.best_tune_cfg, {"id": "b"})
+            self.assertEqual(strategy.best_tune_result, [1, 5])
+
+            # Dominated by a, or failed.
+            strategy._update_best_tune_result([3, 4], {"id": "c"})
+            strategy._update_best_tune_result(None, {"id": "d"})
+            self.assertEqual(len(strategy.pareto_front), 2)
+
+            # Dominates both a and b.
+            strategy._update_best_tune_result([1, 10], {"id": "e"})
+            self.assertEqual(strategy.pareto_front, [({"id": "e"}, [1, 10])])
+            self.assertEqual(strategy.best_tune_cfg, {"id": "e"})
+
+    def test_tpe(self):
+        conf = """tuning:
+  strategy: {strategy}
+hyperparams:
+  launcher:
+    hp: ['ncore_per_instance', 'ninstances']
+    ncore_per_instance: [1, 2, 3, 4, 5, 6, 7, 8]
+    ninstances: [1, 2, 3, 4, 5, 6, 7, 8]
+output_dir: {output_dir}
+"""
+        np.random.seed(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            strategy = self.create_strategy(tmp, conf, strategy="tpe")
+            strategy.csvfile.close()
+            # Synthetic latency with the minimum at ncore_per_instance 6 and ninstances 3.
+            def latency(tune_cfg):
+                return float((tune_cfg["ncore_per_instance"] - 6) ** 2 + (tune_cfg["ninstances"] - 3) ** 2)
+
+            num_trials = 30
+            tune_cfgs = []
+            for tune_cfg in strategy._next_untried_tune_cfg():
+                for hp in strategy.hyperparams:
+                    self.assertTrue(tune_cfg[hp] in strategy.hyperparam2searchspace[hp])
+                tune_result = [latency(tune_cfg)]
+                strategy.tune_history.append((tune_cfg, tune_result))
+                strategy._update_best_tune_result(tune_result, tune_cfg)
+                tune_cfgs.append(tune_cfg)
+                if len(tune_cfgs) == num_trials:
+                    break
+
+            self.assertEqual(len(tune_cfgs), num_trials)
+            self.assertEqual(len(set(strategy._get_tune_cfg_key(tune_cfg) for tune_cfg in tune_cfgs)), num_trials)
+            # The trials suggested by the estimators are better than the random startup trials.
+            latencies = [latency(tune_cfg) for tune_cfg in tune_cfgs]
+            n_startup_trials = strategy.n_startup_trials
+            self.assertTrue(np.mean(latencies[-n_startup_trials:]) < np.mean(latencies[:n_startup_trials]))
+            self.assertTrue(strategy.best_tune_result[0] <= 1.0)
+
+class TestInProcessTune(TestCase):
+    @unittest.skipIf(not ipex.cpu.runtime.is_runtime_ext_enabled(), "Skip when IPEX Runtime extension is not enabled")
+    @unittest.skipIf(len(_get_available_physical_cores()) < 2, "Need at least 2 physical cores")
+    def test_tune(self):
+        model = torch.nn.Linear(64, 64).eval()
+        x = torch.randn(8, 64)
+        with tempfile.TemporaryDirectory() as tmp:
+            conf = {'hyperparams': {'runtime': {'hp': ['ncores', 'num_threads', 'num_streams'],
+                                                'ncores': [2],
+                                                'num_threads': [1, 2],
+                                                'num_streams': [1, 2]}},
+                    'output_dir': tmp}
+            best_cfg, best_result = ipex.cpu.hypertune.tune(model, x, conf=conf, warmup_iterations=2,
+                                                            min_iterations=5, max_time=1.0)
+            self.assertEqual(best_cfg['ncores'], 2)
+            self.assertTrue(best_cfg['num_threads'] in [1, 2])
+            self.assertTrue(best_cfg['num_streams'] in [1, 2])
+            self.assertEqual(len(best_result), 1)
+            self.assertTrue(best_result[0] > 0)
+
+            with open(os.path.join(tmp, "record.csv"), newline='') as f:
+                rows = list(csv.reader(f))
+            self.assertEqual(rows[0], ['ncores', 'num_threads', 'num_streams', 'fp32_math_mode', 'onednn_fusion', 'latency', 'status'])
+            self.assertEqual(len(rows), 5)
+            self.assertEqual([row[-1] for row in rows[1:]], ["ok"] * 4)
+            self.assertEqual(sorted((row[1], row[2]) for row in rows[1:]), [("1", "1"), ("1", "2"), ("2", "1"), ("2", "2")])
+            # The best configuration has the lowest latency recorded.
+            best_row = min(rows[1:], key=lambda row: float(row[5]))
+            self.assertEqual((int(best_row[1]), int(best_row[2])), (best_cfg['num_threads'], best_cfg['num_streams']))
+            self.assertEqual(float(best_row[5]), best_result[0])
+
+if __name__ == '__main__':
+    test = unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from common_utils import TestCase
+import json
+import subprocess
+import sys
+
+# Modules which should not be loaded by `import intel_extension_for_pytorch`.
+LAZY_MODULES = [
+    "torch._dynamo",
+    "transformers",
+    "pkg_resources",
+    "intel_extension_for_pytorch.quantization",
+    "intel_extension_for_pytorch.tpp",
+    "intel_extension_for_pytorch.frontend",
+    "intel_extension_for_pytorch.cpu.launch",
+    "intel_extension_for_pytorch.cpu.runtime",
+]
+
+def run_import(statement):
+    # Import in a new process, so that the modules already imported by the test runner don't affect the result.
+    code = "import sys, json\n" \
+           "{}\n" \
+           "print(json.dumps({{'modules': list(sys.modules.keys())}}))".format(statement)
+    output = subprocess.check_output([sys.executable, "-c", code], stderr=subprocess.DEVNULL)
+    # The result is in the last line, the lines before may be printed by the imported modules.
+    return json.loads(str(output, 'utf-8').strip().splitlines()[-1])
+
+class TestImport(TestCase):
+    def test_lazy_import(self):
+        # Skip the modules already loaded by PyTorch and torchvision themselves.
+        base_modules = run_import("import torch\n"
+                                  "try:\n"
+                                  "    import torchvision\n"
+                                  "except ImportError:\n"
+                                  "    pass")["modules"]
+        modules = run_import("import intel_extension_for_pytorch as ipex")["modules"]
+        for name in LAZY_MODULES:
+            if name not in base_modules:
+                self.assertNotIn(name, modules)
+
+    def test_lazy_attribute(self):
+        modules = run_import("import intel_extension_for_pytorch as ipex\n"
+                             "ipex.optimize\n"
+                             "ipex.quantization.prepare\n"
+                             "ipex.cpu.runtime.CPUPool")["modules"]
+        self.assertIn("intel_extension_for_pytorch.frontend", modules)
+        self.assertIn("intel_extension_for_pytorch.quantization", modules)
+        self.assertIn("intel_extension_for_pytorch.cpu.runtime", modules)
+
+if __name__ == '__main__':
+    test = unittest.main()
@@ -6,6 +6,8 @@ from intel_extension_for_pytorch.cpu.launch import *
 import os
 import glob
 import subprocess
+import tempfile
+from intel_extension_for_pytorch.cpu._cpu_topology import CPUTopology
 
 class TestLauncher(TestCase):
     launch_scripts = [["python", "-m", "intel_extension_for_pytorch.cpu.launch"],
@@ -196,6 +198,76 @@ class TestLauncher(TestCase):
                 assert r.returncode == 0
                 assert expected_msg in str(r.stdout, "utf-8")
 
+    def test_cache_aware_placement_plan(self):
+        # 2 sub-NUMA clusters sharing one L3 cache, 4 cores x 2 threads per cluster.
+        # Thread siblings of core i are cpu i and cpu i + 8.
+        cpus = list(range(16))
+        topology = CPUTopology(cpus,
+                               {cpu: cpu % 8 for cpu in cpus},
+                               {cpu: 0 for cpu in cpus},
+                               {cpu: (cpu % 8) // 4 for cpu in cpus},
+                               {"L3": [cpus]},
+                               {0: [10, 11], 1: [11, 10]})
+        domains = get_cache_domains(cpus, topology)
+        self.assertEqual(domains, [(0, [0, 1, 2, 3, 8, 9, 10, 11]), (1, [4, 5, 6, 7, 12, 13, 14, 15])])
+
+        # 3 cores per instance never straddles the clusters, the leftover cores are not used.
+        plan = plan_instance_cores(list(range(8)), 3, topology)
+        self.assertEqual(plan, [(0, [0, 1, 2]), (1, [4, 5, 6])])
+
+        # The threads of a physical core are placed into the same instance.
+        plan = plan_instance_cores(cpus, 4, topology)
+        self.assertEqual(plan, [(0, [0, 8, 1, 9]), (0, [2, 10, 3, 11]), (1, [4, 12, 5, 13]), (1, [6, 14, 7, 15])])
+
+        # Each instance is followed by a companion instance on the SMT siblings.
+        plan = plan_instance_cores(cpus, 2, topology, pair_smt_siblings=True)
+        self.assertEqual(plan, [(0, [0, 1]), (0, [8, 9]), (0, [2, 3]), (0, [10, 11]),
+                                (1, [4, 5]), (1, [12, 13]), (1, [6, 7]), (1, [14, 15])])
+
+    def test_cache_aware_placement(self):
+        cpuinfo = CPUinfo()
+        num_cores = cpuinfo.physical_core_nums()
+        for launch_script in self.launch_scripts:
+            cmd = f"{' '.join(launch_script)} --ncore_per_instance 1 --cache_aware_placement --no_python pwd"
+            r = subprocess.run(cmd.split(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            assert r.returncode == 0
+            assert "Cache aware placement" in str(r.stdout, "utf-8")
+            assert "instance {}:".format(num_cores - 1) in str(r.stdout, "utf-8")
+
+    def test_supervise(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # The instance crashes in the first run and prints its throughput after the restart.
+            script = os.path.join(tmp, "crash_once.py")
+            marker = os.path.join(tmp, "crashed")
+            with open(script, "w") as f:
+                f.write("import os, sys\n"
+                        "if not os.path.exists({!r}):\n"
+                        "    open({!r}, 'w').close()\n"
+                        "    sys.exit(1)\n"
+                        "print('Measuring throughput...')\n"
+                        "print('Throughput: 100.5 samples/s')\n"
+                        "print('latency (ms).')\n"
+                        "print('Latency: 2.5 ms')\n".format(marker, marker))
+            for launch_script in self.launch_scripts:
+                if os.path.exists(marker):
+                    os.remove(marker)
+                cmd = launch_script + ["--ninstances", "1", "--ncore_per_instance", "1", "--supervise",
+                                       "--restart_delay", "0", "--report_interval", "0", script]
+                r = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                output = str(r.stdout, "utf-8")
+                assert r.returncode == 0
+                assert "restarting it on the same cores" in output
+                assert "[instance 0] Throughput: 100.5 samples/s" in output
+                assert "0/1 instances running, 1 restarts, throughput 100.50 (sum of 1 instances), latency mean 2.50 max 2.50" in output
+
+                # Failed after the restarts
+                cmd = launch_script + ["--ninstances", "1", "--ncore_per_instance", "1", "--supervise",
+                                       "--max_restarts", "1", "--restart_delay", "0", "--report_interval", "0",
+                                       "--no_python", "false"]
+                r = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                assert r.returncode != 0
+                assert "exited with code 1 after 1 restarts" in str(r.stdout, "utf-8")
+
     def test_specified_core_list(self):
         # Test for basic use
         expected_cores = " -C 0-2,4-4"
@@ -0,0 +1,72 @@
+import unittest
+import copy
+import torch
+import torch.nn as nn
+import intel_extension_for_pytorch as ipex
+from intel_extension_for_pytorch.quantization import prepare, convert, calibrate
+from intel_extension_for_pytorch.quantization._calibrate import _get_observers
+from torch.ao.quantization import MinMaxObserver, PerChannelMinMaxObserver, QConfig
+from common_utils import TestCase
+
+class M(nn.Module):
+    def __init__(self):
+        super(M, self).__init__()
+        self.conv = nn.Conv2d(3, 8, 3)
+        self.linear = nn.Linear(8, 4)
+
+    def forward(self, x):
+        x = self.conv(x).relu()
+        x = x.mean([2, 3])
+        return self.linear(x)
+
+class TestParallelCalibration(TestCase):
+    def _get_batches(self):
+        torch.manual_seed(0)
+        return [torch.randn(2, 3, 8, 8) * (i + 1) for i in range(8)]
+
+    def test_minmax_observer(self):
+        qconfig = QConfig(activation=MinMaxObserver.with_args(qscheme=torch.per_tensor_affine, dtype=torch.quint8),
+                          weight=PerChannelMinMaxObserver.with_args(dtype=torch.qint8, qscheme=torch.per_channel_symmetric))
+        batches = self._get_batches()
+        model = M().eval()
+        sequential = prepare(model, qconfig, example_inputs=batches[0])
+        parallel = prepare(model, qconfig, example_inputs=batches[0])
+        with torch.no_grad():
+            for x in batches:
+                sequential(x)
+        calibrate(parallel, batches, num_workers=3)
+        for sequential_observer, parallel_observer in zip(_get_observers(sequential), _get_observers(parallel)):
+            self.assertEqual(sequential_observer.min_val, parallel_observer.min_val)
+            self.assertEqual(sequential_observer.max_val, parallel_observer.max_val)
+
+    def test_histogram_observer(self):
+        batches = self._get_batches()
+        model = M().eval()
+        sequential = prepare(model, ipex.quantization.default_static_qconfig, example_inputs=batches[0])
+        parallel = prepare(model, ipex.quantization.default_static_qconfig, example_inputs=batches[0])
+        with torch.no_grad():
+            for x in batches:
+                sequential(x)
+        calibrate(parallel, batches, num_workers=2)
+        for sequential_observer, parallel_observer in zip(_get_observers(sequential), _get_observers(parallel)):
+            # The range of the sequential histogram is expanded to the multiple of the bin width.
+            if hasattr(sequential_observer, 'histogram'):
+                self.assertEqual(sequential_observer.histogram.sum(), parallel_observer.histogram.sum())
+            else:
+                self.assertEqual(sequential_observer.min_val, parallel_observer.min_val)
+                self.assertEqual(sequential_observer.max_val, parallel_observer.max_val)
+
+        x = batches[-1]
+        with torch.no_grad():
+            y_sequential = convert(sequential)(x)
+            y_parallel = convert(parallel)(x)
+        self.assertEqual(y_sequential, y_parallel, prec=0.1)
+
+    def test_worker_failure(self):
+        batches = self._get_batches()
+        prepared_model = prepare(M().eval(), ipex.quantization.default_static_qconfig, example_inputs=batches[0])
+        with self.assertRaisesRegex(RuntimeError, "Calibration worker failed"):
+            calibrate(prepared_model, batches + [torch.randn(2, 4, 8, 8)], num_workers=2)
+
+if __name__ == '__main__':
+    test = unittest.main()
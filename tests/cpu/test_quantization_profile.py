@@ -0,0 +1,95 @@
+import unittest
+import csv
+import json
+import os
+import tempfile
+import torch
+import torch.nn as nn
+import intel_extension_for_pytorch as ipex
+from intel_extension_for_pytorch.quantization import prepare, profile_quantization
+from intel_extension_for_pytorch.quantization._profile import _get_tradeoff_key
+from common_utils import TestCase
+
+class M(nn.Module):
+    def __init__(self):
+        super(M, self).__init__()
+        self.conv = nn.Conv2d(3, 16, 3)
+        self.linear1 = nn.Linear(16, 16)
+        self.linear2 = nn.Linear(16, 4)
+
+    def forward(self, x):
+        x = self.conv(x).relu()
+        x = x.mean([2, 3])
+        x = self.linear1(x)
+        return self.linear2(x)
+
+class TestQuantizationProfile(TestCase):
+    def _prepare(self, model, batches):
+        prepared_model = prepare(model, ipex.quantization.default_static_qconfig, example_inputs=batches[0])
+        with torch.no_grad():
+            for x in batches:
+                prepared_model(x)
+        return prepared_model
+
+    def test_profile(self):
+        torch.manual_seed(0)
+        batches = [torch.randn(2, 3, 8, 8) for _ in range(4)]
+        prepared_model = self._prepare(M().eval(), batches)
+        profile = profile_quantization(prepared_model, batches[:2], max_time_per_op=0.1)
+        rows = {row["fqn"]: row for row in profile.rows if row["quantized"]}
+        self.assertEqual(set(rows.keys()), set(["conv", "linear1", "linear2"]))
+        for row in rows.values():
+            self.assertTrue(20 < row["sqnr"] < float('inf'))
+            self.assertTrue(0.99 < row["cosine"] <= 1.0)
+            self.assertTrue(row["fp32_ms"] > 0 and row["int8_ms"] > 0)
+            self.assertAlmostEqual(row["speedup"], row["fp32_ms"] / row["int8_ms"])
+        # the prepared model is not changed
+        self.assertTrue(hasattr(prepared_model, '_fqn_to_auto_quant_state_map'))
+        self.assertFalse(hasattr(prepared_model, '_qconf_summary'))
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, "profile.csv")
+            json_path = os.path.join(tmp, "profile.json")
+            profile.save(csv_path)
+            profile.save(json_path)
+            with open(csv_path, 'r') as f:
+                self.assertEqual(len(list(csv.DictReader(f))), len(profile.rows))
+            with open(json_path, 'r') as f:
+                self.assertEqual(json.load(f)["columns"], profile.columns)
+        self.assertTrue("linear2" in str(profile))
+
+    def test_error_isolation(self):
+        torch.manual_seed(0)
+        batches = [torch.randn(2, 3, 8, 8) for _ in range(4)]
+        model = M().eval()
+        # The first input feature of linear1 is always 0.
+        model.conv.weight.data[0] = 0
+        model.conv.bias.data[0] = 0
+        prepared_model = self._prepare(model, batches)
+        ref = {row["fqn"]: row["sqnr"] for row in profile_quantization(prepared_model, batches, measure_latency=False).rows}
+        # A weight outlier which doesn't change the FP32 output, but adds a large
+        # quantization error to linear1.
+        model.linear1.weight.data[0, 0] = 1e3
+        prepared_model = self._prepare(model, batches)
+        profile = profile_quantization(prepared_model, batches, measure_latency=False)
+        new = {row["fqn"]: row["sqnr"] for row in profile.rows}
+        self.assertTrue(new["linear1"] < ref["linear1"] - 10)
+        # The error of linear2 is measured with the FP32 inputs, so it doesn't
+        # include the error of linear1.
+        self.assertAlmostEqual(new["linear2"], ref["linear2"], places=3)
+        self.assertAlmostEqual(new["conv"], ref["conv"], places=3)
+        self.assertTrue(all(row["fp32_ms"] is None for row in profile.rows))
+
+    def test_tradeoff_ranking(self):
+        def row(name, sqnr, fp32_ms=None, int8_ms=None):
+            return {"fqn": name, "sqnr": sqnr, "fp32_ms": fp32_ms, "int8_ms": int8_ms}
+        rows = [row("fast", 20, 2.0, 1.0),
+                row("unmeasured_noisy", 10),
+                row("slow", 40, 1.0, 1.5),
+                row("unmeasured", 30),
+                row("fast_noisy", 20, 1.1, 1.0)]
+        rows.sort(key=_get_tradeoff_key, reverse=True)
+        # No speedup first, then the noise per millisecond saved, then the ops without latency by the noise.
+        self.assertEqual([r["fqn"] for r in rows], ["slow", "fast_noisy", "fast", "unmeasured_noisy", "unmeasured"])
+
+if __name__ == '__main__':
+    test = unittest.main()
@@ -9,6 +9,7 @@ import torch.fx.experimental.optimization as optimization
 from common_ipex_conf import runtime_thread_affinity_test_env
 import subprocess
 import os
+import threading
 
 class SimpleNet(torch.nn.Module):
     def __init__(self):
@@ -286,6 +287,199 @@ class TestMultiStreamModule(TestCase):
         self.assertEqual(y_runtime2[1].size(0), 1)
         self.assertEqual(y_runtime2[2].size(0), 1)
 
+    @unittest.skipIf(not ipex.cpu.runtime.is_runtime_ext_enabled(), "Skip when IPEX Runtime extension is not enabled")
+    @runtime_thread_affinity_test_env
+    def test_multi_stream_module_forward_async(self):
+        model = SimpleNet()
+        model.eval()
+        num_streams = 2
+        inputs = [torch.rand(bs, 64, 3, 3) for bs in [4, 3, 1]]
+        # Calculate the reference result
+        y = [model(x) for x in inputs]
+
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1])
+        multi_stream_model = ipex.cpu.runtime.MultiStreamModule(model, num_streams=num_streams, cpu_pool=cpu_pool)
+        multi_stream_model2 = ipex.cpu.runtime.MultiStreamModule(model, num_streams=num_streams, cpu_pool=cpu_pool, concat_output=False)
+
+        # Several batches are in flight before waiting for any of them
+        y_runtime_futures = [multi_stream_model.forward_async(x) for x in inputs]
+        y_runtime_futures2 = [multi_stream_model2.forward_async(x) for x in inputs]
+        for i in range(inputs.__len__()):
+            self.assertEqual(y[i], y_runtime_futures[i].get())
+            self.assertEqual(y[i], torch.cat(y_runtime_futures2[i].get()))
+
+    @unittest.skipIf(not ipex.cpu.runtime.is_runtime_ext_enabled(), "Skip when IPEX Runtime extension is not enabled")
+    @runtime_thread_affinity_test_env
+    def test_multi_stream_module_concurrent_forward(self):
+        model = SimpleNet()
+        model.eval()
+        num_streams = 2
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1])
+        multi_stream_model = ipex.cpu.runtime.MultiStreamModule(model, num_streams=num_streams, cpu_pool=cpu_pool)
+
+        # Each serving thread uses a different batch size, so that the split status of
+        # one forward will break the others if it's shared.
+        inputs = [torch.rand(bs, 64, 3, 3) for bs in [1, 2, 3, 5]]
+        y = [model(x) for x in inputs]
+        errors = []
+
+        def serve(idx):
+            try:
+                for _ in range(20):
+                    self.assertEqual(y[idx], multi_stream_model(inputs[idx]))
+            except BaseException as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=serve, args=(idx,)) for idx in range(inputs.__len__())]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors.__len__(), 0)
+
+    @unittest.skipIf(not ipex.cpu.runtime.is_runtime_ext_enabled(), "Skip when IPEX Runtime extension is not enabled")
+    @runtime_thread_affinity_test_env
+    def test_multi_stream_module_preallocate_output(self):
+        model = SimpleNet()
+        model.eval()
+        num_streams = 3
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1, 2])
+        multi_stream_model = ipex.cpu.runtime.MultiStreamModule(model, num_streams=num_streams, cpu_pool=cpu_pool, preallocate_output=True)
+        traced_model = torch.jit.trace(model, torch.rand(4, 64, 3, 3))
+        multi_stream_traced_model = ipex.cpu.runtime.MultiStreamModule(traced_model, num_streams=num_streams, cpu_pool=cpu_pool, preallocate_output=True)
+        for batch_size in [4, 4, 2, 2, 6]:
+            x = torch.rand(batch_size, 64, 3, 3)
+            # Calculate the reference result
+            y = model(x)
+            # The output shape is recorded at the first batch of each input shape,
+            # the later batches are written into the preallocated output.
+            self.assertEqual(y, multi_stream_model(x))
+            self.assertEqual(y, multi_stream_traced_model(x))
+            self.assertEqual(y, multi_stream_traced_model.forward_async(x).get())
+
+    @unittest.skipIf(not ipex.cpu.runtime.is_runtime_ext_enabled(), "Skip when IPEX Runtime extension is not enabled")
+    @runtime_thread_affinity_test_env
+    def test_multi_stream_module_preallocate_tuple_output(self):
+        model = TestInputOutputModule().eval()
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1])
+        input_hint = ipex.cpu.runtime.MultiStreamModuleHint(0, 1)
+        output_hint = ipex.cpu.runtime.MultiStreamModuleHint((0, 1))
+        multi_stream_model = ipex.cpu.runtime.MultiStreamModule(model,
+                                                                num_streams=2,
+                                                                cpu_pool=cpu_pool,
+                                                                input_split_hint=input_hint,
+                                                                output_concat_hint=output_hint,
+                                                                preallocate_output=True)
+        for _ in range(2):
+            x1 = torch.rand(5, 2)
+            x2 = torch.rand(3, 5)
+            self.assertEqual(model(x1, x2), multi_stream_model(x1, x2))
+
+    @unittest.skipIf(not ipex.cpu.runtime.is_runtime_ext_enabled(), "Skip when IPEX Runtime extension is not enabled")
+    @runtime_thread_affinity_test_env
+    def test_multi_stream_module_auto_calibration(self):
+        import tempfile
+        model = SimpleNet()
+        model.eval()
+        x = torch.rand(4, 64, 3, 3)
+        y = model(x)
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            previous_cache_dir = os.environ.get("IPEX_CACHE_DIR")
+            os.environ["IPEX_CACHE_DIR"] = tmp_dir
+            try:
+                num_streams = ipex.cpu.runtime.tune_num_streams(model, x, cpu_pool=cpu_pool, candidates=[1, 2], iterations=2)
+                self.assertTrue(num_streams in [1, 2])
+                self.assertTrue(os.path.exists(os.path.join(tmp_dir, "multi_stream_auto.json")))
+                # The calibrated result is loaded from the cache.
+                multi_stream_model = ipex.cpu.runtime.MultiStreamModule(model, num_streams="AUTO", cpu_pool=cpu_pool, example_inputs=x)
+                self.assertEqual(multi_stream_model.get_stream_number(), num_streams)
+                self.assertEqual(y, multi_stream_model(x))
+            finally:
+                if previous_cache_dir is None:
+                    del os.environ["IPEX_CACHE_DIR"]
+                else:
+                    os.environ["IPEX_CACHE_DIR"] = previous_cache_dir
+
+    @unittest.skipIf(not ipex.cpu.runtime.is_runtime_ext_enabled(), "Skip when IPEX Runtime extension is not enabled")
+    @runtime_thread_affinity_test_env
+    def test_multi_stream_module_dynamic_schedule(self):
+        model = SimpleNet()
+        model.eval()
+        num_streams = 2
+        batch_size = 7
+        x = torch.rand(batch_size, 64, 3, 3)
+        # Calculate the reference result
+        y = model(x)
+
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1])
+        multi_stream_model = ipex.cpu.runtime.MultiStreamModule(model, num_streams=num_streams, cpu_pool=cpu_pool, schedule="dynamic")
+        multi_stream_model2 = ipex.cpu.runtime.MultiStreamModule(model, num_streams=num_streams, cpu_pool=cpu_pool, schedule="dynamic",
+                                                                chunk_size=3, concat_output=False)
+
+        with torch.no_grad():
+            self.assertEqual(y, multi_stream_model(x))
+            self.assertEqual(y, multi_stream_model.forward_async(x).get())
+            y_runtime2 = multi_stream_model2(x)
+        # The outputs of chunks are returned in order without concat.
+        self.assertEqual([y_chunk.size(0) for y_chunk in y_runtime2], [3, 3, 1])
+        self.assertEqual(y, torch.cat(y_runtime2))
+        # The worker threads exit after close.
+        threads = list(multi_stream_model.workers._threads)
+        multi_stream_model.close()
+        self.assertTrue(all(not thread.is_alive() for thread in threads))
+        self.assertIsNone(multi_stream_model.workers)
+
+    @unittest.skipIf(not ipex.cpu.runtime.is_runtime_ext_enabled(), "Skip when IPEX Runtime extension is not enabled")
+    @runtime_thread_affinity_test_env
+    def test_multi_stream_module_numa_local(self):
+        model = SimpleNet()
+        model.eval()
+        x = torch.rand(4, 64, 3, 3)
+        # Calculate the reference result
+        y = model(x)
+
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1])
+        multi_stream_model = ipex.cpu.runtime.MultiStreamModule(model, num_streams=2, cpu_pool=cpu_pool, numa_local=True)
+        self.assertEqual(y, multi_stream_model(x))
+
+        # localize replicates the module by default and keeps the input module untouched.
+        local_model = ipex.cpu.runtime.localize(model, cpu_pool)
+        self.assertNotEqual(local_model.conv.weight.data_ptr(), model.conv.weight.data_ptr())
+        self.assertEqual(local_model.conv.weight, model.conv.weight)
+        task = ipex.cpu.runtime.Task(model, cpu_pool, numa_local=True)
+        self.assertEqual(y, task(ipex.cpu.runtime.localize(x, cpu_pool)).get())
+
+    @unittest.skipIf(not ipex.cpu.runtime.is_runtime_ext_enabled(), "Skip when IPEX Runtime extension is not enabled")
+    @runtime_thread_affinity_test_env
+    def test_multi_stream_module_telemetry(self):
+        model = SimpleNet()
+        model.eval()
+        x = torch.rand(4, 64, 3, 3)
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1])
+        multi_stream_model = ipex.cpu.runtime.MultiStreamModule(model, num_streams=2, cpu_pool=cpu_pool)
+
+        # Telemetry is opt-in
+        multi_stream_model(x)
+        self.assertEqual([t["num_submissions"] for t in multi_stream_model.get_telemetry()], [0, 0])
+
+        # The idle time before telemetry is enabled is not counted.
+        time.sleep(0.5)
+        multi_stream_model.enable_telemetry()
+        for _ in range(3):
+            multi_stream_model(x)
+        telemetry = multi_stream_model.get_telemetry()
+        self.assertEqual(telemetry.__len__(), 2)
+        for stream_telemetry in telemetry:
+            self.assertEqual(stream_telemetry["num_submissions"], 3)
+            self.assertEqual(sum(stream_telemetry["exec_us"]["histogram"]), 3)
+            self.assertTrue(stream_telemetry["exec_us"]["total_us"] > 0)
+            self.assertTrue(0 <= stream_telemetry["utilization"] <= 1)
+            self.assertTrue(stream_telemetry["idle_us"] < 0.5e6)
+
+        multi_stream_model.reset_telemetry()
+        self.assertEqual([t["num_submissions"] for t in multi_stream_model.get_telemetry()], [0, 0])
+
 class TestModuleMultiStreamModuleHint(TestCase):
     # For the inputs format which can't be jit.trace
     def init_set_up(self):
@@ -424,6 +618,70 @@ class TestModuleMultiStreamModuleHint(TestCase):
         y_runtime_res = multi_stream_model(input)
         self.assertEqual(y_ref, y_runtime_res)
 
+class TestDynamicBatcher(TestCase):
+    @unittest.skipIf(not ipex.cpu.runtime.is_runtime_ext_enabled(), "Skip when IPEX Runtime extension is not enabled")
+    @runtime_thread_affinity_test_env
+    def test_dynamic_batcher_sync_api(self):
+        model = SimpleNet()
+        model.eval()
+        inputs = [torch.rand(1, 64, 3, 3) for _ in range(8)]
+        # Calculate the reference result
+        y = [model(x) for x in inputs]
+
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1])
+        with ipex.cpu.runtime.DynamicBatcher(model, num_streams=2, cpu_pool=cpu_pool, max_batch_size=4, max_wait_us=10000) as batcher:
+            futures = [batcher.submit(x) for x in inputs]
+            y_runtime = [future.result() for future in futures]
+            y_runtime_sync = batcher(inputs[0])
+        for i in range(inputs.__len__()):
+            self.assertEqual(y[i], y_runtime[i])
+        self.assertEqual(y[0], y_runtime_sync)
+
+    @unittest.skipIf(not ipex.cpu.runtime.is_runtime_ext_enabled(), "Skip when IPEX Runtime extension is not enabled")
+    @runtime_thread_affinity_test_env
+    def test_dynamic_batcher_asyncio_api(self):
+        import asyncio
+        model = TestInputOutputModule().eval()
+        inputs = [(torch.rand(bs, 1), torch.rand(bs, 3)) for bs in [1, 2, 3]]
+        y = [model(x1, False, x2) for x1, x2 in inputs]
+
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0, 1])
+        input_hint = ipex.cpu.runtime.MultiStreamModuleHint(0, None, 0)
+        output_hint = ipex.cpu.runtime.MultiStreamModuleHint((0, None, 0))
+        batcher = ipex.cpu.runtime.DynamicBatcher(model,
+                                                  num_streams=2,
+                                                  cpu_pool=cpu_pool,
+                                                  max_batch_size=4,
+                                                  input_split_hint=input_hint,
+                                                  output_concat_hint=output_hint)
+
+        async def run():
+            return await asyncio.gather(*[batcher.async_call(x1, False, x2) for x1, x2 in inputs])
+        y_runtime = asyncio.run(run())
+        batcher.close()
+        for i in range(inputs.__len__()):
+            self.assertEqual(y[i], y_runtime[i])
+
+    @unittest.skipIf(not ipex.cpu.runtime.is_runtime_ext_enabled(), "Skip when IPEX Runtime extension is not enabled")
+    @runtime_thread_affinity_test_env
+    def test_dynamic_batcher_system_exit(self):
+        class ExitNet(torch.nn.Module):
+            def forward(self, x):
+                raise SystemExit(1)
+
+        cpu_pool = ipex.cpu.runtime.CPUPool(core_ids=[0])
+        batcher = ipex.cpu.runtime.DynamicBatcher(ExitNet(), num_streams=1, cpu_pool=cpu_pool, max_batch_size=4)
+        # The error is set on the future instead of hanging the request.
+        future = batcher.submit(torch.rand(1, 4))
+        with self.assertRaises(SystemExit):
+            future.result(timeout=60)
+        batcher.worker.join(timeout=60)
+        self.assertFalse(batcher.worker.is_alive())
+        # The batcher is stopped, no request is queued without a batching thread.
+        with self.assertRaises(RuntimeError):
+            batcher.submit(torch.rand(1, 4))
+        batcher.close()
+
 def is_numactl_available():
     numactl_available = False
     cmd = ["numactl", "-C", "0", "-m", "0", "ls"]